@@ -0,0 +1,122 @@
+import threading
+import numpy as np
+
+
+class AudioRingBuffer:
+    """Fixed-capacity float32 ring buffer shared by the audio callback and the processor.
+
+    Every sample is stored twice (at ``i`` and ``i + capacity``) so that any
+    window of up to ``capacity`` samples is contiguous in memory and can be
+    handed out as a zero-copy view. Writing never allocates.
+
+    With ``channels`` > 1 each sample is a frame of interleaved channels and
+    views have shape ``(n, channels)``; counts are always in frames.
+
+    Views returned by ``peek``/``read``/``history`` stay valid until another
+    ``capacity`` samples have been written; copy them if they must live longer.
+    """
+
+    def __init__(self, capacity, channels=1):
+        self.capacity = int(capacity)
+        self.channels = int(channels)
+        shape = (self.capacity * 2, self.channels) if self.channels > 1 else self.capacity * 2
+        self._data = np.zeros(shape, dtype=np.float32)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+        # Absolute sample counters (monotonic, never wrap)
+        self.total_written = 0
+        self.total_consumed = 0
+        self.overruns = 0  # Samples dropped because the reader fell behind
+
+    def write(self, samples):
+        """Append samples (any shape, flattened into frames); drops the oldest unread data on overrun"""
+        samples = np.asarray(samples)
+        samples = samples.reshape(-1, self.channels) if self.channels > 1 else samples.reshape(-1)
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self.capacity:
+            # Only the newest samples can be kept
+            skipped = n - self.capacity
+            samples = samples[skipped:]
+            n = self.capacity
+        else:
+            skipped = 0
+
+        with self._lock:
+            self.total_written += skipped
+            start = self.total_written % self.capacity
+            first = min(n, self.capacity - start)
+            # Primary copy
+            self._data[start:start + first] = samples[:first]
+            self._data[:n - first] = samples[first:]
+            # Mirror copy
+            self._data[self.capacity + start:self.capacity + start + first] = samples[:first]
+            self._data[self.capacity:self.capacity + n - first] = samples[first:]
+
+            self.total_written += n
+            unread = self.total_written - self.total_consumed
+            if unread > self.capacity:
+                self.overruns += unread - self.capacity
+                self.total_consumed = self.total_written - self.capacity
+            self._not_empty.notify_all()
+
+    def available(self):
+        """Number of samples written but not yet consumed"""
+        with self._lock:
+            return self.total_written - self.total_consumed
+
+    def wait(self, n, timeout=None):
+        """Block until at least n unread samples are available; returns False on timeout"""
+        n = min(int(n), self.capacity)
+        with self._not_empty:
+            return self._not_empty.wait_for(
+                lambda: self.total_written - self.total_consumed >= n, timeout)
+
+    def _view(self, start_abs, n):
+        start = start_abs % self.capacity
+        return self._data[start:start + n]
+
+    def peek(self, n=None):
+        """Return a zero-copy view of the oldest n unread samples without consuming them"""
+        with self._lock:
+            unread = self.total_written - self.total_consumed
+            n = unread if n is None else min(int(n), unread)
+            return self._view(self.total_consumed, n)
+
+    def consume(self, n):
+        """Mark n unread samples as consumed; returns the number actually consumed"""
+        with self._lock:
+            n = max(0, min(int(n), self.total_written - self.total_consumed))
+            self.total_consumed += n
+            return n
+
+    def read(self, n=None):
+        """Peek and consume in one step; returns a zero-copy view"""
+        with self._lock:
+            unread = self.total_written - self.total_consumed
+            n = unread if n is None else min(int(n), unread)
+            view = self._view(self.total_consumed, n)
+            self.total_consumed += n
+            return view
+
+    def read_indexed(self, n=None):
+        """Like read, but returns (absolute index of the first sample, view)"""
+        with self._lock:
+            unread = self.total_written - self.total_consumed
+            n = unread if n is None else min(int(n), unread)
+            start = self.total_consumed
+            self.total_consumed += n
+            return start, self._view(start, n)
+
+    def history(self, n):
+        """Return a view of the last n written samples, consumed or not (bounded by capacity)"""
+        with self._lock:
+            n = min(int(n), self.capacity, self.total_written)
+            return self._view(self.total_written - n, n)
+
+    def clear(self):
+        """Discard all unread samples"""
+        with self._lock:
+            self.total_consumed = self.total_written
@@ -0,0 +1,199 @@
+import collections
+import json
+import os
+import time
+
+import numpy as np
+
+import profiles
+
+SAMPLE_RATE = 16000
+
+# What every backend returns: times in seconds from the start of the audio,
+# confidence in 0..1 (None if the engine does not estimate one), and words
+# only when word timestamps were asked for and are supported.
+Segment = collections.namedtuple("Segment", "start end text confidence words", defaults=(None, None))
+Word = collections.namedtuple("Word", "start end word probability")
+
+
+class ASRBackend:
+    """Speech recognizer behind the pipeline: float32 16 kHz mono audio in, Segments out
+
+    ``transcribe`` accepts faster-whisper's decoding options (beam_size,
+    best_of, temperature, initial_prompt, ...); backends ignore the ones
+    they have no equivalent for. ``word_timestamps`` tells whether words can
+    be returned (needed for streaming mode) and ``tunable`` whether the
+    decoding options change cost, i.e. whether adaptive quality has an effect.
+    """
+
+    name = None
+    word_timestamps = False
+    tunable = False
+
+    @classmethod
+    def from_profile(cls, profile):
+        return cls(profile)
+
+    def transcribe(self, audio, language="en", word_timestamps=False, **options):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _to_pcm16(audio):
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+
+
+class FasterWhisperBackend(ASRBackend):
+    """Whisper on CTranslate2 (the default): the profile picks model size, device and quantization"""
+
+    name = "faster-whisper"
+    word_timestamps = True
+    tunable = True
+
+    def __init__(self, profile=None, model=None):
+        # The WhisperModel itself, e.g. for BatchedInferencePipeline
+        self.model = model if model is not None else profiles.load_model(profile)
+
+    def transcribe(self, audio, language="en", word_timestamps=False, **options):
+        options.setdefault("vad_filter", False)  # Silence is already dropped by our own VAD
+        segments, info = self.model.transcribe(audio, language=language, word_timestamps=word_timestamps,
+                                               **options)
+        result = []
+        for segment in segments:  # Decoding happens while iterating
+            words = None
+            if word_timestamps:
+                words = [Word(w.start, w.end, w.word, w.probability) for w in (segment.words or [])]
+            confidence = float(np.exp(segment.avg_logprob)) * (1.0 - segment.no_speech_prob)
+            result.append(Segment(segment.start, segment.end, segment.text, confidence, words))
+        return result
+
+
+class WhisperCppBackend(ASRBackend):
+    """whisper.cpp through pywhispercpp: GGML Whisper models, greedy decoding, small footprint on CPU
+
+    ``--model`` is a whisper.cpp model name (tiny.en, base.en, small, ...; downloaded
+    on first use) or the path of a ggml .bin file.
+    """
+
+    name = "whisper.cpp"
+
+    def __init__(self, profile):
+        try:
+            from pywhispercpp.model import Model
+        except ImportError:
+            raise RuntimeError("The whisper.cpp backend needs pywhispercpp (pip install pywhispercpp)")
+        threads = profile.get("cpu_threads") or profiles.default_cpu_threads()
+        self.model = Model(profile["model_size"], n_threads=threads, print_progress=False, print_realtime=False)
+
+    def transcribe(self, audio, language="en", word_timestamps=False, **options):
+        # initial_prompt carries the streaming context, the rest are Whisper beam settings
+        params = dict(language=language, no_context=True)
+        if options.get("initial_prompt"):
+            params["initial_prompt"] = options["initial_prompt"]
+        segments = self.model.transcribe(np.ascontiguousarray(audio, dtype=np.float32), **params)
+        # whisper.cpp times are in units of 10 ms
+        return [Segment(segment.t0 / 100, segment.t1 / 100, " " + segment.text.strip(),
+                        getattr(segment, "probability", None))
+                for segment in segments if segment.text.strip()]
+
+
+class VoskBackend(ASRBackend):
+    """Vosk (Kaldi) recognizer: a fraction of Whisper's CPU cost, word timings and confidences
+
+    ``--model`` is the path of an unpacked Vosk model or a Vosk model name
+    (vosk-model-small-en-us-0.15, ...); anything else uses Vosk's default
+    small English model. Vosk models are language-specific.
+    """
+
+    name = "vosk"
+    word_timestamps = True
+    chunk_size = SAMPLE_RATE // 4
+
+    def __init__(self, profile):
+        try:
+            from vosk import Model, KaldiRecognizer, SetLogLevel
+        except ImportError:
+            raise RuntimeError("The vosk backend needs vosk (pip install vosk)")
+        SetLogLevel(-1)
+        name = str(profile["model_size"])
+        if os.path.isdir(name):
+            self.model = Model(name)
+        elif name.startswith("vosk-model"):
+            self.model = Model(model_name=name)
+        else:
+            self.model = Model(lang="en-us")
+        self.KaldiRecognizer = KaldiRecognizer
+
+    def transcribe(self, audio, language="en", word_timestamps=False, **options):
+        recognizer = self.KaldiRecognizer(self.model, SAMPLE_RATE)
+        recognizer.SetWords(True)
+        pcm = _to_pcm16(audio)
+        results = []
+        # Vosk finalizes a result at each endpoint it detects; collect them all
+        for offset in range(0, len(pcm), self.chunk_size):
+            if recognizer.AcceptWaveform(pcm[offset:offset + self.chunk_size].tobytes()):
+                results.append(json.loads(recognizer.Result()))
+        results.append(json.loads(recognizer.FinalResult()))
+
+        segments = []
+        for result in results:
+            words = [Word(w["start"], w["end"], " " + w["word"], w["conf"]) for w in result.get("result", [])]
+            if not words:
+                continue
+            segments.append(Segment(words[0].start, words[-1].end, " " + result.get("text", ""),
+                                    float(np.mean([w.probability for w in words])),
+                                    words if word_timestamps else None))
+        return segments
+
+
+class FakeBackend(ASRBackend):
+    """Deterministic stand-in with a fixed cost of ``rtf`` x the audio duration
+
+    Emits a word every ``word_interval`` seconds, so streaming mode sees
+    stable hypotheses and runs are reproducible. For tests and for measuring
+    pipeline overhead apart from model cost.
+    """
+
+    name = "fake"
+    word_timestamps = True
+
+    VOCABULARY = ("the quick brown fox jumps over a lazy dog while seven wise "
+                  "owls watch the river flow past quiet hills").split()
+
+    def __init__(self, rtf=0.0, word_interval=0.4, sample_rate=SAMPLE_RATE):
+        self.rtf = rtf
+        self.word_interval = word_interval
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_profile(cls, profile):
+        return cls()
+
+    def transcribe(self, audio, language="en", word_timestamps=False, **options):
+        duration = len(audio) / self.sample_rate
+        if self.rtf:
+            time.sleep(duration * self.rtf)
+        words = []
+        start = 0.0
+        while start + self.word_interval <= duration:
+            text = self.VOCABULARY[len(words) % len(self.VOCABULARY)]
+            words.append(Word(start, start + self.word_interval * 0.8, " " + text, 1.0))
+            start += self.word_interval
+        if not words:
+            return []
+        return [Segment(0.0, words[-1].end, "".join(w.word for w in words), 1.0,
+                        words if word_timestamps else None)]
+
+
+BACKENDS = {backend.name: backend for backend in (FasterWhisperBackend, WhisperCppBackend, VoskBackend, FakeBackend)}
+
+
+def create_backend(name, profile):
+    """Instantiate a backend by name for a hardware profile"""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown backend '{name}' (choose from: {', '.join(BACKENDS)})")
+    return backend.from_profile(profile)
@@ -0,0 +1,329 @@
+"""Bulk transcription of recorded files (meetings, voice notes) to text, SRT and JSON.
+
+Long recordings are decoded with PyAV and processed window by window, so a
+file is never loaded into memory whole. Each window is cut at its quietest
+point near the end, so no word is split. Windows go through faster-whisper's
+BatchedInferencePipeline, which transcribes several speech segments per
+forward pass. Files are spread over a pool of worker processes, each with
+its own model. Outputs are written as segments arrive, to ``.part`` files
+that are renamed once the file is done. Files whose outputs are newer than
+the audio are skipped, so an interrupted run can simply be started again.
+"""
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+import profiles
+from vad import VoiceActivityDetector
+
+SAMPLE_RATE = 16000
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".mp4", ".mkv",
+                    ".aac", ".wma"}
+FORMATS = ("txt", "srt", "json")
+
+
+# --- Input ---
+
+def find_audio_files(paths):
+    """Expand files and directories (recursively) into (file, base directory) pairs"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                        found.append((os.path.join(root, name), path))
+        elif os.path.isfile(path):
+            found.append((path, os.path.dirname(path)))
+        else:
+            print(f"Skipping {path}: not found")
+    return sorted(found)
+
+
+def decode_stream(path, sample_rate=SAMPLE_RATE):
+    """Yield float32 mono blocks of a file as PyAV decodes it"""
+    import av
+
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+    with av.open(path, metadata_errors="ignore") as container:
+        stream = container.streams.audio[0]
+        # A trailing None flushes the resampler
+        for frame in itertools.chain(container.decode(stream), [None]):
+            for resampled in resampler.resample(frame):
+                yield resampled.to_ndarray().reshape(-1).astype(np.float32) / 32768.0
+
+
+def windows(blocks, window=240.0, search=5.0, sample_rate=SAMPLE_RATE):
+    """Group decoded blocks into (offset seconds, audio) windows of about ``window`` seconds
+
+    Each window ends at the quietest 30 ms frame of its last ``search``
+    seconds; the rest is carried over into the next window.
+    """
+    vad = VoiceActivityDetector(sample_rate)
+    window_samples = int(window * sample_rate)
+    search_samples = int(min(search, window / 2) * sample_rate)
+    pending = []
+    pending_length = 0
+    offset = 0
+    for block in blocks:
+        pending.append(block)
+        pending_length += len(block)
+        if pending_length < window_samples:
+            continue
+        audio = np.concatenate(pending)
+        cut = window_samples - search_samples + quietest_frame(vad, audio[window_samples - search_samples:
+                                                                         window_samples])
+        yield offset / sample_rate, audio[:cut]
+        offset += cut
+        pending = [audio[cut:]]
+        pending_length = len(pending[0])
+    if pending_length:
+        yield offset / sample_rate, np.concatenate(pending)
+
+
+def quietest_frame(vad, audio):
+    """Sample index of the start of the lowest-energy frame in audio"""
+    n_frames = len(audio) // vad.frame_size
+    if not n_frames:
+        return len(audio)
+    frames = audio[:n_frames * vad.frame_size].reshape(n_frames, vad.frame_size)
+    return int(np.argmin(vad.frame_levels(frames))) * vad.frame_size
+
+
+# --- Output ---
+
+def format_timestamp(seconds, separator=","):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+class SegmentWriter:
+    """Writes segments to ``path.part`` as they arrive; renamed to ``path`` on success"""
+
+    def __init__(self, path):
+        self.path = path
+        self.part_path = path + ".part"
+        self.file = open(self.part_path, "w", encoding="utf-8")
+        self.count = 0
+
+    def write(self, segment):
+        self._write(segment)
+        self.count += 1
+        self.file.flush()
+
+    def _write(self, segment):
+        raise NotImplementedError
+
+    def finish(self):
+        self.file.close()
+        os.replace(self.part_path, self.path)
+
+    def abort(self):
+        self.file.close()
+
+
+class TextWriter(SegmentWriter):
+    def _write(self, segment):
+        self.file.write(segment["text"].strip() + "\n")
+
+
+class SrtWriter(SegmentWriter):
+    def _write(self, segment):
+        self.file.write(f"{self.count + 1}\n{format_timestamp(segment['start'])} --> "
+                        f"{format_timestamp(segment['end'])}\n{segment['text'].strip()}\n\n")
+
+
+class JsonWriter(SegmentWriter):
+    """A JSON array of segments, streamed one element at a time"""
+
+    def __init__(self, path, metadata):
+        super().__init__(path)
+        self.file.write('{"metadata": ' + json.dumps(metadata) + ', "segments": [\n')
+
+    def _write(self, segment):
+        self.file.write((",\n" if self.count else "") + json.dumps(segment))
+
+    def finish(self):
+        self.file.write("\n]}\n")
+        super().finish()
+
+
+WRITERS = {"txt": TextWriter, "srt": SrtWriter, "json": JsonWriter}
+
+
+def output_paths(path, base, output_dir, formats):
+    """Output file per format; the layout under a given directory is kept in output_dir"""
+    stem = os.path.splitext(path)[0]
+    if output_dir:
+        stem = os.path.join(output_dir, os.path.relpath(stem, base or "."))
+    return {fmt: f"{stem}.{fmt}" for fmt in formats}
+
+
+def is_up_to_date(path, outputs):
+    """True if every output exists and is newer than the audio file"""
+    source_time = os.path.getmtime(path)
+    return all(os.path.exists(out) and os.path.getmtime(out) >= source_time for out in outputs.values())
+
+
+# --- Worker processes ---
+
+_pipeline = None
+_batched = False
+_settings = None
+
+
+def init_worker(profile, settings):
+    """Load one model per worker process"""
+    global _pipeline, _batched, _settings
+    model = profiles.load_model(profile)
+    try:
+        from faster_whisper import BatchedInferencePipeline
+        _pipeline = BatchedInferencePipeline(model=model)
+        _batched = True
+    except ImportError:
+        # faster-whisper < 1.1: no batching, decode segments one by one
+        print("BatchedInferencePipeline not available (faster-whisper < 1.1); decoding sequentially")
+        _pipeline = model
+    _settings = dict(settings, beam_size=profile["beam_size"])
+
+
+def transcribe_window(audio):
+    options = dict(language=_settings["language"], beam_size=_settings["beam_size"], vad_filter=True)
+    if _batched:
+        options["batch_size"] = _settings["batch_size"]
+    segments, info = _pipeline.transcribe(audio, **options)
+    return segments
+
+
+def transcribe_file(path, outputs):
+    """Transcribe one file into every output; returns (path, audio seconds, segments, elapsed)"""
+    start_time = time.time()
+    for out in outputs.values():
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    metadata = {"source": os.path.abspath(path), "language": _settings["language"],
+                "model": _settings["model"]}
+    writers = [JsonWriter(out, metadata) if fmt == "json" else WRITERS[fmt](out)
+               for fmt, out in outputs.items()]
+    duration = 0.0
+    count = 0
+    try:
+        for offset, audio in windows(decode_stream(path), window=_settings["window"]):
+            duration = offset + len(audio) / SAMPLE_RATE
+            for segment in transcribe_window(audio):
+                record = {"start": round(offset + segment.start, 3), "end": round(offset + segment.end, 3),
+                          "text": segment.text.strip()}
+                if not record["text"]:
+                    continue
+                for writer in writers:
+                    writer.write(record)
+                count += 1
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    for writer in writers:
+        writer.finish()
+    return path, duration, count, time.time() - start_time
+
+
+# --- CLI ---
+
+def default_jobs(profile, threads_per_job=4):
+    """One process per GPU, or one per threads_per_job CPU cores"""
+    if profile["device"] == "cuda":
+        return 1
+    return max(1, (os.cpu_count() or 1) // threads_per_job)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="live_speech_to_text.py transcribe",
+                                     description="Transcribe audio files or directories to text/SRT/JSON")
+    parser.add_argument("paths", nargs="+", help="Audio files and/or directories (searched recursively)")
+    parser.add_argument("--output-dir", default=None,
+                        help="Where to write the outputs (default: next to each audio file)")
+    parser.add_argument("--formats", default=",".join(FORMATS),
+                        help=f"Comma-separated output formats out of {', '.join(FORMATS)} (default: all)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Worker processes (default: 1 on a GPU, one per 4 CPU cores otherwise)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Speech segments decoded per batch (default: 8)")
+    parser.add_argument("--window", type=float, default=240.0,
+                        help="Seconds of audio decoded and held in memory at a time (default: 240)")
+    parser.add_argument("--language", default="en", help="Spoken language, or 'auto' to detect it (default: en)")
+    parser.add_argument("--force", action="store_true", help="Transcribe again even if outputs are up to date")
+    parser.add_argument("--profile", default=None, help="Hardware profile: " + ", ".join(profiles.PROFILES))
+    parser.add_argument("--model", default=None, help="Override the profile's model size")
+    parser.add_argument("--device", default=None, choices=["cpu", "cuda", "auto"],
+                        help="Override the profile's device")
+    parser.add_argument("--compute-type", default=None, help="Override the profile's compute type")
+    parser.add_argument("--beam-size", type=int, default=None, help="Override the profile's beam size")
+    args = parser.parse_args(argv)
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+
+    profile = profiles.resolve_profile(args.profile, model_size=args.model, device=args.device,
+                                       compute_type=args.compute_type, beam_size=args.beam_size)
+    jobs = args.jobs or default_jobs(profile)
+    if profile["device"] != "cuda":
+        # Split the cores between the workers instead of oversubscribing them
+        profile["cpu_threads"] = max(1, (os.cpu_count() or 1) // jobs)
+
+    work = []
+    for path, base in find_audio_files(args.paths):
+        outputs = output_paths(path, base, args.output_dir, formats)
+        if not args.force and is_up_to_date(path, outputs):
+            print(f"Up to date: {path}")
+            continue
+        work.append((path, outputs))
+    if not work:
+        print("Nothing to transcribe.")
+        return 0
+
+    settings = {"language": None if args.language == "auto" else args.language,
+                "batch_size": args.batch_size, "window": args.window, "model": profile["model_size"]}
+    print(f"Transcribing {len(work)} file(s) with {jobs} worker(s), model {profile['model_size']} "
+          f"on {profile['device']} ({profile['compute_type']})")
+
+    failures = 0
+    start_time = time.time()
+    total_audio = 0.0
+    # spawn: CUDA and CTranslate2 thread pools do not survive fork
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=init_worker,
+                                                initargs=(profile, settings)) as executor:
+        futures = {executor.submit(transcribe_file, path, outputs): path for path, outputs in work}
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    path, duration, count, elapsed = future.result()
+                except Exception as e:
+                    failures += 1
+                    print(f"Failed: {futures[future]}: {e}")
+                    continue
+                total_audio += duration
+                print(f"Done: {path} ({duration / 60:.1f} min of audio, {count} segments, "
+                      f"{elapsed:.1f}s, RTF {elapsed / duration if duration else 0:.2f})")
+        except KeyboardInterrupt:
+            print("\nInterrupted; finished files are kept and the rest will be picked up next time.")
+            executor.shutdown(wait=False, cancel_futures=True)
+            return 130
+
+    elapsed = time.time() - start_time
+    print(f"Transcribed {total_audio / 60:.1f} min of audio in {elapsed:.1f}s"
+          + (f" ({failures} failed)" if failures else ""))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+"""Offline replay benchmark for the dictation pipeline.
+
+Feeds WAV/PCM files through LiveSpeechToText's real processing path (ring
+buffer -> VAD segmentation -> ASR -> post-processing -> output) at real-time
+pace or faster, without a microphone, hotkeys or a tray icon, and reports:
+
+- per-utterance latency from the end of speech to the text being typed
+- real-time factor of the model (decode time / audio duration)
+- CPU and memory use of the process
+- word error rate against reference transcripts (``name.txt`` next to ``name.wav``)
+
+``--backend`` picks the speech recognizer (see backends.py); ``--stub`` swaps
+it for a deterministic fake with a fixed real-time factor, so pipeline
+overhead can be measured apart from model cost.
+Results can be written as JSON (``--json``) and compared with an earlier run
+(``--compare``), e.g. across commits.
+"""
+import argparse
+import bisect
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+import wave
+import numpy as np
+
+import profiles
+from backends import ASRBackend, BACKENDS, FakeBackend, create_backend
+from output import OutputBackend
+from pipeline import OVERFLOW_POLICIES
+
+SAMPLE_RATE = 16000
+
+# Metrics compared by --compare (lower is better for all of them)
+COMPARED_METRICS = ("latency_p50", "latency_p95", "latency_max", "rtf", "cpu_utilization", "max_rss_mb", "wer")
+
+
+# --- Audio and references ---
+
+def load_audio(path, pcm_rate=SAMPLE_RATE):
+    """Load a file as float32 mono at SAMPLE_RATE
+
+    WAV and raw 16-bit PCM (.pcm/.raw at pcm_rate) are read directly, as are
+    session directories written with --record; anything else goes through
+    faster-whisper's decoder.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if os.path.isdir(path):
+        # A session directory written with --record
+        from recorder import RecordedSession
+        return RecordedSession(path).read()
+    if extension == ".wav":
+        with wave.open(path, "rb") as wf:
+            channels, width, rate = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+            data = wf.readframes(wf.getnframes())
+        if width == 1:
+            audio = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif width == 2:
+            audio = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+        elif width == 4:
+            audio = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648
+        else:
+            raise ValueError(f"{path}: unsupported sample width {width}")
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    elif extension in (".pcm", ".raw"):
+        audio = np.fromfile(path, dtype="<i2").astype(np.float32) / 32768
+        rate = pcm_rate
+    else:
+        from faster_whisper import decode_audio
+        return decode_audio(path, sampling_rate=SAMPLE_RATE).astype(np.float32)
+    return resample(audio, rate, SAMPLE_RATE)
+
+
+def resample(audio, rate, target_rate):
+    """Linear-interpolation resampling (good enough for speech recognition tests)"""
+    if rate == target_rate:
+        return audio.astype(np.float32)
+    n = int(round(len(audio) * target_rate / rate))
+    positions = np.arange(n) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def load_reference(path):
+    """Reference transcript next to an audio file (same name, .txt), or None"""
+    reference = os.path.splitext(path)[0] + ".txt"
+    if not os.path.exists(reference):
+        return None
+    with open(reference, encoding="utf-8") as f:
+        return f.read()
+
+
+_NON_WORD = re.compile(r"[^\w']+")
+
+
+def normalize_words(text):
+    """Lower-case words without punctuation, for WER"""
+    return [w for w in _NON_WORD.sub(" ", text.lower()).split() if w]
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance (substitutions + deletions + insertions)"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1]
+
+
+# --- Models ---
+
+class TimedModel(ASRBackend):
+    """Wraps a backend and accumulates decode time and decoded audio duration"""
+
+    def __init__(self, model, sample_rate=SAMPLE_RATE):
+        self.model = model
+        self.name = model.name
+        self.word_timestamps = model.word_timestamps
+        self.tunable = model.tunable
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.decode_seconds = 0.0
+            self.audio_seconds = 0.0
+            self.calls = 0
+
+    def transcribe(self, audio, **kwargs):
+        start = time.perf_counter()
+        segments = self.model.transcribe(audio, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.decode_seconds += elapsed
+            self.audio_seconds += len(audio) / self.sample_rate
+            self.calls += 1
+        return segments
+
+
+class NullOutput(OutputBackend):
+    """Collects the typed text instead of injecting it"""
+
+    name = "null"
+
+    def __init__(self):
+        self.texts = []
+        self.text = ""  # What is on screen after any two-pass revisions
+
+    def emit(self, text):
+        self.texts.append(text)
+        self.text += text
+
+    def backspace(self, count):
+        self.text = self.text[:max(0, len(self.text) - count)]
+
+
+# --- Replay ---
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    result = {f"latency_p{p}": float(np.percentile(values, p)) if values else None for p in points}
+    result["latency_max"] = float(max(values)) if values else None
+    result["latency_mean"] = float(np.mean(values)) if values else None
+    return result
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def wait_idle(engine, timeout=600.0, poll=0.05):
+    """Wait until all captured audio is segmented and every stage queue has drained"""
+    queues = (engine.speech_queue, engine.refine_queue, engine.transcript_queue, engine.output_queue)
+    deadline = time.time() + timeout
+    quiet_polls = 0
+    while time.time() < deadline:
+        idle = (engine.audio_buffer.available() < engine.vad.frame_size
+                and all(q.join(0) for q in queues))
+        # Two idle polls in a row: the segmentation stage may sit between reading and queueing
+        quiet_polls = quiet_polls + 1 if idle else 0
+        if quiet_polls >= 2:
+            return True
+        time.sleep(poll)
+    return False
+
+
+def replay(engine, audio, speed=1.0, block_size=512, tail_silence=1.5):
+    """Feed audio through engine.audio_callback in capture-sized blocks
+
+    speed is a multiple of real time; 0 feeds as fast as the pipeline accepts.
+    Returns a feed log of (samples written, wall time) to date end-of-speech.
+    """
+    audio = np.concatenate([audio, np.zeros(int(tail_silence * SAMPLE_RATE), dtype=np.float32)])
+    feed_log = []
+    start = time.perf_counter()
+    capacity = engine.audio_buffer.capacity
+    for offset in range(0, len(audio), block_size):
+        block = audio[offset:offset + block_size]
+        if speed > 0:
+            due = start + offset / SAMPLE_RATE / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            # Never outrun the segmentation stage by more than half the ring buffer
+            while engine.audio_buffer.available() > capacity // 2:
+                time.sleep(0.001)
+        engine.audio_callback(block[:, np.newaxis], len(block), None, None)
+        feed_log.append((engine.audio_buffer.total_written, time.time()))
+    return feed_log
+
+
+def captured_at(feed_log, sample):
+    """Wall time at which the given absolute sample had been fed"""
+    index = bisect.bisect_left(feed_log, (sample, 0.0))
+    return feed_log[min(index, len(feed_log) - 1)][1]
+
+
+def run_file(path, model, args, profile, draft_model=None):
+    """Replay one file through a fresh engine; returns its per-file results"""
+    from live_speech_to_text import LiveSpeechToText
+
+    audio = load_audio(path, args.pcm_rate)
+    output = NullOutput()
+    engine = LiveSpeechToText(use_grammar_correction=args.grammar, streaming=args.streaming,
+                              streaming_step=args.streaming_step, vad_margin_db=args.vad_margin,
+                              min_silence=args.min_silence, profile=profile, queue_size=args.queue_size,
+                              overflow_policy=args.overflow_policy, grammar_budget=args.grammar_budget,
+                              output=output, hotkeys=False, model=model, draft_model=draft_model,
+                              noise_suppression=args.denoise)
+    typed = []
+    engine.on_typed = lambda transcripts, typed_at: typed.extend((t, typed_at) for t in transcripts)
+
+    # Model load and warm-up are not part of the measurement
+    while not engine.model_ready.wait(0.1):
+        if engine.model_error and not engine.model_loading:
+            engine.shutdown()
+            sys.exit(f"{path}: could not load the model: {engine.model_error}")
+    if args.grammar:
+        while engine.use_grammar_correction and not engine.grammar.ready:
+            time.sleep(0.1)
+    model.reset()
+
+    engine.start_pipeline(capture=False)
+    wall_start = time.perf_counter()
+    feed_log = replay(engine, audio, args.speed, args.block_size)
+    if not wait_idle(engine):
+        print(f"{path}: pipeline did not go idle; results are partial", file=sys.stderr)
+    wall = time.perf_counter() - wall_start
+    engine.shutdown()
+
+    # Refinements replace text that was already typed; latency counts the first appearance
+    typed = [(t, typed_at) for t, typed_at in typed if t.revision != "refined"]
+    latencies = [typed_at - captured_at(feed_log, t.end_sample) for t, typed_at in typed]
+    text = " ".join(output.text.split())
+    result = {
+        "file": path,
+        "audio_seconds": len(audio) / SAMPLE_RATE,
+        "wall_seconds": wall,
+        "utterances": len(typed),
+        "latencies": latencies,
+        "decode_seconds": model.decode_seconds,
+        "decoded_audio_seconds": model.audio_seconds,
+        "decode_calls": model.calls,
+        "dropped_frames": engine.segmenter.dropped_frames,
+        "queue_dropped": sum(q.dropped for q in (engine.speech_queue, engine.refine_queue,
+                                                  engine.transcript_queue, engine.output_queue)),
+        "revisions": engine.revisions.get(),
+        "queue_merged": sum(q.merged for q in (engine.speech_queue, engine.transcript_queue,
+                                                engine.output_queue)),
+        "text": text,
+    }
+    report = engine.noise_suppression_report()
+    if report:
+        result["noise_suppression"] = report
+
+    reference = load_reference(path)
+    if reference is not None:
+        reference_words = normalize_words(reference)
+        result["reference_words"] = len(reference_words)
+        result["word_errors"] = word_errors(reference_words, normalize_words(text))
+    return result
+
+
+def summarize(files, cpu_seconds, wall_seconds):
+    latencies = [latency for f in files for latency in f["latencies"]]
+    decode = sum(f["decode_seconds"] for f in files)
+    decoded_audio = sum(f["decoded_audio_seconds"] for f in files)
+    reference_words = sum(f.get("reference_words", 0) for f in files)
+    summary = {
+        "files": len(files),
+        "utterances": len(latencies),
+        "audio_seconds": sum(f["audio_seconds"] for f in files),
+        "wall_seconds": wall_seconds,
+        "rtf": decode / decoded_audio if decoded_audio else None,
+        "cpu_seconds": cpu_seconds,
+        "cpu_utilization": cpu_seconds / wall_seconds if wall_seconds else None,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_mb": current_rss_mb(),
+        "wer": (sum(f.get("word_errors", 0) for f in files) / reference_words) if reference_words else None,
+    }
+    reports = [f["noise_suppression"] for f in files if "noise_suppression" in f]
+    if reports:
+        # Decodes (utterances) and decoded seconds avoided compared with VAD on the raw signal
+        summary["denoise_saved_decodes"] = sum(r["raw_utterances"] - r["utterances"] for r in reports)
+        summary["denoise_saved_seconds"] = sum(r["raw_speech_seconds"] - r["speech_seconds"] for r in reports)
+    summary.update(percentiles(latencies))
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def print_summary(summary):
+    print("\n=== Benchmark results ===")
+    for key in ("files", "utterances", "audio_seconds", "wall_seconds", "latency_p50", "latency_p90",
+                "latency_p95", "latency_p99", "latency_max", "rtf", "cpu_utilization", "max_rss_mb",
+                "rss_mb", "wer", "denoise_saved_decodes", "denoise_saved_seconds"):
+        if key in summary:
+            print(f"{key:18} {format_value(summary[key])}")
+
+
+def compare(summary, baseline, tolerance):
+    """Print the change against a baseline run; returns the metrics that regressed beyond tolerance"""
+    print(f"\n=== Compared with {baseline.get('commit') or 'baseline'} ===")
+    regressions = []
+    for key in COMPARED_METRICS:
+        old, new = baseline["summary"].get(key), summary.get(key)
+        if old is None or new is None:
+            print(f"{key:18} {format_value(old):>10} -> {format_value(new):>10}")
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = change > tolerance
+        if worse:
+            regressions.append(key)
+        print(f"{key:18} {format_value(old):>10} -> {format_value(new):>10} "
+              f"({change:+.1%}){'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay audio files through the dictation pipeline")
+    parser.add_argument("files", nargs="+", help="WAV, raw 16-bit PCM (.pcm/.raw) or other audio files")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Feed speed as a multiple of real time; 0 = as fast as possible (default: 1)")
+    parser.add_argument("--backend", default="faster-whisper", choices=list(BACKENDS),
+                        help="Speech recognizer to benchmark (default: faster-whisper)")
+    parser.add_argument("--stub", action="store_true",
+                        help="Use the deterministic fake backend (pipeline overhead only)")
+    parser.add_argument("--stub-rtf", type=float, default=0.0,
+                        help="Simulated real-time factor of the stub model (default: 0)")
+    parser.add_argument("--profile", default=None, help="Hardware profile: " + ", ".join(profiles.PROFILES))
+    parser.add_argument("--model", default=None, help="Override the profile's model size")
+    parser.add_argument("--beam-size", type=int, default=None, help="Override the profile's beam size")
+    parser.add_argument("--draft-model", default=None,
+                        help="Benchmark two-pass mode with this draft model size (a second stub with --stub)")
+    parser.add_argument("--streaming", action="store_true", help="Benchmark streaming mode")
+    parser.add_argument("--streaming-step", type=float, default=0.4)
+    parser.add_argument("--grammar", action="store_true", help="Include grammar correction (needs Java)")
+    parser.add_argument("--grammar-budget", type=float, default=0.25)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--overflow-policy", default="merge", choices=OVERFLOW_POLICIES)
+    parser.add_argument("--vad-margin", type=float, default=10.0)
+    parser.add_argument("--denoise", action="store_true",
+                        help="Enable noise suppression and report the decodes it saves")
+    parser.add_argument("--min-silence", type=float, default=0.5)
+    parser.add_argument("--block-size", type=int, default=512, help="Samples per simulated capture callback")
+    parser.add_argument("--pcm-rate", type=int, default=SAMPLE_RATE, help="Sample rate of raw PCM input")
+    parser.add_argument("--json", default=None, help="Write machine-readable results to this file ('-' for stdout)")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative change counted as a regression with --compare (default: 0.1)")
+    args = parser.parse_args()
+
+    profile = profiles.resolve_profile(args.profile, model_size=args.model, beam_size=args.beam_size)
+    if args.stub:
+        args.backend = "fake"
+        model = TimedModel(FakeBackend(rtf=args.stub_rtf))
+    else:
+        print(f"Loading {args.backend} model: {profile['model_size']} ({profile['name']})")
+        model = TimedModel(create_backend(args.backend, profile))
+    draft_model = None
+    if args.draft_model:
+        # The stub draft uses a coarser word grid so its output differs and gets revised
+        draft_model = (FakeBackend(word_interval=0.5) if args.stub
+                       else create_backend(args.backend, dict(profile, model_size=args.draft_model)))
+
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    wall_start = time.perf_counter()
+    files = []
+    for path in args.files:
+        print(f"Replaying {path} at {'max speed' if args.speed <= 0 else f'{args.speed}x'} ...")
+        files.append(run_file(path, model, args, profile, draft_model))
+    wall = time.perf_counter() - wall_start
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+
+    summary = summarize(files, cpu, wall)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "model": "stub" if args.stub else f"{args.backend}:{profile['model_size']}",
+        "profile": dict(profile),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("files", "json", "compare")},
+        "summary": summary,
+        "files": files,
+    }
+    print_summary(summary)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(summary, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
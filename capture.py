@@ -0,0 +1,144 @@
+import math
+import numpy as np
+
+
+def design_lowpass(up, down, taps_per_phase=48, beta=8.0):
+    """Kaiser-windowed sinc prototype for resampling by up/down, split into polyphase rows
+
+    Row ``p`` holds the taps applied to the newest input sample first, for an
+    output that falls ``p / up`` of the way past an input sample. The cutoff
+    sits a little below the lower of the two Nyquist rates.
+    """
+    length = up * taps_per_phase
+    cutoff = 0.5 / max(up, down) * 0.92  # Cycles per sample at the upsampled rate
+    n = np.arange(length) - (length - 1) / 2
+    prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+    prototype *= up / prototype.sum()  # Unity gain after zero-stuffing by `up`
+    # phases[p, j] = prototype[p + j * up]
+    return prototype.reshape(taps_per_phase, up).T.astype(np.float32).copy()
+
+
+class PolyphaseResampler:
+    """Stateful rational resampler for mono float32 blocks of any size
+
+    Output sample ``k`` lies at input position ``k * down / up``; it is the
+    dot product of one polyphase row with the newest ``taps_per_phase`` input
+    samples at that point. All outputs of a block are computed with one
+    gather and one multiply-add, and the last input samples are carried over
+    so block boundaries are seamless.
+    """
+
+    def __init__(self, in_rate, out_rate, taps_per_phase=48):
+        divisor = math.gcd(int(in_rate), int(out_rate))
+        self.up = int(out_rate) // divisor
+        self.down = int(in_rate) // divisor
+        self.taps = taps_per_phase
+        self.phases = design_lowpass(self.up, self.down, taps_per_phase)
+        self.offsets = np.arange(self.taps)
+        self.reset()
+
+    def reset(self):
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.consumed = 0  # Input samples seen
+        self.produced = 0  # Output samples emitted
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        consumed = self.consumed + len(samples)
+        # Every output whose input position falls before the end of this block
+        end = -(-consumed * self.up // self.down)
+        if end <= self.produced:
+            self._remember(samples, consumed)
+            return np.zeros(0, dtype=np.float32)
+
+        outputs = np.arange(self.produced, end, dtype=np.int64)
+        positions = outputs * self.down
+        newest = positions // self.up - (self.consumed - len(self.history))  # Index into extended input
+        phase = positions % self.up
+
+        extended = np.concatenate([self.history, samples])
+        window = extended[newest[:, np.newaxis] - self.offsets]
+        result = np.einsum("ij,ij->i", window, self.phases[phase])
+
+        self.produced = end
+        self._remember(samples, consumed, extended)
+        return result
+
+    def _remember(self, samples, consumed, extended=None):
+        if extended is None:
+            extended = np.concatenate([self.history, samples])
+        self.history = extended[len(extended) - (self.taps - 1):].copy()
+        self.consumed = consumed
+
+
+class CaptureConverter:
+    """Device-format capture frames (any rate, any channel count) to mono at the model rate
+
+    Channels are averaged before resampling, so the filter runs once. Blocks
+    already at the target format pass through untouched.
+    """
+
+    def __init__(self, in_rate, out_rate, channels=1, taps_per_phase=48):
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.channels = int(channels)
+        self.resampler = None
+        if self.in_rate != self.out_rate:
+            self.resampler = PolyphaseResampler(self.in_rate, self.out_rate, taps_per_phase)
+
+    @property
+    def passthrough(self):
+        return self.resampler is None and self.channels == 1
+
+    def process(self, frames):
+        frames = np.asarray(frames, dtype=np.float32)
+        mono = frames.mean(axis=1) if frames.ndim == 2 and frames.shape[1] > 1 else frames.reshape(-1)
+        if self.resampler is None:
+            return mono
+        return self.resampler.process(mono)
+
+    def reset(self):
+        if self.resampler is not None:
+            self.resampler.reset()
+
+
+def input_devices():
+    """(index, info) of every device with input channels"""
+    import sounddevice as sd
+    return [(index, device) for index, device in enumerate(sd.query_devices())
+            if device["max_input_channels"] > 0]
+
+
+def find_input_device(spec=None):
+    """Resolve an input device by index, exact name or case-insensitive name fragment
+
+    Returns (index, info); index is None for the system default.
+    """
+    import sounddevice as sd
+    if spec is None or spec == "":
+        return None, sd.query_devices(kind="input")
+    devices = input_devices()
+    if str(spec).isdigit():
+        for index, device in devices:
+            if index == int(spec):
+                return index, device
+        raise ValueError(f"No input device with index {spec}")
+    for index, device in devices:
+        if device["name"] == spec:
+            return index, device
+    matches = [(index, device) for index, device in devices if str(spec).lower() in device["name"].lower()]
+    if not matches:
+        raise ValueError(f"No input device matching '{spec}' (see --list-devices)")
+    if len(matches) > 1:
+        print(f"Several input devices match '{spec}'; using {matches[0][1]['name']}")
+    return matches[0]
+
+
+def capture_format(device, rate=None, channels=None, max_channels=2):
+    """Rate and channel count to open a device with: its own unless overridden
+
+    By default at most max_channels are captured; they are averaged anyway.
+    """
+    rate = int(rate or device["default_samplerate"])
+    channels = int(channels or min(device["max_input_channels"], max_channels))
+    return rate, max(1, channels)
@@ -0,0 +1,210 @@
+import json
+import os
+import selectors
+import socket
+import tempfile
+import threading
+
+# Control channel between speech_indicator.py and live_speech_to_text.py.
+# Newline-delimited JSON over a Unix domain socket:
+#   GUI -> engine: {"command": "pause"}    ignore the microphone (queued speech is still typed)
+#                  {"command": "resume"}   listen again
+#                  {"command": "start"}    open the microphone (reloading an evicted model)
+#                  {"command": "stop"}     exit; with --daemon only close the microphone
+#                  {"command": "shutdown"} exit, also with --daemon
+#                  {"command": "trace"}    write the flight recorder to a trace file
+#                  {"command": "profile", "seconds": n}
+#   engine -> GUI: {"event": "status",
+#                   "status": "idle" | "loading" | "running" | "paused" | "error" | "stopped",
+#                   "quality": decoding quality level name,
+#                   "model": "resident" | "loading" | "failed" | "unloaded",
+#                   "load_time": seconds the last load took or null,
+#                   "error": why the model failed to load or null}
+#                  {"event": "metrics", "latency": seconds, "backlog": items, "rtf": factor}
+#                  {"event": "trace", "path": trace file written, "reason": str}
+# Unknown commands are ignored. The status is re-published after every command.
+# Events are only sent when they change, and the latest of each is replayed on connect.
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "wis.sock")
+
+
+def encode_message(message):
+    """Serialize one message as a JSON line"""
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+class LineReader:
+    """Split a byte stream into decoded JSON messages"""
+
+    def __init__(self):
+        self.buffer = b""
+
+    def feed(self, data):
+        """Add received bytes; returns the complete messages"""
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        messages = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                print(f"Ignoring malformed control message: {line!r}")
+        return messages
+
+
+class ControlServer:
+    """Engine side: accepts GUI connections, dispatches commands, pushes status changes"""
+
+    def __init__(self, path, on_command):
+        self.path = path
+        self.on_command = on_command
+        self.clients = {}  # socket -> LineReader
+        self.last_events = {}  # event name -> latest message
+        self.selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        # Remove a stale socket left by a crashed engine
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        os.chmod(path, 0o600)
+        self.server.listen()
+        self.selector.register(self.server, selectors.EVENT_READ)
+
+        self.thread = threading.Thread(target=self._serve, name="control", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while not self._closed:
+            try:
+                events = self.selector.select(timeout=0.5)
+            except OSError:
+                break
+            for key, _ in events:
+                if key.fileobj is self.server:
+                    self._accept()
+                else:
+                    self._read(key.fileobj)
+
+    def _accept(self):
+        try:
+            client, _ = self.server.accept()
+        except OSError:
+            return
+        with self._lock:
+            self.clients[client] = LineReader()
+            self.selector.register(client, selectors.EVENT_READ)
+            for message in self.last_events.values():
+                self._send(client, message)
+
+    def _read(self, client):
+        try:
+            data = client.recv(4096)
+        except OSError:
+            data = b""
+        reader = self.clients.get(client)
+        if not data or reader is None:
+            self._drop(client)
+            return
+        for message in reader.feed(data):
+            command = message.get("command")
+            if command:
+                try:
+                    self.on_command(command, message)
+                except Exception as e:
+                    print(f"Error handling control command '{command}': {e}")
+
+    def _send(self, client, message):
+        try:
+            client.sendall(encode_message(message))
+        except OSError:
+            self._drop(client, locked=True)
+
+    def _drop(self, client, locked=False):
+        if not locked:
+            with self._lock:
+                return self._drop(client, locked=True)
+        if client in self.clients:
+            del self.clients[client]
+            try:
+                self.selector.unregister(client)
+            except (KeyError, ValueError):
+                pass
+            client.close()
+
+    def broadcast(self, message):
+        """Send a message to every connected GUI"""
+        with self._lock:
+            for client in list(self.clients):
+                self._send(client, message)
+
+    def publish(self, message):
+        """Push an event, only if it differs from the last event of the same kind"""
+        with self._lock:
+            if self.last_events.get(message["event"]) == message:
+                return
+            self.last_events[message["event"]] = message
+            for client in list(self.clients):
+                self._send(client, message)
+
+    def publish_status(self, status, **fields):
+        """Push a status event, only if the status (or one of the extra fields) changed"""
+        self.publish(dict(fields, event="status", status=status))
+
+    def close(self):
+        """Disconnect every client and remove the socket"""
+        self._closed = True
+        with self._lock:
+            for client in list(self.clients):
+                self._drop(client, locked=True)
+        self.selector.close()
+        self.server.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class ControlClient:
+    """GUI side: a connection to the engine's control socket (non-blocking reads)"""
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.sock.setblocking(False)
+        self.reader = LineReader()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, command, **fields):
+        """Send a command; returns False if the engine has gone away"""
+        try:
+            self.sock.setblocking(True)
+            self.sock.sendall(encode_message(dict(fields, command=command)))
+            return True
+        except OSError:
+            return False
+        finally:
+            self.sock.setblocking(False)
+
+    def receive(self):
+        """Read what is available; returns (messages, connection_open)"""
+        messages = []
+        while True:
+            try:
+                data = self.sock.recv(4096)
+            except BlockingIOError:
+                return messages, True
+            except OSError:
+                return messages, False
+            if not data:
+                return messages, False
+            messages += self.reader.feed(data)
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,152 @@
+import numpy as np
+
+
+class NoiseSuppressor:
+    """Streaming STFT noise suppression: high-pass, spectral gating and gain normalization
+
+    The stream is cut into 50% overlapping sqrt-Hann frames; every block is
+    transformed with one batched FFT and resynthesized by overlap-add. Per
+    frame and frequency bin:
+
+    - bins below ``highpass_hz`` (rumble, handling noise, mains hum) are removed;
+    - the power, smoothed over a few frames (a single bin of noise fluctuates
+      far too much to compare), is averaged over the first ``learn`` seconds
+      and then tracked like the VAD's noise floor: faster downwards, slowly
+      towards non-speech levels, a small upward drift otherwise;
+    - bins whose smoothed power is less than ``threshold_db`` above the noise are attenuated by
+      ``attenuation_db``; the gate opens at once and closes over ``release``
+      seconds, and is smoothed across neighbouring bins against musical noise;
+    - a gain steers frames well above the noise towards ``target_db`` (at
+      most ``max_gain_db`` up or down; it follows rising levels quickly and
+      falling ones slowly), so quiet talkers reach the model at a consistent
+      level and loud ones do not clip.
+
+    ``process`` returns as many samples as it is given, delayed by ``delay``
+    samples (one frame). ``position`` is the absolute stream index of the
+    next input sample; ``seek`` restarts the overlap state after a gap but
+    keeps the noise profile.
+    """
+
+    def __init__(self, sample_rate=16000, frame_size=512, highpass_hz=80.0, threshold_db=6.0,
+                 attenuation_db=18.0, release=0.08, learn=0.25, target_db=-20.0, max_gain_db=12.0):
+        self.sample_rate = sample_rate
+        self.frame_size = frame_size
+        self.hop = frame_size // 2
+        self.delay = frame_size
+        self.window = np.sqrt(np.hanning(frame_size + 1)[:frame_size]).astype(np.float32)  # Periodic: sums to 1
+
+        frequencies = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+        self.highpass = np.clip(2.0 * frequencies / highpass_hz - 1.0, 0.0, 1.0).astype(np.float32)
+        self.threshold = 10.0 ** (threshold_db / 10.0)
+        self.floor_gain = 10.0 ** (-attenuation_db / 20.0)
+        frame_duration = self.hop / sample_rate
+        self.release = self.floor_gain ** (frame_duration / release)  # Per-frame gate decay
+        self.smoothing = np.array([0.25, 0.5, 0.25], dtype=np.float32)
+
+        self.power_smoothing = 0.7
+        self.noise_attack = 0.1
+        self.noise_release = 0.05
+        self.noise_drift = 10.0 ** (0.03 / 10.0)  # About 2 dB/s, so a changed noise is learned within seconds
+        self.noise = None  # Per-bin noise power
+        self.power = None  # Per-bin power smoothed over time
+        self.learn_frames = max(1, int(learn / frame_duration))
+
+        self.target_db = target_db
+        self.max_gain_db = max_gain_db
+        self.level_db = target_db  # Smoothed level of frames well above the noise
+        self.level_attack = 0.3
+        self.level_release = 0.02
+
+        self.position = 0
+        self.frames = 0  # Frames processed (for statistics)
+        self.gated = 0.0  # Sum of per-frame mean gate gains
+        self.reset()
+
+    def reset(self):
+        """Forget the overlap state and gates (the noise profile is kept)"""
+        self.history = np.zeros(self.frame_size - self.hop, dtype=np.float32)
+        self.tail = np.zeros(self.frame_size - self.hop, dtype=np.float32)
+        self.pending = np.zeros(self.hop, dtype=np.float32)  # Output not yet returned
+        self.gain = np.ones(len(self.highpass), dtype=np.float32)
+
+    def seek(self, position):
+        """Continue at a new absolute stream position after a gap"""
+        self.reset()
+        self.position = position
+
+    @property
+    def open_fraction(self):
+        """Mean gate gain so far, normalized to 0 (all gated) .. 1 (all passed)"""
+        if not self.frames:
+            return None
+        return (self.gated / self.frames - self.floor_gain) / (1.0 - self.floor_gain)
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        self.position += len(samples)
+        extended = np.concatenate([self.history, samples])
+        n_frames = (len(extended) - self.frame_size) // self.hop + 1 if len(extended) >= self.frame_size else 0
+        if n_frames:
+            starts = np.arange(n_frames) * self.hop
+            frames = extended[starts[:, np.newaxis] + np.arange(self.frame_size)] * self.window
+            spectra = np.fft.rfft(frames, axis=1) * self.highpass
+            self._gate(spectra)
+            synthesized = np.fft.irfft(spectra, n=self.frame_size, axis=1).astype(np.float32) * self.window
+
+            # Overlap-add: each hop of output is a frame's first half plus the previous frame's second half
+            tails = np.concatenate([self.tail[np.newaxis, :], synthesized[:-1, self.hop:]])
+            output = (synthesized[:, :self.hop] + tails).reshape(-1)
+            self.tail = synthesized[-1, self.hop:].copy()
+            self.pending = np.concatenate([self.pending, output])
+            consumed = n_frames * self.hop
+        else:
+            consumed = 0
+        self.history = extended[consumed:].copy()
+
+        result = self.pending[:len(samples)]
+        self.pending = self.pending[len(samples):]
+        if len(result) < len(samples):  # Only at the very start of the stream
+            result = np.concatenate([np.zeros(len(samples) - len(result), dtype=np.float32), result])
+        return result
+
+    def _gate(self, spectra):
+        """Update the noise profile and apply gate and gain to each frame in place"""
+        powers = spectra.real ** 2 + spectra.imag ** 2
+        if self.noise is None:
+            self.noise = np.maximum(powers[0], 1e-12)
+            self.power = self.noise.copy()
+        noise = self.noise
+        smoothed = self.power
+        gain = self.gain
+        for i, power in enumerate(powers):
+            smoothed = self.power_smoothing * smoothed + (1.0 - self.power_smoothing) * power
+            learned = self.frames + i
+            if learned < self.learn_frames:
+                noise = noise + (smoothed - noise) / (learned + 1)
+            over = smoothed > noise * self.threshold
+            below = smoothed < noise
+            noise = np.where(below, noise + self.noise_attack * (smoothed - noise),
+                             np.where(over, noise * self.noise_drift,
+                                      noise + self.noise_release * (smoothed - noise)))
+            # Soft gate: closed at the threshold, opening with the excess over it
+            target = np.sqrt(np.clip(1.0 - noise * self.threshold / smoothed, self.floor_gain ** 2, 1.0))
+            target = np.convolve(target, self.smoothing, mode="same")
+            gain = np.maximum(target, gain * self.release).astype(np.float32)
+            spectra[i] *= gain * self._normalization(power, gain, noise)
+            self.gated += float(gain.mean())
+        self.noise = noise
+        self.power = smoothed
+        self.gain = gain
+        self.frames += len(powers)
+
+    def _normalization(self, power, gain, noise):
+        """Linear gain moving frames well above the noise towards the target level"""
+        gated = power * gain ** 2
+        if gated.sum() > 4.0 * noise.sum():
+            # Parseval for a real frame: interior bins count twice; the sqrt-Hann window has mean square 1/2
+            energy = (2.0 * gated.sum() - gated[0] - gated[-1]) / self.frame_size
+            level_db = 10.0 * np.log10(energy / (self.frame_size * 0.5) + 1e-10)
+            rate = self.level_attack if level_db > self.level_db else self.level_release
+            self.level_db += rate * (level_db - self.level_db)
+        gain_db = np.clip(self.target_db - self.level_db, -self.max_gain_db, self.max_gain_db)
+        return 10.0 ** (gain_db / 20.0)
@@ -0,0 +1,170 @@
+import collections
+import concurrent.futures
+import re
+import threading
+import urllib.parse
+
+_LATIN_CHAR = re.compile(r'[a-zA-Z]')
+_NON_SPACE = re.compile(r'\S')
+_WHITESPACE = re.compile(r'\s+')
+
+# Separator between utterances checked in one batch; matches spanning it are ignored
+_BATCH_SEPARATOR = "\n\n"
+
+
+def normalize_text(text):
+    """Cache key for a piece of text: collapsed whitespace, no surrounding space"""
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def is_mostly_english(text):
+    """True if at least 30% of the non-space characters are Latin letters
+
+    LanguageTool may not properly support e.g. Arabic grammar correction.
+    """
+    non_space = len(_NON_SPACE.findall(text))
+    return non_space > 0 and len(_LATIN_CHAR.findall(text)) / non_space >= 0.3
+
+
+def apply_matches(text, matches):
+    """Apply the first replacement of every LanguageTool match (JSON dicts) to text"""
+    corrected = []
+    position = 0
+    for match in sorted(matches, key=lambda m: m["offset"]):
+        offset, length = match["offset"], match["length"]
+        if not match.get("replacements") or offset < position:
+            continue  # Nothing to apply, or overlaps a previous correction
+        corrected.append(text[position:offset])
+        corrected.append(match["replacements"][0]["value"])
+        position = offset + length
+    corrected.append(text[position:])
+    return "".join(corrected)
+
+
+class GrammarCorrector:
+    """Grammar correction backed by one long-lived local LanguageTool server.
+
+    Requests go over a single pooled keep-alive HTTP session, results are kept
+    in an LRU cache keyed on normalized text, several utterances can be checked
+    in one request, and every call is bounded by ``latency_budget`` seconds:
+    if LanguageTool is slower, the raw text is returned and the late result
+    only fills the cache.
+    """
+
+    def __init__(self, language='en', cache_size=512, latency_budget=0.25):
+        self.language = language
+        self.cache_size = cache_size
+        self.latency_budget = latency_budget
+
+        self.tool = None
+        self.session = None
+        self.check_url = None
+        self.ready = False
+
+        self.cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+        # One worker: checks are serialized on the pooled connection
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="grammar")
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the LanguageTool server (JVM) and open the pooled connection; blocks"""
+        import language_tool_python
+        import requests
+
+        self.tool = language_tool_python.LanguageTool(self.language)
+        base_url = getattr(self.tool, "url", None) or self.tool._url
+        self.check_url = urllib.parse.urljoin(base_url, "check")
+        self.session = requests.Session()
+
+        # First request pays connection setup and LanguageTool's own warm-up
+        self._check("This is a warm-up sentence.")
+        self.ready = True
+
+    def close(self):
+        """Stop the server and release the connection"""
+        self.ready = False
+        self.executor.shutdown(wait=False)
+        if self.session is not None:
+            self.session.close()
+        if self.tool is not None:
+            try:
+                self.tool.close()
+            except Exception as e:
+                print(f"Error stopping grammar tool: {e}")
+
+    def correct_batch(self, texts):
+        """Correct several texts with at most one LanguageTool request
+
+        Returns the texts in the same order; any text whose correction is not
+        cached and not back within the latency budget is returned unchanged.
+        """
+        results = list(texts)
+        if not self.ready:
+            return results
+
+        pending = []
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                if not text or not is_mostly_english(text):
+                    continue  # Skip grammar correction for non-English text
+                key = normalize_text(text)
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    results[i] = self.cache[key]
+                    self.hits += 1
+                else:
+                    pending.append(i)
+                    self.misses += 1
+
+        if not pending:
+            return results
+
+        future = self.executor.submit(self._check_and_cache, [texts[i] for i in pending])
+        try:
+            corrected = future.result(timeout=self.latency_budget)
+        except concurrent.futures.TimeoutError:
+            # Type the raw text now; the correction still lands in the cache
+            self.timeouts += 1
+            return results
+        except Exception as e:
+            self.errors += 1
+            print(f"Grammar correction error: {e}")
+            return results
+
+        for i, text in zip(pending, corrected):
+            results[i] = text
+        return results
+
+    def _check(self, text):
+        response = self.session.post(self.check_url, data={"text": text, "language": self.language},
+                                     timeout=5)
+        response.raise_for_status()
+        return response.json()["matches"]
+
+    def _check_and_cache(self, texts):
+        # One request for the whole batch, then split the matches back per text
+        joined = _BATCH_SEPARATOR.join(texts)
+        matches = self._check(joined)
+
+        corrected = []
+        start = 0
+        for text in texts:
+            end = start + len(text)
+            own = [dict(m, offset=m["offset"] - start) for m in matches
+                   if m["offset"] >= start and m["offset"] + m["length"] <= end]
+            corrected.append(apply_matches(text, own))
+            start = end + len(_BATCH_SEPARATOR)
+
+        with self._cache_lock:
+            for text, result in zip(texts, corrected):
+                self.cache[normalize_text(text)] = result
+                self.cache.move_to_end(normalize_text(text))
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return corrected
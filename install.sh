@@ -48,6 +48,16 @@ else
     echo "  To enable grammar correction, install Java 17+: sudo apt install default-jdk"
 fi
 
+# Check text injection tool (optional, for fast typing)
+echo ""
+echo "Checking text injection tool (optional, for fast typing)..."
+if command -v xdotool &> /dev/null || command -v wtype &> /dev/null; then
+    echo -e "${GREEN}✓${NC} Found xdotool/wtype - text is typed one utterance at a time"
+else
+    echo -e "${YELLOW}⚠${NC} xdotool/wtype not found - falling back to per-character typing"
+    echo "  For faster typing, install it: sudo apt install xdotool (X11) or sudo apt install wtype (Wayland)"
+fi
+
 # Check NVIDIA GPU and CUDA
 echo ""
 echo "Checking GPU and CUDA support..."
@@ -126,16 +136,11 @@ else
     echo -e "${GREEN}✓${NC} All required Python packages are already installed"
 fi
 
-# Update live_speech_to_text.py to use CPU if no CUDA
+# No GPU: the default hardware profile already falls back to CPU int8
 if [ "$CUDA_AVAILABLE" = false ]; then
     echo ""
-    echo "Configuring for CPU mode..."
-    if grep -q 'device="cuda"' "$SCRIPT_DIR/live_speech_to_text.py"; then
-        sed -i 's/device="cuda"/device="cpu"/g' "$SCRIPT_DIR/live_speech_to_text.py"
-        sed -i 's/compute_type="float16"/compute_type="int8"/g' "$SCRIPT_DIR/live_speech_to_text.py"
-        sed -i 's/WhisperModel("large"/WhisperModel("small"/g' "$SCRIPT_DIR/live_speech_to_text.py"
-        echo -e "${GREEN}✓${NC} Configured for CPU with 'small' model"
-    fi
+    echo -e "${GREEN}✓${NC} No GPU: WIS will use the 'cpu-small' profile (int8 on CPU)"
+    echo "  Run 'python3 $SCRIPT_DIR/live_speech_to_text.py --profile auto' once to pick the best profile for this machine"
 fi
 
 # Create desktop entry
@@ -181,6 +186,6 @@ if [ "$CUDA_AVAILABLE" = false ]; then
     echo -e "${YELLOW}Note: Running in CPU mode. For faster performance with GPU:${NC}"
     echo "  1. Install NVIDIA drivers and CUDA"
     echo "  2. Reinstall PyTorch: pip3 install torch --index-url https://download.pytorch.org/whl/cu124"
-    echo "  3. Edit line 25 in live_speech_to_text.py to use device='cuda'"
+    echo "  3. WIS will pick the 'cuda-large' profile automatically (or pass --profile cuda-large)"
     echo ""
 fi
@@ -1,71 +1,463 @@
-import sounddevice as sd
 import numpy as np
-import queue
+import gc
 import threading
-import tempfile
+import queue
+import itertools
+import importlib.util
 import os
-from faster_whisper import WhisperModel
-from pynput.keyboard import Key, Controller
-from pynput import keyboard
 import time
+import signal
 import wave
-import logging
-
-# Attempt to import language_tool_python, but make it optional
-try:
-    import language_tool_python
-    LANGUAGE_TOOL_AVAILABLE = True
-except ImportError:
-    LANGUAGE_TOOL_AVAILABLE = False
+from audio_buffer import AudioRingBuffer
+from capture import CaptureConverter, find_input_device, capture_format, input_devices
+from streaming import StreamingTranscriber
+from vad import VoiceActivityDetector, UtteranceSegmenter
+from denoise import NoiseSuppressor
+import profiles
+from grammar import GrammarCorrector
+from output import create_output, OutputBackend, RevisableText, OUTPUT_BACKENDS
+from control import ControlServer, DEFAULT_SOCKET
+from metrics import MetricsRegistry
+import tracing
+from quality import QualityController, build_levels
+from backends import BACKENDS, create_backend
+from server import RemoteBackend, DEFAULT_SERVER_SOCKET
+from recorder import SessionRecorder, SAMPLE_FORMATS, DEFAULT_DIRECTORY as DEFAULT_RECORD_DIRECTORY
+from pipeline import (BoundedQueue, SpeechChunk, Transcript, RefineJob, merge_speech, merge_transcripts,
+                      replace_draft, is_two_pass, OVERFLOW_POLICIES)
+
+# language_tool_python is optional. Only check that it is installed here: the
+# import itself (and the LanguageTool JVM) happen in the background at startup
+LANGUAGE_TOOL_AVAILABLE = importlib.util.find_spec("language_tool_python") is not None
+if not LANGUAGE_TOOL_AVAILABLE:
     print("language_tool_python not available. Grammar correction will be disabled.")
 
+# Longest wait (seconds) before retrying a model load that failed
+MODEL_RETRY_MAX = 60.0
+
 class LiveSpeechToText:
-    def __init__(self, use_grammar_correction=True, control_file=None):
-        # Initialize components
-        self.model = WhisperModel("large", device="cuda", compute_type="float16")
-        self.keyboard = Controller()
+    def __init__(self, use_grammar_correction=True, control_socket=None, debug_audio_dir=None,
+                 streaming=False, streaming_step=0.4, vad_margin_db=10.0, min_silence=0.5,
+                 profile=None, queue_size=8, overflow_policy="merge", grammar_budget=0.25,
+                 output=None, output_file="-", coalesce_window=0.03, hotkeys=True, model=None,
+                 metrics_file=None, metrics_port=None, metrics_interval=1.0,
+                 adaptive_quality=True, fallback_model=None, daemon=False, idle_unload=0, draft_model=None,
+                 recorder=None, input_device=None, capture_rate=None, capture_channels=None, blocksize=0,
+                 latency=None, backend="faster-whisper", noise_suppression=False,
+                 trace_dir=tracing.DEFAULT_DIRECTORY, trace_spike=None):
+        # Initialize components (profile selects model size, device and quantization).
+        # The model and the grammar tool load in the background; capture starts right
+        # away and utterances spoken meanwhile are queued until the model is ready.
+        # backend names the ASR engine (see backends.BACKENDS); a ready-made
+        # ASRBackend (e.g. the fake one for benchmarking) can be passed as model instead.
+        self.profile = profile or profiles.resolve_profile()
+        self.beam_size = self.profile["beam_size"]
+        self.backend = backend
+        self.preloaded_model = model
+        self.model = None
+        self.model_ready = threading.Event()
+
+        # Residency: the model stays loaded across capture start/stop, is evicted
+        # after idle_unload seconds without a decode (0 = never) and reloaded on demand.
+        # model_lock is held while decoding so the model is never evicted mid-decode.
+        self.idle_unload = idle_unload
+        if idle_unload and model is not None:
+            # Nothing to free: a model passed in (e.g. the --server client) is owned by the caller
+            print("Idle unload is disabled: the model was passed in ready-made and stays loaded")
+            self.idle_unload = 0
+        self.model_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.model_loading = False
+        self.model_load_seconds = None
+        self.last_used = time.time()
+        # A failed load is retried after a growing delay (2 s up to MODEL_RETRY_MAX); until
+        # then utterances are dropped and the error is reported to the GUI
+        self.model_error = None
+        self.load_failures = 0
+        self.retry_at = 0.0
+
+        # Load-adaptive decoding: beam size, best_of, temperature fallback and
+        # (optionally) a smaller model step down when decoding falls behind
+        # Only backends whose decoding options change their cost can be adapted
+        self.adaptive_quality = adaptive_quality and (model or BACKENDS[backend]).tunable
+        self.fallback_model_size = fallback_model
+        self.fallback_model = None
+        self.fallback_loading = False
+        self.quality = QualityController(build_levels(self.beam_size, fallback_model),
+                                         can_use=self.can_use_quality_level)
+        self.last_rtf = None
 
-        # Initialize grammar correction if available and requested
+        # Output backend (a name or an OutputBackend instance); text arriving within
+        # coalesce_window seconds is injected at once. on_typed(transcripts, typed_at)
+        # is called after every injection.
+        self.output = output if isinstance(output, OutputBackend) else create_output(output, output_file)
+        self.coalesce_window = coalesce_window
+        self.on_typed = None
+
+        # Grammar correction (if available and requested) is used once its server is up;
+        # it never holds typing for longer than grammar_budget seconds
         self.use_grammar_correction = use_grammar_correction and LANGUAGE_TOOL_AVAILABLE
-        if self.use_grammar_correction:
-            try:
-                self.grammar_tool = language_tool_python.LanguageTool('en')
-            except Exception as e:
-                print(f"Error initializing grammar tool: {e}")
-                print("Grammar correction will be disabled.")
-                self.use_grammar_correction = False
+        self.grammar = GrammarCorrector('en', latency_budget=grammar_budget)
 
         # Audio recording parameters
         self.sample_rate = 16000
-        self.chunk_duration = 2  # seconds (further reduced for more responsive transcription)
-        self.chunk_size = self.sample_rate * self.chunk_duration
+        self.max_utterance = 15  # seconds; longer speech is cut into several utterances
+        self.buffer_duration = 30  # seconds of capture kept in the ring buffer
+
+        # Streaming mode: re-decode a growing window every streaming_step seconds
+        # and type only the words two consecutive hypotheses agree on
+        self.streaming = streaming
+        self.streaming_step = streaming_step
+        self.streamer = StreamingTranscriber(self.transcribe_words, sample_rate=self.sample_rate)
 
-        # Threading components
-        self.audio_queue = queue.Queue()
+        # Threading components. In daemon mode a "stop" command only closes capture
+        # (keeping the model warm for the next "start"); "shutdown" exits.
+        self.daemon = daemon
+        self.capturing = True
         self.is_recording = False
         self.terminate = False
         self.paused = False  # Add pause state
         self.ctrl_pressed = False
         self.shift_pressed = False
 
-        # Control file for external control (GUI)
-        self.control_file = control_file
-        self.status_file = control_file.replace('_control.txt', '_status.txt') if control_file else None
-        
-        # Voice activity detection parameters
-        self.audio_buffer = np.array([])
-        self.silence_threshold = 0.01  # Adjust this value based on your environment
-        self.min_audio_length = self.sample_rate * 0.5  # Minimum 0.5 seconds of audio
-        
-        # Temporary file for audio chunks
-        self.temp_dir = tempfile.mkdtemp()
+        # Control socket for external control (GUI): commands are pushed to us and
+        # status is pushed back only when it changes
+        self.control = ControlServer(control_socket, self.handle_command) if control_socket else None
+
+        # Preallocated capture buffer: the audio callback writes into it directly
+        # and the processor reads zero-copy views, so capture never allocates
+        self.audio_buffer = AudioRingBuffer(self.sample_rate * self.buffer_duration)
+
+        # The input device is opened in its own rate and channel count (unless
+        # overridden) so neither PortAudio nor ALSA resamples inside the callback.
+        # The callback then only copies frames into device_buffer; downmixing and
+        # resampling into audio_buffer run on the recording thread.
+        self.input_device = input_device
+        self.capture_rate = capture_rate
+        self.capture_channels = capture_channels
+        self.blocksize = blocksize
+        self.latency = latency
+        self.device_buffer = None
+        self.device_arrival = time.time()
+        # The callbacks only count status flags (overflows); the segmentation stage reports them
+        self.capture_status = None
+        self.capture_status_count = 0
+        self.reported_status_count = 0
+
+        # Voice activity detection: frame-level VAD with an adaptive noise floor
+        # cuts the stream into utterances at pauses before anything is decoded
+        self.vad = VoiceActivityDetector(self.sample_rate, margin_db=vad_margin_db)
+        self.segmenter = UtteranceSegmenter(self.vad, min_silence=min_silence,
+                                            max_utterance=self.max_utterance)
+
+        # Optional noise suppression in front of the VAD (high-pass, spectral gating
+        # against a tracked noise profile, gain normalization). A second VAD keeps
+        # segmenting the raw signal, only to count the decodes suppression saves.
+        self.suppressor = None
+        self.raw_segmenter = None
+        if noise_suppression:
+            self.suppressor = NoiseSuppressor(self.sample_rate)
+            self.raw_segmenter = UtteranceSegmenter(VoiceActivityDetector(self.sample_rate, margin_db=vad_margin_db),
+                                                    min_silence=min_silence, max_utterance=self.max_utterance)
+
+        # Optional debug dump of every transcribed chunk as a WAV file
+        self.debug_audio_dir = debug_audio_dir
+        self.debug_chunk_counter = itertools.count()
+        if self.debug_audio_dir:
+            os.makedirs(self.debug_audio_dir, exist_ok=True)
+
+        # Optional SessionRecorder keeping the segmented audio, utterances and transcripts on disk
+        self.recorder = recorder
         
-        # Initialize the keyboard listener for hotkeys
-        self.listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
-        self.listener.start()
+        # Bounded queues between the pipeline stages (speech captured while the
+        # model is still loading waits in speech_queue)
+        self.speech_queue = BoundedQueue("speech", queue_size, overflow_policy,
+                                         merge_speech(self.sample_rate * self.max_utterance))
+        self.transcript_queue = BoundedQueue("transcripts", queue_size, overflow_policy, merge_transcripts,
+                                             replace_draft, is_two_pass)
+        self.output_queue = BoundedQueue("output", queue_size, overflow_policy, merge_transcripts,
+                                         replace_draft, is_two_pass)
+
+        # Two-pass mode (utterance mode only): a small draft model (a size or a model
+        # object) types each utterance at once, the main model re-decodes it in the
+        # background and differences are fixed with a minimal backspace/retype edit.
+        # Refinement is best effort: under load the oldest pending refinements are dropped.
+        self.two_pass = draft_model is not None and not streaming
+        self.draft_model_size = draft_model if isinstance(draft_model, str) else None
+        self.draft_model = None if isinstance(draft_model, str) else draft_model
+        self.utterance_ids = itertools.count()
+        self.refine_queue = BoundedQueue("refine", queue_size, "drop-oldest")
+        self.revisable = RevisableText()
+
+        # Instrumentation: stage timings, queue depths, drops and skips in Prometheus
+        # format, written to metrics_file and/or served on 127.0.0.1:metrics_port.
+        # capture_clock maps capture positions to wall time for end-to-end latency.
+        self.capture_clock = (0, time.time())
+        self.metrics = MetricsRegistry()
+        self.register_metrics()
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        if metrics_port:
+            self.metrics.serve(metrics_port)
+
+        # Diagnostics: the flight recorder (tracing.RECORDER) always keeps the latest
+        # events of every thread. A trace file is written on request (SIGUSR1, the
+        # "trace" command) or when a transcript is typed more than trace_spike seconds
+        # after its speech ended; SIGUSR2 or "profile" samples all stacks first.
+        self.trace_dir = trace_dir
+        self.trace_spike = trace_spike
+        self.last_spike_trace = 0.0
+        self.profiling = threading.Lock()
+
+        # Initialize the keyboard listener for hotkeys (skipped when run headless)
+        self.listener = None
+        if hotkeys:
+            from pynput import keyboard
+            self.Key = keyboard.Key
+            self.listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
+            self.listener.start()
+
+        self.threads = []
+
+        # Load the model and grammar tool without blocking capture
+        self.ensure_model()
+        if self.use_grammar_correction:
+            threading.Thread(target=self.load_grammar_tool, daemon=True).start()
+        if self.two_pass and self.draft_model is None:
+            threading.Thread(target=self.load_draft_model, daemon=True).start()
+
+    def register_metrics(self):
+        """Create the engine's metrics (values owned by other objects are read at export time)"""
+        m = self.metrics
+        stage_help = "Time spent per work item in each pipeline stage"
+        self.capture_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "capture"})
+        self.gating_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "gating"})
+        self.asr_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "asr"})
+        self.resample_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "resample"})
+        self.denoise_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "denoise"})
+        self.grammar_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "grammar"})
+        self.typing_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "typing"})
+        self.draft_seconds = m.histogram("wis_stage_seconds", stage_help, {"stage": "draft"})
+        self.revisions = m.counter("wis_revisions", "Typed drafts corrected with the main model's result")
+        self.latency_seconds = m.histogram("wis_end_to_end_latency_seconds",
+                                           "Time from the end of speech to the text being typed")
+        self.rtf = m.histogram("wis_asr_realtime_factor", "Decode time divided by the decoded audio duration",
+                               buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0))
+        self.decoded_audio = m.counter("wis_asr_audio_seconds", "Seconds of audio decoded")
+        self.skipped_transcripts = m.counter("wis_skipped_transcripts",
+                                             "Transcripts dropped as noise, fragments or repetitions")
+        m.counter("wis_audio_status_events", "Capture callbacks that reported an overflow or underflow",
+                  function=lambda: self.capture_status_count)
+
+        m.counter("wis_audio_overrun_samples", "Captured samples dropped because segmentation fell behind",
+                  function=lambda: self.audio_buffer.overruns)
+        m.gauge("wis_audio_backlog_seconds", "Captured audio not yet segmented",
+                function=lambda: self.audio_buffer.available() / self.sample_rate)
+        m.counter("wis_vad_dropped_frames", "Non-speech frames never sent to the model",
+                  function=lambda: self.segmenter.dropped_frames)
+        m.counter("wis_vad_discarded_utterances", "Utterances too short to be speech",
+                  function=lambda: self.segmenter.discarded_utterances)
+        # With noise suppression, the same counts for the unprocessed signal ("raw") show what it saves
+        signal_labels = {"signal": "denoised" if self.suppressor else "raw"}
+        self.vad_utterances = m.counter("wis_vad_utterances", "Utterances the VAD found", signal_labels)
+        self.vad_speech_seconds = m.counter("wis_vad_speech_seconds", "Seconds of audio in those utterances",
+                                            signal_labels)
+        if self.suppressor:
+            self.raw_utterances = m.counter("wis_vad_utterances", "Utterances the VAD found", {"signal": "raw"})
+            self.raw_speech_seconds = m.counter("wis_vad_speech_seconds", "Seconds of audio in those utterances",
+                                                {"signal": "raw"})
+        for stage_queue in (self.speech_queue, self.refine_queue, self.transcript_queue, self.output_queue):
+            labels = {"queue": stage_queue.name}
+            m.gauge("wis_queue_depth", "Items waiting in a stage queue", labels, function=stage_queue.qsize)
+            m.gauge("wis_queue_high_watermark", "Deepest a stage queue has been", labels,
+                    function=lambda q=stage_queue: q.high_watermark)
+            m.counter("wis_queue_dropped", "Items a full stage queue discarded", labels,
+                      function=lambda q=stage_queue: q.dropped)
+            m.counter("wis_queue_merged", "Items a full stage queue merged into another", labels,
+                      function=lambda q=stage_queue: q.merged)
+        m.counter("wis_grammar_timeouts", "Grammar checks that missed the latency budget",
+                  function=lambda: self.grammar.timeouts)
+        m.gauge("wis_model_ready", "1 while the model is loaded", function=lambda: int(self.model_ready.is_set()))
+        m.gauge("wis_model_load_seconds", "Duration of the last model load including warm-up",
+                function=lambda: self.model_load_seconds)
+        m.gauge("wis_quality_level", "Decoding quality level (0 = full quality)", function=lambda: self.quality.level)
+
+    def metrics_summary(self):
+        """Compact numbers for the GUI: recent latency, backlog and real-time factor"""
+        latency = self.latency_seconds.last()
+        rtf = self.rtf.recent_mean()
+        return {
+            "latency": round(latency, 2) if latency is not None else None,
+            "backlog": (self.speech_queue.qsize() + self.refine_queue.qsize() + self.transcript_queue.qsize()
+                        + self.output_queue.qsize()),
+            "rtf": round(rtf, 2) if rtf is not None else None,
+        }
+
+    def speech_end_time(self, end_sample):
+        """Wall time at which the given capture position was recorded"""
+        written, at = self.capture_clock
+        return at - (written - end_sample) / self.sample_rate
+
+    def observe_decode(self, audio, seconds):
+        """Record the time taken to decode an in-memory chunk"""
+        self.asr_seconds.observe(seconds)
+        if isinstance(audio, np.ndarray) and len(audio):
+            duration = len(audio) / self.sample_rate
+            self.decoded_audio.inc(duration)
+            self.last_rtf = seconds / duration
+            self.rtf.observe(self.last_rtf)
+
+    def can_use_quality_level(self, level):
+        """Levels with their own model are usable once it is loaded (loading starts on first use)"""
+        if "model" not in level:
+            return True
+        if self.fallback_model is None and not self.fallback_loading:
+            self.fallback_loading = True
+            threading.Thread(target=self.load_fallback_model, daemon=True).start()
+        return self.fallback_model is not None
+
+    def load_fallback_model(self):
+        """Load the smaller model used at the lowest quality level"""
+        print(f"Loading fallback model: {self.fallback_model_size}")
+        try:
+            self.fallback_model = create_backend(self.backend, dict(self.profile, model_size=self.fallback_model_size))
+            print("Fallback model ready")
+        except Exception as e:
+            print(f"Error loading fallback model: {e}")
+
+    def load_draft_model(self):
+        """Load the small model that types drafts in two-pass mode"""
+        print(f"Loading draft model: {self.draft_model_size}")
+        try:
+            self.draft_model = create_backend(self.backend, dict(self.profile, model_size=self.draft_model_size))
+            print("Draft model ready; utterances are now typed as drafts and refined")
+        except Exception as e:
+            print(f"Error loading draft model: {e}; typing final results only")
+
+    def decode_options(self):
+        """(model, transcribe() options) for the current quality level"""
+        level = self.quality.current() if self.adaptive_quality else self.quality.levels[0]
+        model = self.fallback_model if "model" in level and self.fallback_model else self.model
+        return model, dict(beam_size=level["beam_size"], best_of=level["best_of"], temperature=level["temperature"])
+
+    def adapt_quality(self, backlog):
+        """Feed the last decode into the quality controller; announce level changes"""
+        if not self.adaptive_quality or not self.quality.update(self.last_rtf, backlog):
+            return
+        level = self.quality.current()
+        print(f"Decoding quality: {level['name']} (beam {level['beam_size']}, "
+              f"{'backlog ' + str(backlog) if backlog else f'RTF {self.last_rtf:.2f}'})")
+        self.publish_status()
+
+    def ensure_model(self):
+        """Start loading the model in the background unless it is loaded or loading"""
+        with self._load_lock:
+            if self.model_ready.is_set() or self.model_loading or time.time() < self.retry_at:
+                return
+            self.model_loading = True
+        threading.Thread(target=self.load_model, daemon=True).start()
+
+    def wait_for_model(self):
+        """Block until the model is resident, reloading it if it was evicted
+
+        Returns False on shutdown, or if the model failed to load (the caller
+        drops its work instead of waiting for the next retry).
+        """
+        while not self.model_ready.is_set():
+            self.ensure_model()
+            if self.terminate:
+                return False
+            with self._load_lock:
+                if self.model_error and not self.model_loading:
+                    return False
+            self.model_ready.wait(0.1)
+        return True
+
+    def unload_model(self):
+        """Evict the model (and fallback model) to free RAM/VRAM; reloaded on the next decode"""
+        with self.model_lock:
+            if not self.model_ready.is_set():
+                return
+            self.model_ready.clear()
+            self.model = None
+            self.fallback_model = None
+            self.fallback_loading = False
+        gc.collect()
+        print(f"Model unloaded after {self.idle_unload:.0f}s without speech")
+        self.publish_status()
+
+    def residency_worker(self):
+        """Evict the model once nothing has been decoded for idle_unload seconds"""
+        while not self.terminate:
+            time.sleep(1.0)
+            if (self.model_ready.is_set() and time.time() - self.last_used > self.idle_unload
+                    and not self.speech_queue.unfinished):
+                self.unload_model()
+
+    def model_state(self):
+        """Residency reported in status: resident, loading, failed or unloaded"""
+        if self.model_ready.is_set():
+            return "resident"
+        if self.model_loading:
+            return "loading"
+        return "failed" if self.model_error else "unloaded"
+
+    def load_model(self):
+        """Load the ASR model in the background and warm it up"""
+        if isinstance(self.preloaded_model, RemoteBackend):
+            # Model, device and compute type are the server's
+            print(f"Connecting to the transcription server at {self.preloaded_model.path}")
+        else:
+            backend = getattr(self.preloaded_model, "name", None) or self.backend
+            print(f"Loading {backend} model: {self.profile['model_size']} on {self.profile['device']} "
+                  f"({self.profile['compute_type']}, profile '{self.profile['name']}')")
+        self.publish_status()
+        start_time = time.time()
+        try:
+            with tracing.span("load model", model=self.profile["model_size"]):
+                model = self.preloaded_model or create_backend(self.backend, self.profile)
+        except Exception as e:
+            with self._load_lock:
+                self.load_failures += 1
+                delay = min(MODEL_RETRY_MAX, 2.0 ** self.load_failures)
+                self.model_error = str(e) or type(e).__name__
+                self.retry_at = time.time() + delay
+                self.model_loading = False
+            print(f"Error loading model: {e} (retried on speech after {delay:.0f}s)")
+            self.publish_status()
+            return
+        print(f"Model loaded in {time.time() - start_time:.1f}s, warming up...")
+
+        # One throwaway decode so the first real utterance doesn't pay first-call overhead
+        try:
+            warmup_audio = (np.random.default_rng(0).standard_normal(self.sample_rate) * 0.01).astype(np.float32)
+            model.transcribe(warmup_audio, language="en", beam_size=self.beam_size)
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+
+        self.model = model
+        self.model_load_seconds = time.time() - start_time
+        self.last_used = time.time()
+        self.model_error = None
+        self.load_failures = 0
+        self.model_ready.set()
+        self.model_loading = False
+        self.publish_status()
+        print(f"Model ready after {self.model_load_seconds:.1f}s")
+
+    def load_grammar_tool(self):
+        """Start LanguageTool in the background; text is typed uncorrected until it is up"""
+        try:
+            self.grammar.start()
+            print("Grammar correction ready")
+        except Exception as e:
+            print(f"Error initializing grammar tool: {e}")
+            print("Grammar correction will be disabled.")
+            self.use_grammar_correction = False
     
     def on_press(self, key):
         """Handle keyboard hotkeys"""
+        Key = self.Key
         try:
             if key == Key.ctrl or key == Key.ctrl_r:
                 self.ctrl_pressed = True
@@ -79,6 +471,7 @@ class LiveSpeechToText:
     
     def on_release(self, key):
         """Handle key releases to reset modifiers"""
+        Key = self.Key
         try:
             if key == Key.ctrl or key == Key.ctrl_r:
                 self.ctrl_pressed = False
@@ -97,6 +490,7 @@ class LiveSpeechToText:
             print("Speech recognition PAUSED (Ctrl+Shift+Space)")
         else:
             print("Speech recognition RESUMED (Ctrl+Shift+Space)")
+        self.publish_status()
     
     def is_repetition(self, text):
         """Check if the text is likely a repetition/noise"""
@@ -120,23 +514,82 @@ class LiveSpeechToText:
             
         return False
     
-    def audio_callback(self, indata, frames, time, status):
+    def audio_callback(self, indata, frames, time_info, status):
         """Callback function to capture audio data"""
         if status:
-            print(f"Audio status: {status}")
-        # Add audio data to queue (we'll do voice activity detection during processing)
-        audio_data = indata.copy()
-        self.audio_queue.put(audio_data)
+            self.capture_status = status
+            self.capture_status_count += 1
+        if self.paused or not self.capturing:
+            return
+        # Copy straight into the ring buffer (we'll do voice activity detection during processing)
+        self.audio_buffer.write(indata[:, 0])
+        self.capture_clock = (self.audio_buffer.total_written, time.time())
     
+    def device_callback(self, indata, frames, time_info, status):
+        """Capture callback for device-native formats: only copies the frames for conversion"""
+        if status:
+            self.capture_status = status
+            self.capture_status_count += 1
+        if self.paused or not self.capturing:
+            return
+        self.device_buffer.write(indata)
+        self.device_arrival = time.time()
+
+    def report_capture_status(self):
+        """Print the status flags the capture callbacks counted since the last report"""
+        count = self.capture_status_count
+        if count != self.reported_status_count:
+            print(f"Audio status: {self.capture_status} ({count - self.reported_status_count} callbacks)")
+            tracing.instant("capture status", status=str(self.capture_status), count=count)
+            self.reported_status_count = count
+
+    def convert_capture(self, converter, timeout):
+        """Downmix and resample the device frames captured so far into the model-rate buffer"""
+        if not self.device_buffer.wait(1, timeout):
+            return
+        frames = self.device_buffer.read()
+        with self.resample_seconds.time(), tracing.span("convert", frames=len(frames)):
+            self.audio_buffer.write(converter.process(frames))
+        self.capture_clock = (self.audio_buffer.total_written, self.device_arrival)
+
     def record_audio(self):
-        """Record audio in a separate thread"""
-        print("Starting audio recording... Speak now!")
-        with sd.InputStream(callback=self.audio_callback, 
-                           channels=1, 
-                           samplerate=self.sample_rate,
-                           dtype='float32'):
-            while not self.terminate:
+        """Record audio in a separate thread; the input stream is only open while capturing"""
+        import sounddevice as sd
+
+        try:
+            device, info = find_input_device(self.input_device)
+        except ValueError as e:
+            print(f"{e}; using the default input device")
+            device, info = find_input_device()
+        rate, channels = capture_format(info, self.capture_rate, self.capture_channels)
+        converter = CaptureConverter(rate, self.sample_rate, channels)
+        if not converter.passthrough:
+            self.device_buffer = AudioRingBuffer(rate * 2, channels)
+
+        while not self.terminate:
+            if not self.capturing:
                 time.sleep(0.1)
+                continue
+            print(f"Starting audio recording from {info['name']} ({rate} Hz, {channels} channel(s))... Speak now!")
+            # Whatever the last session left unread must not run into this one (the final
+            # conversion above is done by now, so nothing is written after this)
+            self.audio_buffer.clear()
+            with sd.InputStream(device=device,
+                                callback=self.audio_callback if converter.passthrough else self.device_callback,
+                                channels=channels,
+                                samplerate=rate,
+                                dtype='float32',
+                                blocksize=self.blocksize,
+                                latency=self.latency):
+                while self.capturing and not self.terminate:
+                    if converter.passthrough:
+                        time.sleep(0.1)
+                    else:
+                        self.convert_capture(converter, timeout=0.1)
+            if not converter.passthrough:
+                self.convert_capture(converter, timeout=0)
+                converter.reset()
+            print("Audio recording stopped")
     
     def save_audio_chunk(self, audio_data, filename):
         """Save audio chunk to a WAV file"""
@@ -148,55 +601,72 @@ class LiveSpeechToText:
             wf.setframerate(self.sample_rate)
             wf.writeframes(audio_int16.tobytes())
     
-    def transcribe_audio(self, audio_file):
-        """Transcribe audio file using faster-whisper"""
-        # segments, info = self.model.transcribe(audio_file)
-        segments, info = self.model.transcribe(
-        audio_file,
-        language="en",       # <--- Force English transcription
-        beam_size=5,         # Optional: improves accuracy a bit
-        vad_filter=True      # Optional: filters silence better
+    def dump_debug_audio(self, audio_data):
+        """Write a chunk to the debug directory (opt-in, for inspecting what the model heard)"""
+        filename = os.path.join(
+            self.debug_audio_dir,
+            f"chunk_{time.strftime('%Y%m%d_%H%M%S')}_{next(self.debug_chunk_counter):05d}.wav"
         )
+        try:
+            self.save_audio_chunk(audio_data, filename)
+        except Exception as e:
+            print(f"Error writing debug audio: {e}")
+
+    def transcribe_audio(self, audio):
+        """Transcribe audio with the ASR backend
+
+        Accepts a float32 mono numpy array at self.sample_rate (passed to the
+        model in memory, no decoding).
+        """
+        start = time.perf_counter()
+        model, options = self.decode_options()  # Beam size etc. follow the quality level
+        with tracing.span("decode", seconds=round(len(audio) / self.sample_rate, 2), beam=options.get("beam_size")):
+            segments = model.transcribe(
+            audio,
+            language="en",       # <--- Force English transcription
+            **options
+            )
         raw_text = " ".join([seg.text for seg in segments])
+        self.observe_decode(audio, time.perf_counter() - start)
         return raw_text.strip()
+
+    def transcribe_words(self, audio, initial_prompt=None):
+        """Transcribe audio and return (start, end, word) tuples for streaming mode"""
+        start = time.perf_counter()
+        model, options = self.decode_options()
+        with tracing.span("decode", seconds=round(len(audio) / self.sample_rate, 2), streaming=True):
+            segments = model.transcribe(
+                audio,
+                language="en",
+                word_timestamps=True,
+                condition_on_previous_text=False,
+                initial_prompt=initial_prompt,
+                **options
+            )
+        words = [(word.start, word.end, word.word) for seg in segments for word in (seg.words or [])]
+        self.observe_decode(audio, time.perf_counter() - start)
+        return words
     
-    def correct_grammar(self, text):
-        """Correct grammar in the transcribed text"""
-        if not text or not self.use_grammar_correction:
-            return text
+    def correct_grammar(self, texts):
+        """Correct grammar in a batch of transcribed texts (one LanguageTool request at most)"""
+        if not self.use_grammar_correction:
+            return texts
         try:
-            # Only attempt grammar correction for English text
-            # LanguageTool may not properly support Arabic grammar correction
-            import re
-            # Check if text contains mainly English characters
-            english_chars = re.findall(r'[a-zA-Z]', text)
-            if len(english_chars) / len(text.replace(' ', '')) < 0.3:  # If less than 30% English chars
-                return text  # Skip grammar correction for non-English text
-            
-            matches = self.grammar_tool.check(text)
-            corrected = language_tool_python.utils.correct(text, matches)
-            return corrected
+            with tracing.span("grammar", texts=len(texts)):
+                return self.grammar.correct_batch(texts)
         except Exception as e:
             print(f"Grammar correction error: {e}")
-            return text  # Return original text if correction fails
-    
+            return texts  # Return original text if correction fails
+
     def type_text(self, text):
-        """Simulate typing the text"""
+        """Send text to the output backend in a single injection; returns False if that failed"""
         if text:
             try:
                 # Add a space at the beginning to ensure proper spacing
                 if text and text[0] != ' ':
                     text = ' ' + text
-                
-                # Handle typing with proper Unicode support
-                # Split the text into individual characters to handle Unicode better
-                for char in text:
-                    try:
-                        self.keyboard.press(char)
-                        self.keyboard.release(char)
-                    except (self.keyboard.InvalidCharacterException, self.keyboard.InvalidKeyException):
-                        # If character cannot be typed, skip it
-                        continue
+                with tracing.span("type", chars=len(text)):
+                    self.output.emit(text)
             except Exception as e:
                 print(f"Error typing text: {e}")
                 # Fallback: write to a file instead
@@ -205,168 +675,685 @@ class LiveSpeechToText:
                         f.write(text + " ")
                 except:
                     pass
-    
-    def check_control_file(self):
-        """Check control file for external commands"""
-        if self.control_file and os.path.exists(self.control_file):
+                return False
+        return True
+
+    def deliver(self, transcripts):
+        """Type new text in as few injections as possible and apply revisions in order"""
+        batch = []
+        for transcript in transcripts + [None]:
+            if transcript is not None and transcript.revision == "refined":
+                # Draft not typed yet: just type the refined text in its place
+                draft = next((i for i, t in enumerate(batch) if t.utterance_id == transcript.utterance_id), None)
+                if draft is not None:
+                    batch[draft] = transcript._replace(revision=None)
+                    continue
+            elif transcript is not None:
+                batch.append(transcript)
+                continue
+            if batch:
+                self.type_transcripts(batch)
+                batch = []
+            if transcript is not None:
+                self.apply_revision(transcript)
+
+    def type_transcripts(self, transcripts):
+        """Type transcripts in one injection, remembering drafts so they can be revised"""
+        pieces = [" " + t.text.strip() if t.text.strip() else "" for t in transcripts]
+        if self.type_text("".join(pieces)) and self.two_pass:
+            for transcript, piece in zip(transcripts, pieces):
+                self.revisable.typed(transcript.utterance_id if transcript.revision == "draft" else None, piece)
+
+    def apply_revision(self, transcript):
+        """Replace a typed draft with the refined text by retyping only the changed suffix
+
+        If the draft was never typed (it was dropped on the way), the refined text is typed as new text.
+        """
+        text = " " + transcript.text.strip() if transcript.text.strip() else ""
+        edit = self.revisable.revise(transcript.utterance_id, text)
+        if edit is None:
+            print(f"Too late to refine: '{transcript.text}'")
+            return
+        erase, insert = edit
+        if not erase and not insert:
+            return
+        try:
+            with tracing.span("revise", erase=erase, chars=len(insert)):
+                self.output.erase(erase)
+                if insert:
+                    self.output.emit(insert)
+            self.revisions.inc()
+            print(f"Refined: {transcript.text}")
+        except Exception as e:
+            print(f"Error refining text: {e}")
+
+    def handle_command(self, command, message):
+        """Handle a command pushed over the control socket"""
+        if command == "start":
+            self.start_capture()
+        elif command == "stop" and self.daemon:
+            self.stop_capture()
+        elif command in ("stop", "shutdown"):
+            print("Stop requested by controller")
+            self.terminate = True
+        elif command == "pause":
+            self.paused = True
+        elif command == "resume":
+            self.paused = False
+        elif command == "trace":
+            threading.Thread(target=self.dump_trace, args=("control",), daemon=True).start()
+        elif command == "profile":
+            self.start_profile(float(message.get("seconds", 10)))
+        else:
+            print(f"Unknown control command: {command}")
+        self.publish_status()
+
+    def start_capture(self):
+        """Open the microphone again (the model is reloaded if it was evicted)"""
+        print("Capture started by controller")
+        self.paused = False
+        self.capturing = True
+        self.last_used = time.time()
+        self.retry_at = 0.0  # A failed model load is retried right away
+        self.ensure_model()
+
+    def stop_capture(self):
+        """Close the microphone but keep the model (and grammar server) warm"""
+        print("Capture stopped by controller; model stays loaded")
+        self.capturing = False
+
+    def dump_trace(self, reason, profile_events=()):
+        """Write the flight recorder (and any profile samples) to a new trace file; returns its path"""
+        kind = "profile" if profile_events else "trace"
+        try:
+            path = tracing.write_trace(tracing.trace_path(self.trace_dir, kind),
+                                       tracing.RECORDER.events() + list(profile_events), reason=reason,
+                                       status=self.current_status(), quality=self.quality.current()["name"],
+                                       metrics=self.metrics_summary())
+        except OSError as e:
+            print(f"Could not write trace: {e}")
+            return None
+        print(f"Trace written to {path} ({reason})")
+        if self.control:
+            self.control.broadcast({"event": "trace", "path": path, "reason": reason})
+        return path
+
+    def start_profile(self, seconds=10.0):
+        """Sample every thread's stack for a while in the background, then write a trace"""
+        if not self.profiling.acquire(blocking=False):
+            print("A profile is already being recorded")
+            return
+
+        def run():
+            try:
+                print(f"Profiling for {seconds:.0f}s...")
+                events = tracing.SamplingProfiler().run(seconds)
+                self.dump_trace("profile", events)
+            finally:
+                self.profiling.release()
+
+        threading.Thread(target=run, name="profiler", daemon=True).start()
+
+    def publish_status(self):
+        """Push the current status to the GUI (only sent if it changed)"""
+        if self.control:
+            load_time = round(self.model_load_seconds, 1) if self.model_load_seconds is not None else None
+            self.control.publish_status(self.current_status(), quality=self.quality.current()["name"],
+                                        model=self.model_state(), load_time=load_time, error=self.model_error)
+
+    def filter_transcript(self, raw_text, filter_fragments=True):
+        """Filter out noise and fragments; returns the text worth typing or None"""
+        if not raw_text:
+            return None
+
+        # Filter out short fragments and noise
+        # More intelligent filtering:
+        # 1. At least 2 words OR contains meaningful punctuation
+        # 2. Length of at least 5 characters
+        # (Streaming commits are already stable across two decodes, so single
+        # words are let through there.)
+        words = raw_text.split()
+        has_meaningful_punct = any(p in raw_text for p in '.!?')
+        is_meaningful = (not filter_fragments or len(words) >= 2 or len(raw_text.strip()) >= 5
+                         or has_meaningful_punct)
+
+        # Additional check: don't type if it's just repetitions
+        stripped_text = raw_text.strip()
+        if not is_meaningful or self.is_repetition(stripped_text):
+            # Skip short fragments, repetitions, or likely noise
+            print(f"Skipped: '{raw_text}'")
+            self.skipped_transcripts.inc()
+            return None
+
+        print(f"Raw: {raw_text}")
+        return raw_text
+
+    # Pipeline stages: capture (audio_callback -> ring buffer) -> segmentation ->
+    # ASR -> post-processing -> output. Each stage runs on its own thread and
+    # hands work to the next through a BoundedQueue, so a slow stage only fills
+    # (and, per the overflow policy, blocks, drops or merges) its own input queue.
+
+    def count_utterances(self, utterances, raw=False):
+        """Count utterances found in the (possibly denoised) signal, or in the raw one"""
+        utterances = [u for u in utterances if u is not None]
+        counter, seconds = ((self.raw_utterances, self.raw_speech_seconds) if raw
+                            else (self.vad_utterances, self.vad_speech_seconds))
+        counter.inc(len(utterances))
+        seconds.inc(sum(len(u.audio) for u in utterances) / self.sample_rate)
+
+    def suppress_noise(self, start, audio):
+        """Denoise a block read at absolute position start; returns (position, audio) for the segmenter
+
+        The output lags the input by suppressor.delay samples, so it is labelled
+        with the position it came from and utterance positions stay exact.
+        """
+        if start != self.raw_segmenter.position:
+            self.raw_segmenter.seek(start)
+        self.count_utterances(self.raw_segmenter.push(audio), raw=True)
+        if start != self.suppressor.position:
+            self.suppressor.seek(start)
+        with self.denoise_seconds.time(), tracing.span("denoise", samples=len(audio)):
+            audio = self.suppressor.process(audio)
+        return start - self.suppressor.delay, audio
+
+    def noise_suppression_report(self):
+        """Utterances and speech seconds with and without noise suppression (None if it is off)"""
+        if not self.suppressor:
+            return None
+        return {
+            "utterances": int(self.vad_utterances.get()),
+            "raw_utterances": int(self.raw_utterances.get()),
+            "speech_seconds": round(self.vad_speech_seconds.get(), 2),
+            "raw_speech_seconds": round(self.raw_speech_seconds.get(), 2),
+            "open_fraction": round(self.suppressor.open_fraction or 0.0, 3),
+        }
+
+    def segmentation_worker(self):
+        """Stage 2: cut captured audio into speech chunks with the VAD"""
+        frame_size = self.vad.frame_size
+        step_size = int(self.sample_rate * self.streaming_step)
+        fed = 0  # Samples of the in-progress utterance already sent on (streaming mode)
+
+        while not self.terminate:
             try:
-                with open(self.control_file, 'r') as f:
-                    command = f.read().strip()
-                    if command == "stopped":
-                        self.terminate = True
-                    elif command == "pause":
-                        self.paused = True
-                    elif command == "resume" or command == "running":
-                        self.paused = False
+                # Skip processing if paused or capture is closed (speech before that is still transcribed)
+                if self.paused or not self.capturing:
+                    # Segment what was captured up to the pause first, so the last word is not cut off
+                    if self.audio_buffer.available():
+                        fed = self.segment_captured(fed, step_size)
+                    utterance = self.segmenter.flush()
+                    self.count_utterances([utterance])
+                    if self.raw_segmenter:
+                        self.count_utterances([self.raw_segmenter.flush()], raw=True)
+                    if utterance is not None:
+                        self.speech_queue.put(SpeechChunk(utterance.audio[fed:], True, utterance.end_sample,
+                                                          utterance.start_sample + fed))
+                    fed = 0
+                    time.sleep(0.1)
+                    continue
+
+                # Wait for at least one VAD frame of new audio
+                if not self.audio_buffer.wait(frame_size, timeout=0.1):
+                    continue
+                fed = self.segment_captured(fed, step_size)
+
             except Exception as e:
-                print(f"Error reading control file: {e}")
+                print(f"Error in segmentation stage: {e}")
+                self.segmenter.reset()
+                fed = 0
+                time.sleep(0.1)
+
+    def segment_captured(self, fed, step_size):
+        """Segment everything captured so far; returns the samples of the current utterance already sent on"""
+        # Zero-copy view of everything captured so far; non-speech is dropped here.
+        # A jump in position means audio was cleared or overrun in between.
+        self.report_capture_status()
+        with self.capture_seconds.time():
+            start, audio = self.audio_buffer.read_indexed()
+            tracing.instant("capture", samples=len(audio), position=start)
+            if self.recorder:
+                self.recorder.write(start, audio)  # The recording keeps the raw signal
+        if self.suppressor:
+            start, audio = self.suppress_noise(start, audio)
+        if start != self.segmenter.position:
+            self.segmenter.seek(start)
+        with self.gating_seconds.time(), tracing.span("segment", samples=len(audio)):
+            utterances = self.segmenter.push(audio)
+        self.count_utterances(utterances)
+        for utterance in utterances:
+            if self.recorder:
+                self.recorder.mark_utterance(utterance.start_sample, utterance.end_sample)
+            if self.debug_audio_dir:
+                self.dump_debug_audio(utterance.audio)
+            # The speaker stopped: hand on the (rest of the) utterance right away
+            self.speech_queue.put(SpeechChunk(utterance.audio[fed:], True, utterance.end_sample,
+                                              utterance.start_sample + fed))
+            fed = 0
+
+        # Streaming: also send partial speech once every step while still speaking
+        if self.streaming and self.segmenter.active:
+            current = self.segmenter.current()
+            if len(current) - fed >= step_size:
+                start = self.segmenter.processed - len(current) + fed
+                self.speech_queue.put(SpeechChunk(current[fed:].copy(), False, self.segmenter.processed,
+                                                  start))
+                fed = len(current)
+        return fed
+
+    def asr_worker(self):
+        """Stage 3: decode speech chunks (waits for the model; chunks queue up meanwhile)"""
+        while not self.terminate:
+            try:
+                # Take everything queued so a backlog is caught up in as few decodes as possible
+                chunks = self.speech_queue.get_all(timeout=0.1)
+            except queue.Empty:
+                continue
 
-    def write_status(self, status):
-        """Write current status to status file"""
-        if self.status_file:
             try:
-                with open(self.status_file, 'w') as f:
-                    f.write(status)
+                if self.two_pass and self.draft_model is not None:
+                    # Two-pass: type a fast draft now, the refine stage re-decodes with the main model
+                    for chunk in chunks:
+                        self.draft_chunk(chunk)
+                    continue
+
+                # Hold the model for the whole batch; it is reloaded first if it was evicted
+                with self.model_lock:
+                    if self.wait_for_model():
+                        self.decode_chunks(chunks)
+                    elif self.model_error:
+                        print(f"Dropping {len(chunks)} speech chunk(s): the model is not available")
+                    self.last_used = time.time()
+
             except Exception as e:
-                print(f"Error writing status file: {e}")
+                print(f"Error in ASR stage: {e}")
+                self.streamer.reset()
+            finally:
+                self.speech_queue.task_done(len(chunks))
 
-    def process_audio_chunks(self):
-        """Process audio chunks as they become available"""
-        accumulated_audio = np.array([])
+    def decode_chunks(self, chunks):
+        """Decode a batch of speech chunks with the main model"""
+        if not self.streaming:
+            for i, chunk in enumerate(chunks):
+                raw_text = self.transcribe_audio(chunk.audio)
+                self.transcript_queue.put(Transcript(raw_text, True, chunk.end_sample,
+                                                     start_sample=chunk.start_sample))
+                self.adapt_quality(len(chunks) - i - 1 + self.speech_queue.qsize())
+            return
 
+        for chunk in chunks:
+            self.streamer.insert_audio(chunk.audio)
+            if chunk.final:
+                self.transcript_queue.put(Transcript(self.streamer.finish(), False, chunk.end_sample,
+                                                     start_sample=chunk.start_sample))
+        if not chunks[-1].final:
+            self.transcript_queue.put(Transcript(self.streamer.process_iter(), False, chunks[-1].end_sample,
+                                                 start_sample=chunks[-1].start_sample))
+        self.adapt_quality(self.speech_queue.qsize())
+
+    def draft_chunk(self, chunk):
+        """Two-pass: greedy decode with the draft model, then queue the chunk for refinement"""
+        utterance_id = next(self.utterance_ids)
+        duration = round(len(chunk.audio) / self.sample_rate, 2)
+        with self.draft_seconds.time(), tracing.span("draft decode", seconds=duration):
+            segments = self.draft_model.transcribe(chunk.audio, language="en", beam_size=1, best_of=1,
+                                                   temperature=0.0)
+            text = " ".join(seg.text for seg in segments).strip()
+        self.transcript_queue.put(Transcript(text, True, chunk.end_sample, utterance_id, "draft",
+                                             chunk.start_sample))
+        self.refine_queue.put(RefineJob(chunk.audio, chunk.end_sample, utterance_id, chunk.start_sample))
+
+    def refine_worker(self):
+        """Stage 3b (two-pass mode): re-decode drafted utterances with the main model"""
         while not self.terminate:
             try:
-                # Check for external control commands
-                self.check_control_file()
+                job = self.refine_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            try:
+                with self.model_lock:
+                    if not self.wait_for_model():
+                        continue
+                    raw_text = self.transcribe_audio(job.audio)
+                    self.last_used = time.time()
+                self.transcript_queue.put(Transcript(raw_text, True, job.end_sample, job.utterance_id, "refined",
+                                                     job.start_sample))
+                self.adapt_quality(self.refine_queue.qsize())
+            except Exception as e:
+                print(f"Error in refine stage: {e}")
+            finally:
+                self.refine_queue.task_done()
 
-                # Get audio data from queue
-                audio_chunk = self.audio_queue.get(timeout=0.1)
+    def postprocess_worker(self):
+        """Stage 4: filter noise and correct grammar"""
+        while not self.terminate:
+            try:
+                # Consecutive utterances that queued up are checked in one request
+                transcripts = self.transcript_queue.get_all(timeout=0.1)
+            except queue.Empty:
+                continue
 
-                # Skip processing if paused
-                if self.paused:
-                    self.write_status("paused")
+            taken = len(transcripts)
+            try:
+                transcripts = [t._replace(text=self.filter_transcript(t.text, t.filter_fragments) or "")
+                               for t in transcripts]
+                # Drafts and refinements go on even when filtered out, so typed drafts can still be revised
+                if self.recorder:
+                    for transcript in transcripts:
+                        if not (transcript.text or transcript.revision):
+                            self.recorder.mark_handled(transcript, "filtered")
+                transcripts = [t for t in transcripts if t.text or t.revision]
+                if not transcripts:
                     continue
 
-                self.write_status("running")
-                
-                # Accumulate audio data
-                accumulated_audio = np.concatenate([accumulated_audio, audio_chunk.flatten()])
-                
-                # Process when we have enough audio data
-                if len(accumulated_audio) >= self.chunk_size:
-                    # Calculate volume (RMS) to check if there's enough speech content
-                    rms = np.sqrt(np.mean(accumulated_audio**2))
-                    
-                    # Only process if the audio level is above the threshold
-                    if rms > self.silence_threshold:
-                        # Save the accumulated audio as a temporary file
-                        temp_filename = os.path.join(self.temp_dir, f"chunk_{int(time.time())}.wav")
-                        self.save_audio_chunk(accumulated_audio, temp_filename)
-                        
-                        try:
-                            # Transcribe the audio
-                            raw_text = self.transcribe_audio(temp_filename)
-                            
-                            if raw_text:
-                                # Filter out short fragments and noise
-                                # More intelligent filtering:
-                                # 1. At least 2 words OR contains meaningful punctuation
-                                # 2. Length of at least 5 characters
-                                words = raw_text.split()
-                                has_meaningful_punct = any(p in raw_text for p in '.!?')
-                                is_meaningful = (len(words) >= 2 or len(raw_text.strip()) >= 5 or has_meaningful_punct)
-                                
-                                # Additional check: don't type if it's just repetitions
-                                stripped_text = raw_text.strip()
-                                if is_meaningful and not self.is_repetition(stripped_text):
-                                    print(f"Raw: {raw_text}")
-                                    
-                                    # Correct grammar
-                                    corrected_text = self.correct_grammar(raw_text)
-                                    if corrected_text != raw_text:
-                                        print(f"Corrected: {corrected_text}")
-                                    
-                                    # Type the text (prefer corrected, fallback to raw)
-                                    text_to_type = corrected_text if corrected_text else raw_text
-                                    
-                                    # Add a small delay to allow for processing
-                                    time.sleep(0.05)
-                                    
-                                    # Type the text
-                                    self.type_text(text_to_type)
-                                else:
-                                    # Skip short fragments, repetitions, or likely noise
-                                    print(f"Skipped: '{raw_text}'")
-                                    
-                        except Exception as e:
-                            print(f"Error processing audio chunk: {e}")
-                        
-                        # Remove temporary file
-                        try:
-                            os.remove(temp_filename)
-                        except:
-                            pass  # File might not exist or be in use
-                    else:
-                        print("Skipped low-volume chunk")  # Debug info
-                    
-                    # Reset accumulated audio to only keep the overflow
-                    overflow_size = len(accumulated_audio) - self.chunk_size
-                    if overflow_size > 0:
-                        accumulated_audio = accumulated_audio[-overflow_size:]
-                    else:
-                        accumulated_audio = np.array([])
-                
+                texts = [t.text for t in transcripts if t.text]
+                if self.use_grammar_correction and texts:
+                    with self.grammar_seconds.time():
+                        corrected = iter(self.correct_grammar(texts))
+                else:
+                    corrected = iter(texts)
+                for transcript in transcripts:
+                    corrected_text = next(corrected) if transcript.text else ""
+                    if corrected_text != transcript.text:
+                        print(f"Corrected: {corrected_text}")
+                    # Type the text (prefer corrected, fallback to raw)
+                    self.output_queue.put(transcript._replace(text=corrected_text or transcript.text))
+            except Exception as e:
+                print(f"Error in post-processing stage: {e}")
+            finally:
+                self.transcript_queue.task_done(taken)
+
+    def output_worker(self):
+        """Stage 5: type the text, coalescing utterances that arrive close together"""
+        while not self.terminate:
+            try:
+                transcripts = self.output_queue.get_all(timeout=0.1)
             except queue.Empty:
                 continue
-    
+
+            # Anything that follows within the coalescing window goes out in the same injection
+            try:
+                transcripts += self.output_queue.get_all(timeout=self.coalesce_window)
+            except queue.Empty:
+                pass
+
+            try:
+                with self.typing_seconds.time():
+                    self.deliver(transcripts)
+                typed_at = time.time()
+                latencies = [max(0.0, typed_at - self.speech_end_time(t.end_sample))
+                             for t in transcripts if t.revision != "refined"]
+                for latency in latencies:
+                    self.latency_seconds.observe(latency)
+                if latencies:
+                    tracing.instant("typed", latency=round(max(latencies), 3), transcripts=len(transcripts))
+                    self.check_latency_spike(max(latencies))
+                if self.recorder:
+                    for transcript in transcripts:
+                        self.recorder.mark_transcript(transcript)
+                if self.on_typed:
+                    self.on_typed(transcripts, typed_at)
+            except Exception as e:
+                print(f"Error in output stage: {e}")
+            finally:
+                self.output_queue.task_done(len(transcripts))
+
+    def check_latency_spike(self, latency):
+        """Write a trace of what led up to a slow transcript (at most one a minute)"""
+        if not self.trace_spike or latency < self.trace_spike or time.time() - self.last_spike_trace < 60:
+            return
+        self.last_spike_trace = time.time()
+        threading.Thread(target=self.dump_trace, args=(f"latency spike of {latency:.1f}s",), daemon=True).start()
+
+    def metrics_worker(self):
+        """Periodically rewrite the metrics file and push the summary to the GUI"""
+        while not self.terminate:
+            time.sleep(self.metrics_interval)
+            self.export_metrics()
+
+    def export_metrics(self):
+        if self.metrics_file:
+            try:
+                self.metrics.write_textfile(self.metrics_file)
+            except OSError as e:
+                print(f"Error writing metrics: {e}")
+        if self.control:
+            self.control.publish(dict(self.metrics_summary(), event="metrics"))
+
+    def current_status(self):
+        """Status string reported to the GUI"""
+        if self.terminate:
+            return "stopped"
+        if not self.capturing:
+            return "idle"
+        if self.paused:
+            return "paused"
+        if self.model_loading:
+            return "loading"
+        return "error" if self.model_error and not self.model_ready.is_set() else "running"
+
+    def start_pipeline(self, capture=True):
+        """Start the stage threads; without capture, audio is fed through audio_callback by the caller"""
+        stages = [
+            ("segmentation", self.segmentation_worker),
+            ("asr", self.asr_worker),
+            ("postprocess", self.postprocess_worker),
+            ("output", self.output_worker),
+        ]
+        if capture:
+            stages.insert(0, ("capture", self.record_audio))
+        if self.metrics_file or self.control:
+            stages.append(("metrics", self.metrics_worker))
+        if self.idle_unload:
+            stages.append(("residency", self.residency_worker))
+        if self.two_pass:
+            stages.insert(stages.index(("asr", self.asr_worker)) + 1, ("refine", self.refine_worker))
+        # Capture thread plus one worker thread per pipeline stage
+        self.threads = [threading.Thread(target=target, name=name) for name, target in stages]
+        for thread in self.threads:
+            thread.start()
+
+    def shutdown(self):
+        """Stop every stage and release the listener, output, grammar server and socket"""
+        self.terminate = True
+        for stage_queue in (self.speech_queue, self.refine_queue, self.transcript_queue, self.output_queue):
+            stage_queue.close()
+
+        # Wait for threads to finish
+        for thread in self.threads:
+            thread.join()
+
+        # Stop the keyboard listener, the output and the grammar server
+        if self.listener:
+            self.listener.stop()
+        self.output.close()
+        if self.use_grammar_correction:
+            self.grammar.close()
+        if self.recorder:
+            self.recorder.close()
+        report = self.noise_suppression_report()
+        if report:
+            print(f"Noise suppression: {report['utterances']} utterances ({report['speech_seconds']} s) decoded, "
+                  f"{report['raw_utterances']} ({report['raw_speech_seconds']} s) without it")
+
+        # Final snapshot, then stop serving
+        if self.metrics_file:
+            self.export_metrics()
+        self.metrics.close()
+
+        if self.control:
+            self.publish_status()
+            self.control.close()
+
     def start(self):
         """Start the live speech to text system"""
         print("Starting Live Speech to Text System...")
         print("Press Ctrl+C to stop the system")
-        
-        # Start recording thread
-        recording_thread = threading.Thread(target=self.record_audio)
-        recording_thread.start()
-        
-        # Start processing thread
-        processing_thread = threading.Thread(target=self.process_audio_chunks)
-        processing_thread.start()
-        
+        self.start_pipeline()
+
+        # SIGTERM stops as gracefully as Ctrl+C or a "stop" command
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, "terminate", True))
+        # SIGUSR1 writes the flight recorder to a trace file, SIGUSR2 profiles for 10 seconds first
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+            target=self.dump_trace, args=("SIGUSR1",), daemon=True).start())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.start_profile())
+        self.publish_status()
+
         try:
             # Keep the main thread alive
-            while True:
+            while not self.terminate:
                 time.sleep(0.1)
         except KeyboardInterrupt:
-            print("\nStopping the system...")
-            self.terminate = True
-            
-            # Wait for threads to finish
-            recording_thread.join()
-            processing_thread.join()
-            
-            # Stop the keyboard listener
-            self.listener.stop()
-            
-            # Clean up temporary directory
-            import shutil
-            shutil.rmtree(self.temp_dir)
-            
-            print("System stopped.")
+            pass
+
+        print("\nStopping the system...")
+        self.shutdown()
+        print("System stopped.")
 
 if __name__ == "__main__":
+    import argparse
     import sys
 
-    # Check if grammar correction should be enabled (default to True if not specified)
-    use_grammar = True
-    control_file = None
+    # "transcribe FILES..." runs bulk file transcription instead of live dictation
+    if len(sys.argv) > 1 and sys.argv[1] == "transcribe":
+        import batch_transcribe
+        sys.exit(batch_transcribe.main(sys.argv[2:]))
+    # "serve" shares one model between several dictation clients
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        import server
+        sys.exit(server.main(sys.argv[2:]))
+    # "replay SESSION" transcribes a recorded session again
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        import recorder
+        sys.exit(recorder.main(sys.argv[2:]))
 
-    if len(sys.argv) > 1:
-        if sys.argv[1].lower() in ['false', '0', 'no', 'off']:
-            use_grammar = False
+    parser = argparse.ArgumentParser(description="Live speech to text dictation")
+    # Positional argument kept for compatibility with older launchers
+    parser.add_argument("grammar", nargs="?", default="true",
+                        help="Enable grammar correction (false/0/no/off to disable)")
+    parser.add_argument("--control-socket", nargs="?", const=DEFAULT_SOCKET, default=None,
+                        help=f"Unix socket for GUI control and status (default path: {DEFAULT_SOCKET})")
+    parser.add_argument("--debug-audio-dir", default=None,
+                        help="Also write every transcribed chunk as a WAV file into this directory")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Type words incrementally from overlapping re-decodes instead of fixed chunks")
+    parser.add_argument("--streaming-step", type=float, default=0.4,
+                        help="Seconds of new audio between streaming re-decodes (default: 0.4)")
+    parser.add_argument("--profile", default=None,
+                        help="Hardware profile: " + ", ".join(profiles.PROFILES) +
+                             " or 'auto' (default: cuda-large with a GPU, else cpu-small)")
+    parser.add_argument("--autotune", action="store_true",
+                        help="Re-measure real-time factor and pick the best profile for this host")
+    parser.add_argument("--autotune-clip", default=None,
+                        help="Audio file to autotune on (default: a synthetic clip)")
+    parser.add_argument("--list-profiles", action="store_true", help="Print the hardware profiles and exit")
+    parser.add_argument("--input-device", default=None,
+                        help="Microphone by index or (part of its) name (default: the system default)")
+    parser.add_argument("--list-devices", action="store_true", help="Print the input devices and exit")
+    parser.add_argument("--capture-rate", type=int, default=None,
+                        help="Capture sample rate (default: the device's own; converted to 16 kHz internally)")
+    parser.add_argument("--capture-channels", type=int, default=None,
+                        help="Channels to capture and average (default: the device's, at most 2)")
+    parser.add_argument("--blocksize", type=int, default=0,
+                        help="Frames per capture callback (default: 0, let the audio system choose)")
+    parser.add_argument("--latency", default=None,
+                        help="Input latency: low, high or seconds (default: the audio system's choice)")
+    parser.add_argument("--backend", default="faster-whisper", choices=list(BACKENDS),
+                        help="Speech recognizer (default: faster-whisper); whisper.cpp and vosk are cheaper on CPU")
+    parser.add_argument("--model", default=None,
+                        help="Override the profile's model size (for vosk: a model directory or name)")
+    parser.add_argument("--device", default=None, choices=["cpu", "cuda", "auto"],
+                        help="Override the profile's device")
+    parser.add_argument("--compute-type", default=None,
+                        help="Override the profile's compute type (int8, int8_float16, float16, float32)")
+    parser.add_argument("--cpu-threads", type=int, default=None, help="Override the profile's CPU threads")
+    parser.add_argument("--num-workers", type=int, default=None, help="Override the profile's decoder workers")
+    parser.add_argument("--beam-size", type=int, default=None, help="Override the profile's beam size")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="Capacity of each queue between pipeline stages (default: 8)")
+    parser.add_argument("--overflow-policy", default="merge", choices=OVERFLOW_POLICIES,
+                        help="What a full stage queue does with new work (default: merge)")
+    parser.add_argument("--grammar-budget", type=float, default=0.25,
+                        help="Seconds grammar correction may delay typing before raw text is typed (default: 0.25)")
+    parser.add_argument("--output", default=None, choices=list(OUTPUT_BACKENDS),
+                        help="How text is delivered: type (xdotool/wtype, one call per utterance), "
+                             "clipboard (paste, restoring the clipboard), uinput (virtual keyboard), "
+                             "keys (per-character pynput) or file (default: type if available, else keys)")
+    parser.add_argument("--output-file", default="-",
+                        help="File to append text to with --output file ('-' for stdout)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running with the model loaded when a controller stops capture "
+                             "(the 'shutdown' command exits)")
+    parser.add_argument("--idle-unload", type=float, default=0,
+                        help="Unload the model after this many seconds without speech; it is reloaded "
+                             "on demand (default: 0, never)")
+    parser.add_argument("--record", nargs="?", const=DEFAULT_RECORD_DIRECTORY, default=None, metavar="DIR",
+                        help="Keep the captured speech and transcripts on disk for replay and recovery "
+                             f"(default directory: {DEFAULT_RECORD_DIRECTORY})")
+    parser.add_argument("--record-format", default="int16", choices=list(SAMPLE_FORMATS),
+                        help="Sample format of recordings (default: int16)")
+    parser.add_argument("--record-segment-minutes", type=float, default=10.0,
+                        help="Start a new recording file after this much audio (default: 10)")
+    parser.add_argument("--record-segment-mb", type=float, default=64.0,
+                        help="...or once a recording file reaches this size (default: 64)")
+    parser.add_argument("--draft-model", default=None,
+                        help="Two-pass mode: type a fast draft from this small model (e.g. tiny or base) "
+                             "and correct it with the main model's result")
+    parser.add_argument("--fixed-quality", action="store_true",
+                        help="Always decode at full quality, even when transcription falls behind")
+    parser.add_argument("--fallback-model", default=None,
+                        help="Smaller model (e.g. tiny) to switch to as a last resort under heavy load")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Periodically write Prometheus metrics to this file (node_exporter textfile format)")
+    parser.add_argument("--trace-dir", default=tracing.DEFAULT_DIRECTORY,
+                        help="Where trace files go (kill -USR1 for the recent events, kill -USR2 to profile "
+                             f"for 10 s; default: {tracing.DEFAULT_DIRECTORY})")
+    parser.add_argument("--trace-spike", type=float, default=None, metavar="SECONDS",
+                        help="Also write a trace whenever text is typed this long after the speech ended")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--server", nargs="?", const=DEFAULT_SERVER_SOCKET, default=None, metavar="SOCKET",
+                        help="Transcribe on a shared 'live_speech_to_text.py serve' process instead of loading "
+                             f"a model here (default socket: {DEFAULT_SERVER_SOCKET})")
+    parser.add_argument("--vad-margin", type=float, default=10.0,
+                        help="dB above the tracked noise floor that counts as speech (default: 10)")
+    parser.add_argument("--min-silence", type=float, default=0.5,
+                        help="Seconds of silence that end an utterance (default: 0.5)")
+    parser.add_argument("--denoise", action="store_true",
+                        help="Suppress steady background noise (fans, hum) before the VAD, so it does not "
+                             "trigger decodes; the decodes saved are logged at exit and in the metrics")
+    args = parser.parse_args()
+    if args.streaming and (args.server or not BACKENDS[args.backend].word_timestamps):
+        parser.error(f"--streaming needs word timestamps, which {'--server' if args.server else args.backend} "
+                     "does not provide")
 
-    # Check if control file path is provided (for GUI control)
-    if len(sys.argv) > 2:
-        control_file = sys.argv[2]
+    if args.list_devices:
+        for index, device in input_devices():
+            print(f"{index:3} {device['name']:40} {device['max_input_channels']} ch, "
+                  f"{device['default_samplerate']:.0f} Hz")
+        raise SystemExit(0)
+    latency = args.latency
+    if latency not in (None, "low", "high"):
+        try:
+            latency = float(latency)
+        except ValueError:
+            parser.error("--latency must be low, high or a number of seconds")
+
+    if args.list_profiles:
+        for name, settings in profiles.PROFILES.items():
+            print(f"{name:18} " + " ".join(f"{k}={v}" for k, v in settings.items()))
+        raise SystemExit(0)
+
+    # Pick the hardware profile (optionally measured on this host)
+    profile_name = args.profile
+    if args.autotune or profile_name == "auto":
+        profile_name = profiles.autotune(clip=args.autotune_clip, use_cache=not args.autotune)
+    profile = profiles.resolve_profile(
+        profile_name, model_size=args.model, device=args.device, compute_type=args.compute_type,
+        cpu_threads=args.cpu_threads, num_workers=args.num_workers, beam_size=args.beam_size)
+
+    # Check if grammar correction should be enabled (default to True if not specified)
+    use_grammar = args.grammar.lower() not in ['false', '0', 'no', 'off']
 
     # Create and start the live speech to text system
     print("=== Live Speech to Text System ===")
@@ -374,8 +1361,10 @@ if __name__ == "__main__":
     print("  - Speak normally for automatic transcription")
     print("  - Press Ctrl+Shift+Space to pause/resume")
     print("  - Press Ctrl+C to exit")
-    if control_file:
-        print(f"  - Control file: {control_file}")
+    if args.control_socket:
+        print(f"  - Control socket: {args.control_socket}")
+    if args.debug_audio_dir:
+        print(f"  - Debug audio dump: {args.debug_audio_dir}")
     print("")
 
     print("Initializing system...")
@@ -386,10 +1375,44 @@ if __name__ == "__main__":
     else:
         print("Grammar correction: DISABLED")
 
-    print(f"Audio chunk duration: 2 seconds (for responsiveness)")
+    if args.streaming:
+        print(f"Streaming mode: re-decoding every {args.streaming_step} seconds")
+        if args.draft_model:
+            print("Two-pass mode is not available in streaming mode; --draft-model is ignored")
+    else:
+        print(f"Utterances end after {args.min_silence} seconds of silence")
+        if args.draft_model:
+            print(f"Two-pass mode: drafts from the {args.draft_model} model are refined in place")
+    session_recorder = None
+    if args.record:
+        session_recorder = SessionRecorder(args.record, sample_format=args.record_format,
+                                           segment_seconds=args.record_segment_minutes * 60,
+                                           segment_bytes=int(args.record_segment_mb * 2 ** 20))
+        print(f"Recording session to {session_recorder.directory}")
+    model = None
+    if args.server:
+        # The server picks the decoding settings, so quality is not adapted here
+        model = RemoteBackend(args.server)
+        print(f"Transcribing on the shared server at {args.server}")
     print("")
     print("Starting Live Speech to Text System...")
     print("Speak now! (System is active)")
 
-    speech_system = LiveSpeechToText(use_grammar_correction=use_grammar, control_file=control_file)
-    speech_system.start()
\ No newline at end of file
+    speech_system = LiveSpeechToText(use_grammar_correction=use_grammar, control_socket=args.control_socket,
+                                     debug_audio_dir=args.debug_audio_dir,
+                                     streaming=args.streaming, streaming_step=args.streaming_step,
+                                     vad_margin_db=args.vad_margin, min_silence=args.min_silence,
+                                     profile=profile, queue_size=args.queue_size,
+                                     overflow_policy=args.overflow_policy,
+                                     grammar_budget=args.grammar_budget,
+                                     output=args.output, output_file=args.output_file,
+                                     metrics_file=args.metrics_file, metrics_port=args.metrics_port,
+                                     adaptive_quality=not args.fixed_quality, model=model, backend=args.backend,
+                                     fallback_model=args.fallback_model,
+                                     daemon=args.daemon, idle_unload=args.idle_unload,
+                                     draft_model=args.draft_model, recorder=session_recorder,
+                                     input_device=args.input_device, capture_rate=args.capture_rate,
+                                     capture_channels=args.capture_channels, blocksize=args.blocksize,
+                                     latency=latency, noise_suppression=args.denoise,
+                                     trace_dir=args.trace_dir, trace_spike=args.trace_spike)
+    speech_system.start()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Load test for the shared transcription server (live_speech_to_text.py serve)
+
+Simulates N concurrent speakers: each client streams an audio file at real
+time (or --speed) in capture-sized blocks, like a microphone would, and
+records when each transcript comes back. Several client counts can be run
+in one go to see how throughput and latency scale:
+
+    python3 loadtest.py recordings/*.wav --clients 1,2,4,8
+    python3 loadtest.py sample.wav --clients 1,4,16 --stub --stub-rtf 0.3
+
+Without --socket an in-process server is started (with the profile's model,
+or the fake backend with --stub), so no running server is needed.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import profiles
+from backends import BACKENDS, FakeBackend, create_backend
+from benchmark import load_audio, percentiles, captured_at, SAMPLE_RATE
+from control import LineReader
+from pipeline import OVERFLOW_POLICIES
+from server import TranscriptionServer, send_frame, encode_audio, HELLO, AUDIO, END
+
+
+def run_speaker(path, audio, name, args, start_delay, results):
+    """Stream one file as one client; appends its result dict to results"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(args.socket)
+    received = []
+    done = threading.Event()
+
+    def read():
+        reader = LineReader()
+        while not done.is_set():
+            data = sock.recv(65536)
+            if not data:
+                break
+            for message in reader.feed(data):
+                received.append((message, time.time()))
+                if message.get("event") in ("done", "error"):
+                    done.set()
+        done.set()
+
+    reader_thread = threading.Thread(target=read, daemon=True)
+    reader_thread.start()
+    send_frame(sock, HELLO, json.dumps({"name": name}).encode("utf-8"))
+
+    time.sleep(start_delay)
+    audio = np.concatenate([audio, np.zeros(int(args.tail_silence * SAMPLE_RATE), dtype=np.float32)])
+    feed_log = []
+    start = time.perf_counter()
+    for offset in range(0, len(audio), args.block_size):
+        if args.speed > 0:
+            delay = start + offset / SAMPLE_RATE / args.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        block = audio[offset:offset + args.block_size]
+        send_frame(sock, AUDIO, encode_audio(block))
+        feed_log.append((offset + len(block), time.time()))
+    send_frame(sock, END)
+    done.wait(args.timeout)
+    sock.close()
+
+    transcripts = [(m, t) for m, t in received if m.get("event") == "transcript"]
+    summary = next((m for m, _ in received if m.get("event") == "done"), {})
+    results.append({
+        "client": name,
+        "file": path,
+        "audio_seconds": len(audio) / SAMPLE_RATE,
+        "utterances": len(transcripts),
+        "latencies": [t - captured_at(feed_log, m["end_sample"]) for m, t in transcripts],
+        "queued": [m["queued"] for m, _ in transcripts],
+        "batches": [m["batch"] for m, _ in transcripts],
+        "dropped": summary.get("dropped", 0),
+        "complete": bool(summary),
+    })
+
+
+def run_level(clients, audios, args):
+    """Run `clients` simultaneous speakers; returns the summary for this level"""
+    results = []
+    threads = []
+    rng = np.random.default_rng(clients)
+    wall_start = time.perf_counter()
+    for i in range(clients):
+        path, audio = audios[i % len(audios)]
+        # Stagger the starts so speakers do not pause in lockstep
+        delay = float(rng.uniform(0, args.stagger)) if args.stagger else 0.0
+        thread = threading.Thread(target=run_speaker, args=(path, audio, f"speaker-{i + 1}", args, delay, results),
+                                  daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+
+    latencies = [latency for r in results for latency in r["latencies"]]
+    audio_seconds = sum(r["audio_seconds"] for r in results)
+    batches = [size for r in results for size in r["batches"]]
+    summary = {
+        "clients": clients,
+        "utterances": len(latencies),
+        "audio_seconds": audio_seconds,
+        "wall_seconds": wall,
+        "throughput": audio_seconds / wall if wall else None,  # Seconds of audio handled per second
+        "mean_batch": float(np.mean(batches)) if batches else None,
+        "mean_queued": float(np.mean([q for r in results for q in r["queued"]])) if batches else None,
+        "dropped": sum(r["dropped"] for r in results),
+        "incomplete": sum(not r["complete"] for r in results),
+        # Spread between the best and worst served speaker (fairness)
+        "client_p50_spread": (max(np.median(r["latencies"]) for r in results if r["latencies"])
+                              - min(np.median(r["latencies"]) for r in results if r["latencies"])) if latencies else None,
+    }
+    summary.update(percentiles(latencies))
+    return summary, results
+
+
+def print_table(levels):
+    columns = ("clients", "utterances", "throughput", "latency_p50", "latency_p95", "latency_max", "mean_batch",
+               "mean_queued", "client_p50_spread", "dropped")
+    print("  ".join(f"{c:>12}" for c in columns))
+    for summary in levels:
+        cells = []
+        for column in columns:
+            value = summary.get(column)
+            cells.append(f"{value:>12.3f}" if isinstance(value, float) else f"{str(value):>12}")
+        print("  ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent speakers against the transcription server")
+    parser.add_argument("files", nargs="+", help="Audio files, assigned to the speakers in turn")
+    parser.add_argument("--clients", default="1,2,4,8",
+                        help="Comma-separated numbers of simultaneous speakers to test (default: 1,2,4,8)")
+    parser.add_argument("--socket", default=None, help="Server to test (default: start one in-process)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Feed speed as a multiple of real time; 0 = as fast as possible (default: 1)")
+    parser.add_argument("--stagger", type=float, default=1.0,
+                        help="Start the speakers at random times within this many seconds (default: 1)")
+    parser.add_argument("--block-size", type=int, default=512, help="Samples per audio frame sent")
+    parser.add_argument("--tail-silence", type=float, default=1.5)
+    parser.add_argument("--timeout", type=float, default=600.0,
+                        help="Seconds to wait for the last transcripts of a speaker")
+    parser.add_argument("--backend", default="faster-whisper", choices=list(BACKENDS),
+                        help="Speech recognizer of the in-process server (default: faster-whisper)")
+    parser.add_argument("--stub", action="store_true", help="In-process server with the deterministic fake backend")
+    parser.add_argument("--stub-rtf", type=float, default=0.0, help="Simulated real-time factor of the stub model")
+    parser.add_argument("--profile", default=None, help="Hardware profile: " + ", ".join(profiles.PROFILES))
+    parser.add_argument("--model", default=None, help="Override the profile's model size")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--batch-window", type=float, default=0.02)
+    parser.add_argument("--max-queue", type=int, default=4)
+    parser.add_argument("--overflow-policy", default="drop-oldest", choices=OVERFLOW_POLICIES)
+    parser.add_argument("--pcm-rate", type=int, default=SAMPLE_RATE, help="Sample rate of raw PCM input")
+    parser.add_argument("--json", default=None, help="Write machine-readable results to this file ('-' for stdout)")
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.clients.split(",") if n.strip()]
+    audios = [(path, load_audio(path, args.pcm_rate)) for path in args.files]
+
+    server = None
+    if args.socket is None:
+        args.socket = os.path.join(tempfile.mkdtemp(prefix="wis-loadtest-"), "server.sock")
+        if args.stub:
+            model = FakeBackend(rtf=args.stub_rtf)
+        else:
+            profile = profiles.resolve_profile(args.profile, model_size=args.model)
+            print(f"Loading {args.backend} model: {profile['model_size']} ({profile['name']})")
+            model = create_backend(args.backend, profile)
+        server = TranscriptionServer(model, args.socket, batch_size=args.batch_size, batch_window=args.batch_window,
+                                     max_queue=args.max_queue, overflow_policy=args.overflow_policy)
+        server.start()
+
+    summaries = []
+    details = []
+    try:
+        for clients in levels:
+            print(f"Running {clients} speaker(s) at {'max speed' if args.speed <= 0 else f'{args.speed}x'} ...")
+            summary, results = run_level(clients, audios, args)
+            summaries.append(summary)
+            details.append(results)
+    finally:
+        if server:
+            server.close()
+            print(f"Server: {server.stats()}")
+
+    print()
+    print_table(summaries)
+
+    if args.json:
+        results = {"settings": {k: v for k, v in vars(args).items() if k not in ("files", "json")},
+                   "levels": summaries, "clients": details}
+        if args.json == "-":
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {args.json}")
+    return 1 if any(s["incomplete"] for s in summaries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
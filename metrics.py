@@ -0,0 +1,200 @@
+import bisect
+import collections
+import http.server
+import os
+import threading
+import time
+
+# Latency buckets in seconds: from sub-millisecond callback work up to slow decodes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, incremented here or read from an existing counter at export time"""
+
+    kind = "counter"
+
+    def __init__(self, labels=None, function=None):
+        self.labels = labels or {}
+        self.function = function
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def get(self):
+        return self.function() if self.function else self.value
+
+    def samples(self, name):
+        yield name + "_total" + _format_labels(self.labels), self.get()
+
+
+class Gauge:
+    """Current value, either set explicitly or read from a function at export time"""
+
+    kind = "gauge"
+
+    def __init__(self, labels=None, function=None):
+        self.labels = labels or {}
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.function() if self.function else self.value
+
+    def samples(self, name):
+        yield name + _format_labels(self.labels), self.get()
+
+
+class Histogram:
+    """Cumulative-bucket histogram; also keeps the most recent observations for summaries"""
+
+    kind = "histogram"
+
+    def __init__(self, labels=None, buckets=DEFAULT_BUCKETS, recent=128):
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = collections.deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def time(self):
+        """Context manager observing the duration of a block"""
+        return _Timer(self)
+
+    def last(self):
+        """Most recent observation (None before the first)"""
+        with self._lock:
+            return self.recent[-1] if self.recent else None
+
+    def recent_mean(self):
+        with self._lock:
+            return sum(self.recent) / len(self.recent) if self.recent else None
+
+    def samples(self, name):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            yield name + "_bucket" + _format_labels(dict(self.labels, le=_format_value(bound))), cumulative
+        yield name + "_sum" + _format_labels(self.labels), total
+        yield name + "_count" + _format_labels(self.labels), count
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Collection of named metrics, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.families = {}  # name -> (help, kind, {labels tuple: metric})
+        self._lock = threading.Lock()
+        self.http_server = None
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            _, kind, metrics = self.families.setdefault(name, (help_text, cls.kind, {}))
+            if kind != cls.kind:
+                raise ValueError(f"Metric '{name}' is already registered as a {kind}")
+            if key not in metrics:
+                metrics[key] = cls(labels=labels, **kwargs)
+            return metrics[key]
+
+    def counter(self, name, help_text, labels=None, function=None):
+        return self._get(Counter, name, help_text, labels, function=function)
+
+    def gauge(self, name, help_text, labels=None, function=None):
+        return self._get(Gauge, name, help_text, labels, function=function)
+
+    def histogram(self, name, help_text, labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        """All metrics as Prometheus text"""
+        lines = []
+        with self._lock:
+            families = [(name, help_text, kind, list(metrics.values()))
+                        for name, (help_text, kind, metrics) in sorted(self.families.items())]
+        for name, help_text, kind, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                for sample_name, value in metric.samples(name):
+                    if value is not None:
+                        lines.append(f"{sample_name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Atomically (re)write a file for node_exporter's textfile collector"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve /metrics over HTTP on a local port from a daemon thread"""
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes would flood the engine log
+
+        self.http_server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.http_server.daemon_threads = True
+        threading.Thread(target=self.http_server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def close(self):
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
@@ -0,0 +1,358 @@
+import collections
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+
+class OutputBackend:
+    """Delivers typed text to the user; one emit() call per (coalesced) piece of text"""
+
+    name = None
+
+    def emit(self, text):
+        raise NotImplementedError
+
+    def backspace(self, count):
+        """Delete count characters before the cursor"""
+        raise NotImplementedError(f"The '{self.name}' output cannot delete text")
+
+    def erase(self, text):
+        """Remove text that was just emitted (used to revise a draft)"""
+        if text:
+            self.backspace(len(text))
+
+    def close(self):
+        pass
+
+
+class KeystrokeBackend(OutputBackend):
+    """Per-character key presses through pynput (the original behaviour; slowest)"""
+
+    name = "keys"
+
+    def __init__(self):
+        from pynput import keyboard
+        self.keyboard = keyboard.Controller()
+
+    def emit(self, text):
+        # Handle typing with proper Unicode support
+        # Split the text into individual characters to handle Unicode better
+        for char in text:
+            try:
+                self.keyboard.press(char)
+                self.keyboard.release(char)
+            except (self.keyboard.InvalidCharacterException, self.keyboard.InvalidKeyException):
+                # If character cannot be typed, skip it
+                continue
+
+    def backspace(self, count):
+        from pynput.keyboard import Key
+        for _ in range(count):
+            self.keyboard.press(Key.backspace)
+            self.keyboard.release(Key.backspace)
+
+
+class TypeBackend(OutputBackend):
+    """Inject the whole string with one xdotool (X11) or wtype (Wayland) call"""
+
+    name = "type"
+
+    def __init__(self):
+        if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wtype"):
+            self.command = ["wtype", "-"]
+        elif shutil.which("xdotool"):
+            self.command = ["xdotool", "type", "--clearmodifiers", "--delay", "0", "--file", "-"]
+        else:
+            raise RuntimeError("The 'type' output needs xdotool (X11) or wtype (Wayland)")
+
+    def emit(self, text):
+        subprocess.run(self.command, input=text.encode("utf-8"), check=True, timeout=30)
+
+    def backspace(self, count):
+        if not count:
+            return
+        if self.command[0] == "wtype":
+            command = ["wtype"] + ["-k", "BackSpace"] * count
+        else:
+            command = ["xdotool", "key", "--clearmodifiers", "--delay", "0", "--repeat", str(count), "BackSpace"]
+        subprocess.run(command, check=True, timeout=30)
+
+
+class ClipboardBackend(OutputBackend):
+    """Paste through the clipboard, restoring whatever was on it before
+
+    If the clipboard was empty (or could not be read) it is cleared again, so
+    the dictated text never stays on it.
+    pynput cannot press keys in native Wayland windows, so there the paste
+    shortcut (and backspace) go through wtype or ydotool instead.
+    """
+
+    name = "clipboard"
+
+    # wtype takes X keysym names, ydotool Linux input event codes
+    WTYPE_KEYS = {"backspace": "BackSpace", "insert": "Insert"}
+    YDOTOOL_KEYS = {"ctrl": 29, "shift": 42, "alt": 56, "super": 125, "insert": 110, "backspace": 14, "v": 47}
+
+    def __init__(self, paste_keys=("ctrl", "v"), restore_delay=0.15):
+        wayland = bool(os.environ.get("WAYLAND_DISPLAY"))
+        if wayland and shutil.which("wl-copy"):
+            self.copy_command = ["wl-copy"]
+            self.paste_command = ["wl-paste", "--no-newline"]
+            self.clear_command = ["wl-copy", "--clear"]
+        elif shutil.which("xclip"):
+            self.copy_command = ["xclip", "-selection", "clipboard", "-in"]
+            self.paste_command = ["xclip", "-selection", "clipboard", "-out"]
+            self.clear_command = None  # Copying empty input leaves an empty clipboard
+        elif shutil.which("xsel"):
+            self.copy_command = ["xsel", "--clipboard", "--input"]
+            self.paste_command = ["xsel", "--clipboard", "--output"]
+            self.clear_command = ["xsel", "--clipboard", "--clear"]
+        else:
+            raise RuntimeError("The 'clipboard' output needs wl-clipboard, xclip or xsel")
+        self.paste_keys = list(paste_keys)
+        self.restore_delay = restore_delay
+
+        self.keyboard = None
+        if wayland and shutil.which("wtype"):
+            self.key_tool = "wtype"
+        elif wayland and shutil.which("ydotool"):
+            self.key_tool = "ydotool"
+            unknown = [k for k in self.paste_keys if k not in self.YDOTOOL_KEYS]
+            if unknown:
+                raise RuntimeError(f"The 'clipboard' output cannot press {', '.join(unknown)} with ydotool")
+        elif wayland:
+            raise RuntimeError("On Wayland the 'clipboard' output needs wtype or ydotool to paste")
+        else:
+            from pynput import keyboard
+            self.key_tool = None
+            self.keyboard = keyboard.Controller()
+            self.Key = keyboard.Key
+
+    def _read_clipboard(self):
+        try:
+            result = subprocess.run(self.paste_command, capture_output=True, timeout=2)
+            return result.stdout if result.returncode == 0 else None
+        except Exception:
+            return None
+
+    def _write_clipboard(self, data):
+        subprocess.run(self.copy_command, input=data, check=True, timeout=2)
+
+    def _press(self, keys, count=1):
+        """Press a key combination count times (the last key with the others held down)"""
+        *modifiers, key = keys
+        if self.key_tool == "wtype":
+            command = ["wtype"]
+            for modifier in modifiers:
+                command += ["-M", modifier]
+            command += ["-k", self.WTYPE_KEYS.get(key, key)] * count
+            for modifier in reversed(modifiers):
+                command += ["-m", modifier]
+        elif self.key_tool == "ydotool":
+            codes = [self.YDOTOOL_KEYS[k] for k in keys]
+            events = [f"{code}:1" for code in codes] + [f"{code}:0" for code in reversed(codes)]
+            command = ["ydotool", "key"] + events * count
+        else:
+            keys = [getattr(self.Key, k, k) for k in keys]
+            for _ in range(count):
+                for k in keys:
+                    self.keyboard.press(k)
+                for k in reversed(keys):
+                    self.keyboard.release(k)
+            return
+        subprocess.run(command, check=True, timeout=30)
+
+    def emit(self, text):
+        previous = self._read_clipboard()
+        self._write_clipboard(text.encode("utf-8"))
+        self._press(self.paste_keys)
+
+        # Give the focused application time to read the clipboard before restoring it
+        time.sleep(self.restore_delay)
+        if previous is not None:
+            self._write_clipboard(previous)
+        elif self.clear_command:
+            subprocess.run(self.clear_command, check=True, timeout=2)
+        else:
+            self._write_clipboard(b"")
+
+    def backspace(self, count):
+        if count:
+            self._press(["backspace"], count)
+
+
+class UinputBackend(OutputBackend):
+    """Virtual keyboard through /dev/uinput (python-evdev); works without X or Wayland
+
+    Only characters of the US keyboard layout can be typed; others are skipped.
+    """
+
+    name = "uinput"
+
+    def __init__(self):
+        from evdev import UInput, ecodes
+        self.ecodes = ecodes
+        self.keymap = self._build_keymap(ecodes)
+        keys = {code for code, _ in self.keymap.values()} | {ecodes.KEY_LEFTSHIFT, ecodes.KEY_BACKSPACE}
+        self.device = UInput({ecodes.EV_KEY: sorted(keys)}, name="wis-virtual-keyboard")
+
+    @staticmethod
+    def _build_keymap(e):
+        keymap = {}
+        for c in "abcdefghijklmnopqrstuvwxyz":
+            code = getattr(e, f"KEY_{c.upper()}")
+            keymap[c] = (code, False)
+            keymap[c.upper()] = (code, True)
+        for c, shifted in zip("1234567890", "!@#$%^&*()"):
+            keymap[c] = (getattr(e, f"KEY_{c}"), False)
+            keymap[shifted] = (getattr(e, f"KEY_{c}"), True)
+        for plain, shifted, name in [("-", "_", "MINUS"), ("=", "+", "EQUAL"), ("[", "{", "LEFTBRACE"),
+                                     ("]", "}", "RIGHTBRACE"), (";", ":", "SEMICOLON"),
+                                     ("'", '"', "APOSTROPHE"), ("`", "~", "GRAVE"), ("\\", "|", "BACKSLASH"),
+                                     (",", "<", "COMMA"), (".", ">", "DOT"), ("/", "?", "SLASH")]:
+            keymap[plain] = (getattr(e, f"KEY_{name}"), False)
+            keymap[shifted] = (getattr(e, f"KEY_{name}"), True)
+        keymap[" "] = (e.KEY_SPACE, False)
+        keymap["\n"] = (e.KEY_ENTER, False)
+        keymap["\t"] = (e.KEY_TAB, False)
+        return keymap
+
+    def emit(self, text):
+        e = self.ecodes
+        # Queue every event, then sync once per key so the kernel sees whole key strokes
+        for char in text:
+            if char not in self.keymap:
+                continue
+            code, shift = self.keymap[char]
+            if shift:
+                self.device.write(e.EV_KEY, e.KEY_LEFTSHIFT, 1)
+            self.device.write(e.EV_KEY, code, 1)
+            self.device.write(e.EV_KEY, code, 0)
+            if shift:
+                self.device.write(e.EV_KEY, e.KEY_LEFTSHIFT, 0)
+            self.device.syn()
+
+    def backspace(self, count):
+        e = self.ecodes
+        for _ in range(count):
+            self.device.write(e.EV_KEY, e.KEY_BACKSPACE, 1)
+            self.device.write(e.EV_KEY, e.KEY_BACKSPACE, 0)
+            self.device.syn()
+
+    def close(self):
+        self.device.close()
+
+
+class FileBackend(OutputBackend):
+    """Append text to a file, or to stdout for '-' (no keyboard involved)"""
+
+    name = "file"
+
+    def __init__(self, path="-"):
+        self.stream = sys.stdout if path == "-" else open(path, "a", encoding="utf-8")
+
+    def emit(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+    def erase(self, text):
+        if not text:
+            return
+        if self.stream is sys.stdout:
+            # Terminal: step back, blank out, step back again
+            self.stream.write("\b" * len(text) + " " * len(text) + "\b" * len(text))
+            self.stream.flush()
+            return
+        self.stream.flush()
+        fd = self.stream.fileno()
+        os.ftruncate(fd, max(0, os.fstat(fd).st_size - len(text.encode("utf-8"))))
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class RevisableText:
+    """Tracks the text typed since the oldest utterance that may still be revised
+
+    Draft utterances are recorded with a key; ``revise`` swaps in the final
+    text for one of them and returns the minimal edit for the text already on
+    screen: what to erase from the end and what to type instead. Drafts older
+    than ``max_age`` seconds, or followed by more than ``max_chars`` of text,
+    are no longer revised (the cursor has most likely moved on). A draft that
+    was never typed (e.g. dropped from a full queue) has its final text typed
+    as new text instead.
+    """
+
+    def __init__(self, max_age=15.0, max_chars=400):
+        self.max_age = max_age
+        self.max_chars = max_chars
+        self.segments = []  # [key or None, typed text, typed at]
+        self.expired = collections.deque(maxlen=64)  # Keys of drafts trimmed before their revision came
+
+    def typed(self, key, text):
+        """Record text just typed; key is None for text that will never be revised"""
+        if key is None and not self.segments:
+            return  # Nothing pending revision: no need to remember it
+        self.segments.append([key, text, time.time()])
+        self._trim()
+
+    def revise(self, key, text):
+        """Replace a draft; returns (text to erase, text to type) or None if it is too late to revise"""
+        self._trim()
+        if key in self.expired:
+            self.expired.remove(key)
+            return None
+        segment = next((s for s in self.segments if s[0] == key), None)
+        if segment is None:
+            self.typed(None, text)
+            return "", text
+        old = "".join(s[1] for s in self.segments)
+        segment[0], segment[1] = None, text
+        new = "".join(s[1] for s in self.segments)
+        self._trim()
+
+        common = 0
+        for a, b in zip(old, new):
+            if a != b:
+                break
+            common += 1
+        return old[common:], new[common:]
+
+    def _trim(self):
+        now = time.time()
+        while self.segments:
+            key, _, typed_at = self.segments[0]
+            tail = sum(len(s[1]) for s in self.segments)
+            if key is not None and now - typed_at <= self.max_age and tail <= self.max_chars:
+                break
+            if key is not None:
+                self.expired.append(key)
+            self.segments.pop(0)
+
+
+OUTPUT_BACKENDS = {cls.name: cls for cls in
+                   (KeystrokeBackend, TypeBackend, ClipboardBackend, UinputBackend, FileBackend)}
+
+
+def default_output_name():
+    """Fastest backend that works out of the box: a single-call injector if installed"""
+    if (os.environ.get("WAYLAND_DISPLAY") and shutil.which("wtype")) or shutil.which("xdotool"):
+        return "type"
+    return "keys"
+
+
+def create_output(name=None, output_file="-"):
+    """Instantiate an output backend by name, falling back to per-key typing"""
+    name = name or default_output_name()
+    if name == "file":
+        return FileBackend(output_file)
+    try:
+        return OUTPUT_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown output '{name}' (choose from: {', '.join(OUTPUT_BACKENDS)})")
+    except Exception as e:
+        print(f"Output '{name}' not available ({e}); falling back to per-key typing")
+        return KeystrokeBackend()
@@ -0,0 +1,186 @@
+import collections
+import queue
+import threading
+import numpy as np
+
+import tracing
+
+OVERFLOW_POLICIES = ("block", "drop-oldest", "merge")
+
+# Items passed between pipeline stages.
+# end_sample is the absolute capture position (in samples) where the speech ended and
+# start_sample where it began, so a merged item still covers every utterance in it.
+# In two-pass mode a Transcript is a "draft" or its "refined" revision of the
+# utterance identified by utterance_id; revision is None otherwise.
+SpeechChunk = collections.namedtuple("SpeechChunk", "audio final end_sample start_sample", defaults=(None,))
+Transcript = collections.namedtuple("Transcript",
+                                    "text filter_fragments end_sample utterance_id revision start_sample",
+                                    defaults=(None, None, None))
+RefineJob = collections.namedtuple("RefineJob", "audio end_sample utterance_id start_sample", defaults=(None,))
+
+
+class BoundedQueue:
+    """Thread-safe bounded FIFO between two pipeline stages.
+
+    When the queue is full, ``put`` follows the overflow policy:
+
+    - ``block``: wait for the consumer (classic backpressure)
+    - ``drop-oldest``: discard the oldest queued item
+    - ``merge``: fold the new item into the newest queued one with ``merge``;
+      if that returns None (e.g. the result would be too large) the oldest
+      item is dropped instead
+
+    Whatever the policy, an item that ``replace`` accepts in place of a queued
+    one (a revision of a queued draft) takes that item's place, and items for
+    which ``keep`` is true are only dropped when nothing else is queued.
+
+    Like ``queue.Queue``, consumers call ``task_done`` once they have handled
+    what they took, so ``join`` can wait until the stage is idle. Puts and gets
+    are noted in the flight recorder with the resulting depth.
+    """
+
+    def __init__(self, name, maxsize=8, policy="block", merge=None, replace=None, keep=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}' (choose from: {', '.join(OVERFLOW_POLICIES)})")
+        if policy == "merge" and merge is None:
+            raise ValueError("The merge overflow policy needs a merge function")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.merge = merge
+        self.replace = replace
+        self.keep = keep
+        self.items = collections.deque()
+        self.closed = False
+        self.unfinished = 0  # Queued or taken but not yet marked done
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+
+        # Statistics
+        self.dropped = 0
+        self.merged = 0
+        self.high_watermark = 0
+
+    def qsize(self):
+        """Number of queued items"""
+        with self._lock:
+            return len(self.items)
+
+    def put(self, item):
+        """Queue an item according to the overflow policy; returns False once the queue is closed"""
+        with self._lock:
+            if self.closed:
+                return False
+            if self.replace:
+                for i, queued in enumerate(self.items):
+                    replacement = self.replace(queued, item)
+                    if replacement is not None:
+                        self.items[i] = replacement
+                        self.merged += 1
+                        tracing.instant("put", queue=self.name, depth=len(self.items), replaced=True)
+                        self._not_empty.notify()
+                        return True
+            if len(self.items) >= self.maxsize:
+                if self.policy == "block":
+                    with tracing.span("put blocked", queue=self.name):
+                        while len(self.items) >= self.maxsize and not self.closed:
+                            self._not_full.wait(0.1)
+                    if self.closed:
+                        return False
+                else:
+                    merged = None
+                    if self.policy == "merge" and self.items:
+                        merged = self.merge(self.items[-1], item)
+                    if merged is not None:
+                        self.items[-1] = merged
+                        self.merged += 1
+                        tracing.instant("put", queue=self.name, depth=len(self.items), merged=True)
+                        self._not_empty.notify()
+                        return True
+                    victim = next((i for i, queued in enumerate(self.items)
+                                   if not (self.keep and self.keep(queued))), 0)
+                    del self.items[victim]
+                    self.dropped += 1
+                    self.unfinished -= 1
+                    tracing.instant("drop", queue=self.name)
+            self.items.append(item)
+            self.unfinished += 1
+            self.high_watermark = max(self.high_watermark, len(self.items))
+            tracing.instant("put", queue=self.name, depth=len(self.items))
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout=None):
+        """Take the oldest item; raises queue.Empty on timeout or when closed and drained"""
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self.items or self.closed, timeout) or not self.items:
+                raise queue.Empty
+            item = self.items.popleft()
+            tracing.instant("get", queue=self.name, depth=len(self.items))
+            self._not_full.notify()
+            return item
+
+    def get_all(self, timeout=None):
+        """Take every queued item at once (waiting for at least one)"""
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self.items or self.closed, timeout) or not self.items:
+                raise queue.Empty
+            items = list(self.items)
+            self.items.clear()
+            tracing.instant("get", queue=self.name, items=len(items))
+            self._not_full.notify_all()
+            return items
+
+    def task_done(self, n=1):
+        """Mark n taken items as fully handled"""
+        with self._lock:
+            self.unfinished = max(0, self.unfinished - n)
+            if not self.unfinished:
+                self._all_done.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every queued item has been handled; returns False on timeout"""
+        with self._lock:
+            return self._all_done.wait_for(lambda: not self.unfinished or self.closed, timeout)
+
+    def close(self):
+        """Wake up all producers and consumers; further puts are refused"""
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            self._all_done.notify_all()
+
+
+def merge_speech(max_samples):
+    """Merge function for SpeechChunk queues: concatenate audio up to max_samples"""
+    def merge(older, newer):
+        if len(older.audio) + len(newer.audio) > max_samples:
+            return None
+        return SpeechChunk(np.concatenate([older.audio, newer.audio]), newer.final, newer.end_sample,
+                           older.start_sample)
+    return merge
+
+
+def merge_transcripts(older, newer):
+    """Merge function for Transcript queues: join the texts (drafts and revisions stay separate)"""
+    if older.revision or newer.revision:
+        return None
+    return Transcript(older.text.rstrip() + " " + newer.text.lstrip(),
+                      older.filter_fragments and newer.filter_fragments,
+                      newer.end_sample, start_sample=older.start_sample)
+
+
+def replace_draft(queued, transcript):
+    """Replace function for Transcript queues: a refinement takes the place of its untyped draft"""
+    if (transcript.revision == "refined" and queued.revision == "draft"
+            and queued.utterance_id == transcript.utterance_id):
+        return transcript._replace(revision=None, start_sample=queued.start_sample)
+    return None
+
+
+def is_two_pass(transcript):
+    """Keep function for Transcript queues: drop plain text before drafts and refinements"""
+    return transcript.revision is not None
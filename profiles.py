@@ -0,0 +1,171 @@
+import json
+import os
+import platform
+import time
+import numpy as np
+
+# Hardware profiles, ordered from most to least accurate.
+# cpu_threads of 0 lets CTranslate2 pick its default; None means default_cpu_threads().
+PROFILES = {
+    "cuda-large": dict(model_size="large", device="cuda", compute_type="float16",
+                       cpu_threads=0, num_workers=1, beam_size=5),
+    "cuda-large-int8": dict(model_size="large", device="cuda", compute_type="int8_float16",
+                            cpu_threads=0, num_workers=1, beam_size=5),
+    "cuda-medium-int8": dict(model_size="medium", device="cuda", compute_type="int8_float16",
+                             cpu_threads=0, num_workers=1, beam_size=5),
+    "cpu-medium": dict(model_size="medium", device="cpu", compute_type="int8",
+                       cpu_threads=None, num_workers=1, beam_size=5),
+    "cpu-small": dict(model_size="small", device="cpu", compute_type="int8",
+                      cpu_threads=None, num_workers=1, beam_size=5),
+    "cpu-base-float32": dict(model_size="base", device="cpu", compute_type="float32",
+                             cpu_threads=None, num_workers=1, beam_size=5),
+    "cpu-base": dict(model_size="base", device="cpu", compute_type="int8",
+                     cpu_threads=None, num_workers=1, beam_size=3),
+    "cpu-tiny": dict(model_size="tiny", device="cpu", compute_type="int8",
+                     cpu_threads=None, num_workers=1, beam_size=1),
+}
+
+AUTOTUNE_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "wis", "autotune.json")
+
+
+def cuda_available():
+    """True if CTranslate2 can see a CUDA device"""
+    try:
+        import ctranslate2
+        return ctranslate2.get_cuda_device_count() > 0
+    except Exception:
+        return False
+
+
+def default_cpu_threads():
+    """Threads for CPU decoding: all cores, leaving one for capture and typing"""
+    return max(1, min(8, (os.cpu_count() or 2) - 1))
+
+
+def host_profiles():
+    """Profile names usable on this host, most accurate first"""
+    has_cuda = cuda_available()
+    return [name for name, p in PROFILES.items() if p["device"] != "cuda" or has_cuda]
+
+
+def default_profile_name():
+    """Profile used when none is requested: the old GPU setup if possible, else CPU int8"""
+    return "cuda-large" if cuda_available() else "cpu-small"
+
+
+def resolve_profile(name=None, **overrides):
+    """Return the settings dict for a profile, with non-None overrides applied"""
+    name = name or default_profile_name()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile '{name}' (choose from: {', '.join(PROFILES)})")
+    profile = dict(PROFILES[name], name=name)
+    profile.update({k: v for k, v in overrides.items() if v is not None})
+    if profile["cpu_threads"] is None:
+        profile["cpu_threads"] = default_cpu_threads()
+    return profile
+
+
+def load_model(profile):
+    """Create the WhisperModel described by a profile"""
+    from faster_whisper import WhisperModel
+    return WhisperModel(
+        profile["model_size"],
+        device=profile["device"],
+        compute_type=profile["compute_type"],
+        cpu_threads=profile["cpu_threads"],
+        num_workers=profile["num_workers"]
+    )
+
+
+def synthetic_clip(duration=8.0, sample_rate=16000, seed=0):
+    """Speech-like test signal: voiced harmonics with syllable-rate envelope and pitch glides"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.7 * t) + 10 * rng.standard_normal() * np.sin(2 * np.pi * 3.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None) ** 0.5
+    audio = 0.1 * voiced * envelope + 0.005 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def measure_rtf(model, audio, beam_size, sample_rate=16000):
+    """Real-time factor (decode time / audio duration) of one full transcription"""
+    start = time.perf_counter()
+    segments, info = model.transcribe(audio, language="en", beam_size=beam_size, vad_filter=False)
+    for _ in segments:
+        pass
+    return (time.perf_counter() - start) / (len(audio) / sample_rate)
+
+
+def _host_key():
+    return f"{platform.node()}/{os.cpu_count()}/{'cuda' if cuda_available() else 'cpu'}"
+
+
+def load_cached_autotune():
+    """Return the profile name autotune picked for this host earlier, or None"""
+    try:
+        with open(AUTOTUNE_CACHE, 'r') as f:
+            return json.load(f).get(_host_key(), {}).get("profile")
+    except Exception:
+        return None
+
+
+def autotune(clip=None, target_rtf=0.5, sample_rate=16000, use_cache=True):
+    """Pick the most accurate profile that keeps up with real time on this host
+
+    Profiles of each device are tried from the cheapest up; the search stops at
+    the first one whose real-time factor exceeds target_rtf (leaving headroom
+    for re-decodes). The result is cached per host.
+    """
+    if use_cache:
+        cached = load_cached_autotune()
+        if cached in PROFILES:
+            print(f"Autotune: using cached profile '{cached}'")
+            return cached
+
+    if clip is None:
+        audio = synthetic_clip(sample_rate=sample_rate)
+    elif isinstance(clip, str):
+        from faster_whisper import decode_audio
+        audio = decode_audio(clip, sampling_rate=sample_rate)
+    else:
+        audio = clip
+
+    candidates = host_profiles()
+    passing = []
+    results = {}
+    for device in ("cpu", "cuda"):
+        for name in reversed([n for n in candidates if PROFILES[n]["device"] == device]):
+            profile = resolve_profile(name)
+            try:
+                model = load_model(profile)
+                measure_rtf(model, audio[:sample_rate], profile["beam_size"], sample_rate)  # warm-up
+                rtf = measure_rtf(model, audio, profile["beam_size"], sample_rate)
+                del model
+            except Exception as e:
+                print(f"Autotune: {name} failed: {e}")
+                break
+            results[name] = rtf
+            print(f"Autotune: {name} real-time factor {rtf:.2f}")
+            if rtf > target_rtf:
+                break
+            passing.append(name)
+
+    # Most accurate passing profile, or the cheapest one if none keeps up
+    chosen = min(passing, key=candidates.index) if passing else candidates[-1]
+    print(f"Autotune: selected profile '{chosen}'")
+
+    try:
+        os.makedirs(os.path.dirname(AUTOTUNE_CACHE), exist_ok=True)
+        cache = {}
+        if os.path.exists(AUTOTUNE_CACHE):
+            with open(AUTOTUNE_CACHE, 'r') as f:
+                cache = json.load(f)
+        cache[_host_key()] = {"profile": chosen, "rtf": results, "target_rtf": target_rtf,
+                              "time": time.time()}
+        with open(AUTOTUNE_CACHE, 'w') as f:
+            json.dump(cache, f, indent=2)
+    except Exception as e:
+        print(f"Error writing autotune cache: {e}")
+    return chosen
@@ -0,0 +1,94 @@
+import threading
+
+# faster-whisper's default temperature fallback: decode greedily, and retry with
+# sampling at rising temperatures when the result looks like a hallucination
+DEFAULT_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+def build_levels(beam_size, fallback_model=None):
+    """Decoding settings from best quality (level 0) to cheapest
+
+    Each level lowers the cost of one decode: a narrower beam, fewer sampled
+    candidates (best_of) and fewer temperature-fallback retries, and finally,
+    if one is configured, a smaller model.
+    """
+    levels = [dict(name="full", beam_size=beam_size, best_of=5, temperature=DEFAULT_TEMPERATURES)]
+    if beam_size > 2:
+        levels.append(dict(name="reduced", beam_size=max(2, beam_size // 2), best_of=2,
+                           temperature=(0.0, 0.4, 0.8)))
+    if beam_size > 1:
+        levels.append(dict(name="greedy", beam_size=1, best_of=1, temperature=(0.0, 0.6)))
+    levels.append(dict(name="minimal", beam_size=1, best_of=1, temperature=0.0))
+    if fallback_model:
+        levels.append(dict(name=f"fallback-{fallback_model}", beam_size=1, best_of=1, temperature=0.0,
+                           model=fallback_model))
+    return levels
+
+
+class QualityController:
+    """Steps decoding quality down under load and back up when there is headroom.
+
+    After every decode, ``update`` is given the measured real-time factor and
+    the number of chunks still waiting for the model. Quality drops one level
+    after ``patience`` consecutive overloaded decodes (smoothed RTF above
+    ``step_down_rtf`` or ``max_backlog`` chunks waiting), and rises one level
+    after ``recovery`` consecutive relaxed ones (RTF below ``step_up_rtf`` and
+    nothing waiting). ``can_use(level)`` may veto a level, e.g. while its
+    model is still loading.
+    """
+
+    def __init__(self, levels, step_down_rtf=0.8, step_up_rtf=0.4, max_backlog=2, patience=2, recovery=6,
+                 smoothing=0.3, can_use=None):
+        self.levels = levels
+        self.step_down_rtf = step_down_rtf
+        self.step_up_rtf = step_up_rtf
+        self.max_backlog = max_backlog
+        self.patience = patience
+        self.recovery = recovery
+        self.smoothing = smoothing
+        self.can_use = can_use or (lambda level: True)
+
+        self.level = 0
+        self.rtf = None  # Smoothed real-time factor at the current level
+        self.overloaded = 0
+        self.relaxed = 0
+        self.changes = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Settings of the current level"""
+        return self.levels[self.level]
+
+    def update(self, rtf, backlog):
+        """Record one decode; returns True if the level changed"""
+        with self._lock:
+            if rtf is not None:
+                self.rtf = rtf if self.rtf is None else self.rtf + self.smoothing * (rtf - self.rtf)
+            smoothed = self.rtf or 0.0
+
+            if smoothed > self.step_down_rtf or backlog >= self.max_backlog:
+                self.overloaded += 1
+                self.relaxed = 0
+            elif smoothed < self.step_up_rtf and backlog == 0:
+                self.relaxed += 1
+                self.overloaded = 0
+            else:
+                self.overloaded = self.relaxed = 0
+
+            if self.overloaded >= self.patience:
+                return self._step(+1)
+            if self.relaxed >= self.recovery:
+                return self._step(-1)
+            return False
+
+    def _step(self, direction):
+        self.overloaded = self.relaxed = 0
+        target = self.level + direction
+        while 0 <= target < len(self.levels):
+            if self.can_use(self.levels[target]):
+                self.level = target
+                self.rtf = None  # Measure the new level afresh
+                self.changes += 1
+                return True
+            target += direction
+        return False
@@ -0,0 +1,291 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+import profiles
+
+SAMPLE_RATE = 16000
+
+# Segment file layout: a fixed 64-byte little-endian header followed by the raw
+# samples. The header's frame count is updated after every write, so a segment
+# left behind by a crash or a kill is readable up to the last complete block.
+MAGIC = b"WISREC1\0"
+HEADER = struct.Struct("<8sIIHHqdq")  # magic, header size, rate, channels, format, start sample, start time, frames
+HEADER_SIZE = 64
+FRAMES_OFFSET = HEADER.size - 8
+SAMPLE_FORMATS = {"int16": (1, np.dtype("<i2")), "float32": (2, np.dtype("<f4"))}
+FORMAT_CODES = {code: (name, dtype) for name, (code, dtype) in SAMPLE_FORMATS.items()}
+
+DEFAULT_DIRECTORY = os.path.expanduser("~/.local/share/wis/sessions")
+
+
+class SessionRecorder:
+    """Appends captured audio to preallocated, memory-mapped segment files
+
+    Each recording session is a directory with numbered segment files and an
+    ``index.jsonl`` of segments, utterance boundaries and transcripts. A segment
+    is rotated after ``segment_seconds`` of audio or ``segment_bytes`` on disk,
+    and whenever the audio is not contiguous (pause, buffer overrun).
+
+    Writing is a copy into the mapped pages: no system call per block, and the
+    kernel writes the data back even if the process is killed.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, sample_rate=SAMPLE_RATE, sample_format="int16",
+                 segment_seconds=600.0, segment_bytes=64 * 2 ** 20):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unknown sample format '{sample_format}' (choose from: {', '.join(SAMPLE_FORMATS)})")
+        self.sample_rate = sample_rate
+        self.sample_format = sample_format
+        self.format_code, self.dtype = SAMPLE_FORMATS[sample_format]
+        self.capacity = max(sample_rate, min(int(segment_seconds * sample_rate),
+                                             (segment_bytes - HEADER_SIZE) // self.dtype.itemsize))
+
+        self.directory = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = open(os.path.join(self.directory, "index.jsonl"), "a", encoding="utf-8", buffering=1)
+        self.segment_count = 0
+        self.segment_file = None
+        self.mmap = None
+        self.samples = None
+        self.frames = 0
+        self.next_sample = None
+        self.closed = False
+        self._lock = threading.Lock()
+        self._log(event="session", sample_rate=sample_rate, sample_format=sample_format)
+
+    def write(self, start_sample, audio):
+        """Record float32 mono samples whose first sample has the absolute index start_sample"""
+        with self._lock:
+            if self.closed:
+                return
+            offset = 0
+            while offset < len(audio):
+                if (self.samples is None or self.frames == self.capacity
+                        or start_sample + offset != self.next_sample):
+                    self._open_segment(start_sample + offset)
+                count = min(len(audio) - offset, self.capacity - self.frames)
+                block = audio[offset:offset + count]
+                if self.format_code == 1:
+                    block = np.clip(block, -1.0, 1.0) * 32767
+                self.samples[self.frames:self.frames + count] = block
+                self.frames += count
+                offset += count
+                self.next_sample = start_sample + offset
+                # Commit the new length only after the samples are in place
+                struct.pack_into("<q", self.mmap, FRAMES_OFFSET, self.frames)
+
+    def mark_utterance(self, start_sample, end_sample):
+        """Note where the VAD found an utterance"""
+        self._log(event="utterance", start_sample=int(start_sample), end_sample=int(end_sample))
+
+    def mark_transcript(self, transcript):
+        """Note the text typed for the audio from transcript.start_sample to transcript.end_sample"""
+        start = transcript.start_sample
+        self._log(event="transcript", start_sample=None if start is None else int(start),
+                  end_sample=int(transcript.end_sample), text=transcript.text, revision=transcript.revision)
+
+    def mark_handled(self, transcript, reason):
+        """Note audio that was dealt with without typing anything (e.g. filtered out as noise)"""
+        start = transcript.start_sample
+        self._log(event="handled", start_sample=None if start is None else int(start),
+                  end_sample=int(transcript.end_sample), reason=reason)
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self._close_segment()
+            self.closed = True
+        self.index.close()
+
+    def _log(self, **entry):
+        entry["time"] = round(time.time(), 3)
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if not self.closed:
+                self.index.write(line)
+
+    def _open_segment(self, start_sample):
+        self._close_segment()
+        self.segment_count += 1
+        name = f"segment-{self.segment_count:05d}.wisrec"
+        path = os.path.join(self.directory, name)
+        size = HEADER_SIZE + self.capacity * self.dtype.itemsize
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            # Reserve the blocks now so writes never wait for the filesystem to allocate
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, size)
+        self.segment_file = os.fdopen(fd, "r+b")
+        self.mmap = mmap.mmap(fd, size)
+        HEADER.pack_into(self.mmap, 0, MAGIC, HEADER_SIZE, self.sample_rate, 1, self.format_code,
+                         start_sample, time.time(), 0)
+        self.samples = np.frombuffer(self.mmap, dtype=self.dtype, offset=HEADER_SIZE)
+        self.frames = 0
+        self.next_sample = start_sample
+        line = json.dumps(dict(event="segment", file=name, start_sample=int(start_sample),
+                               time=round(time.time(), 3)))
+        self.index.write(line + "\n")
+
+    def _close_segment(self):
+        if self.mmap is None:
+            return
+        self.samples = None  # Release the buffer export before closing the map
+        self.mmap.flush()
+        self.mmap.close()
+        self.mmap = None
+        # Give back the unused preallocated tail
+        self.segment_file.truncate(HEADER_SIZE + self.frames * self.dtype.itemsize)
+        self.segment_file.close()
+        self.segment_file = None
+
+
+def read_header(path):
+    """Header fields of a segment file as a dict"""
+    with open(path, "rb") as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: not a recording segment")
+    magic, header_size, rate, channels, code, start_sample, start_time, frames = HEADER.unpack(data)
+    if magic != MAGIC or code not in FORMAT_CODES:
+        raise ValueError(f"{path}: not a recording segment")
+    # A segment that was not closed cleanly may claim more than the file holds
+    _, dtype = FORMAT_CODES[code]
+    stored = (os.path.getsize(path) - header_size) // (dtype.itemsize * channels)
+    return dict(path=path, header_size=header_size, sample_rate=rate, channels=channels,
+                sample_format=FORMAT_CODES[code][0], start_sample=start_sample, start_time=start_time,
+                frames=min(frames, stored))
+
+
+class RecordedSession:
+    """Read access to a recorded session directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.events = []
+        index_path = os.path.join(directory, "index.jsonl")
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.events.append(json.loads(line))
+                    except ValueError:
+                        break  # Torn last line after a crash
+        self.segments = sorted((read_header(os.path.join(directory, name))
+                                for name in os.listdir(directory) if name.endswith(".wisrec")),
+                               key=lambda segment: segment["start_sample"])
+        self.sample_rate = self.segments[0]["sample_rate"] if self.segments else SAMPLE_RATE
+
+    @property
+    def duration(self):
+        return sum(segment["frames"] for segment in self.segments) / self.sample_rate
+
+    def read(self, start_sample=None, end_sample=None):
+        """Recorded audio between two absolute sample indices as float32 (gaps are left out)"""
+        pieces = []
+        for segment in self.segments:
+            first = segment["start_sample"]
+            lo = max(0, (start_sample if start_sample is not None else first) - first)
+            hi = min(segment["frames"], (end_sample if end_sample is not None else first + segment["frames"]) - first)
+            if hi <= lo:
+                continue
+            dtype = SAMPLE_FORMATS[segment["sample_format"]][1]
+            data = np.fromfile(segment["path"], dtype=dtype, count=hi - lo,
+                               offset=segment["header_size"] + lo * dtype.itemsize)
+            if segment["sample_format"] == "int16":
+                data = data.astype(np.float32) / 32768
+            pieces.append(data.astype(np.float32, copy=False))
+        return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+
+    def utterances(self):
+        return [event for event in self.events if event.get("event") == "utterance"]
+
+    def transcripts(self):
+        return [event for event in self.events if event.get("event") == "transcript"]
+
+    def untranscribed(self):
+        """Utterances no transcript or filtered chunk covers, e.g. because the engine died first"""
+        # Older recordings only logged where a transcript ended
+        spans = [(event.get("start_sample", event["end_sample"]), event["end_sample"])
+                 for event in self.events if event.get("event") in ("transcript", "handled")]
+        spans = [(end if start is None else start, end) for start, end in spans]
+        missing = []
+        for utterance in self.utterances():
+            if not any(start <= utterance["end_sample"] and end > utterance["start_sample"] for start, end in spans):
+                missing.append(utterance)
+        return missing
+
+
+def replay(session, engine, speed=0.0, untranscribed=False, block_size=512):
+    """Re-run a recorded session through an engine started with start_pipeline(capture=False)
+
+    With untranscribed=True only the utterances that were never transcribed are
+    fed, each followed by enough silence to end it. Returns True once the
+    pipeline has processed everything.
+    """
+    from benchmark import replay as feed, wait_idle
+
+    if untranscribed:
+        hangover = engine.segmenter.hangover_frames * engine.vad.frame_size
+        gap = np.zeros(hangover + session.sample_rate // 2, dtype=np.float32)
+        pieces = []
+        for utterance in session.untranscribed():
+            pieces += [session.read(utterance["start_sample"], utterance["end_sample"]), gap]
+        audio = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+    else:
+        audio = session.read()
+    feed(engine, audio, speed, block_size)
+    return wait_idle(engine)
+
+
+def main(argv=None):
+    from live_speech_to_text import LiveSpeechToText
+    from backends import BACKENDS
+    from output import create_output, OUTPUT_BACKENDS
+
+    parser = argparse.ArgumentParser(prog="live_speech_to_text.py replay",
+                                     description="Transcribe a recorded session again")
+    parser.add_argument("session", help="Session directory (see --record)")
+    parser.add_argument("--untranscribed", action="store_true",
+                        help="Only utterances that never got transcribed (recovery after a crash)")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Feed speed as a multiple of real time; 0 = as fast as possible (default: 0)")
+    parser.add_argument("--output", default="file", choices=list(OUTPUT_BACKENDS),
+                        help="Where the text goes (default: file)")
+    parser.add_argument("--output-file", default="-", help="File for --output file ('-' for stdout)")
+    parser.add_argument("--backend", default="faster-whisper", choices=list(BACKENDS),
+                        help="Speech recognizer (default: faster-whisper)")
+    parser.add_argument("--profile", default=None, help="Hardware profile: " + ", ".join(profiles.PROFILES))
+    parser.add_argument("--model", default=None, help="Override the profile's model size")
+    parser.add_argument("--beam-size", type=int, default=None, help="Override the profile's beam size")
+    args = parser.parse_args(argv)
+
+    session = RecordedSession(args.session)
+    if not session.segments:
+        print(f"No recorded audio in {args.session}")
+        return 1
+    print(f"Replaying {session.duration:.1f} s of audio from {args.session}")
+
+    profile = profiles.resolve_profile(args.profile, model_size=args.model, beam_size=args.beam_size)
+    engine = LiveSpeechToText(use_grammar_correction=False, profile=profile, hotkeys=False, backend=args.backend,
+                              output=create_output(args.output, args.output_file))
+    while not engine.model_ready.wait(0.1):
+        if engine.model_error and not engine.model_loading:
+            print(f"Could not load the model: {engine.model_error}")
+            engine.shutdown()
+            return 1
+    engine.start_pipeline(capture=False)
+    try:
+        done = replay(session, engine, args.speed, args.untranscribed)
+    finally:
+        engine.shutdown()
+    print("")
+    return 0 if done else 1
@@ -0,0 +1,507 @@
+import argparse
+import bisect
+import collections
+import json
+import os
+import queue
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import profiles
+from backends import ASRBackend, Segment, BACKENDS, create_backend
+from control import encode_message, LineReader
+from pipeline import BoundedQueue, OVERFLOW_POLICIES
+from vad import VoiceActivityDetector, UtteranceSegmenter
+
+# Shared transcription server: several capture clients stream audio to one
+# process that holds the model. Over a Unix domain socket:
+#   client -> server: frames of a 1-byte type and a little-endian uint32 length
+#       "H" hello, JSON: {"name": str, "segmented": bool}
+#       "A" audio: 16 kHz mono s16le PCM
+#       "E" end: flush the current utterance; answered with "done" once it is transcribed
+#   server -> client: newline-delimited JSON
+#       {"event": "ready", "client": name}
+#       {"event": "transcript", "text": str, "confidence": 0..1 or null, "start_sample": n,
+#        "end_sample": n, "queued": seconds waited for the model, "batch": utterances decoded together}
+#       {"event": "done", "utterances": n, "dropped": n, "merged": n}
+#       {"event": "error", "message": str}
+# Sample positions count from the first audio frame of the connection. Clients
+# that segment speech themselves say "segmented": the audio between two "E"
+# frames is then decoded as one utterance without running the server's VAD.
+
+DEFAULT_SERVER_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+                                     "wis-server.sock")
+SAMPLE_RATE = 16000
+MAX_UTTERANCE = 15  # seconds; also caps utterances merged in a full client queue
+FRAME = struct.Struct("<cI")
+HELLO, AUDIO, END = b"H", b"A", b"E"
+MAX_FRAME = 4 * 2 ** 20
+
+Job = collections.namedtuple("Job", "client audio start_sample end_sample queued_at")
+
+
+def send_frame(sock, kind, payload=b""):
+    sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes; None if the peer closed the connection first"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_frame(sock):
+    """Next (type, payload) frame, or (None, None) at the end of the stream"""
+    header = recv_exact(sock, FRAME.size)
+    if header is None:
+        return None, None
+    kind, length = FRAME.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes is too large")
+    payload = recv_exact(sock, length) if length else b""
+    if payload is None:
+        return None, None
+    return kind, payload
+
+
+def encode_audio(audio):
+    """float32 samples as s16le PCM"""
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def merge_jobs(max_samples):
+    """Merge function for a client's job queue: concatenate utterances up to max_samples"""
+    def merge(older, newer):
+        if len(older.audio) + len(newer.audio) > max_samples:
+            return None
+        return Job(newer.client, np.concatenate([older.audio, newer.audio]), older.start_sample,
+                   newer.end_sample, older.queued_at)
+    return merge
+
+
+class ClientConnection:
+    """One capture client: its own VAD state and a bounded queue of utterances"""
+
+    def __init__(self, server, sock, client_id):
+        self.server = server
+        self.sock = sock
+        self.name = f"client-{client_id}"
+        self.segmented = False
+        self.queue = BoundedQueue(self.name, server.max_queue, server.overflow_policy,
+                                  merge_jobs(SAMPLE_RATE * MAX_UTTERANCE))
+        self.segmenter = UtteranceSegmenter(VoiceActivityDetector(SAMPLE_RATE, margin_db=server.vad_margin_db),
+                                            min_silence=server.min_silence, max_utterance=MAX_UTTERANCE)
+        self.pending = []  # Segmented mode: audio of the utterance being received
+        self.position = 0
+        self.utterances = 0
+        self._send_lock = threading.Lock()
+
+    def send(self, message):
+        with self._send_lock:
+            try:
+                self.sock.sendall(encode_message(message))
+            except OSError:
+                pass  # The reader notices the closed connection
+
+    def handle(self):
+        """Read frames until the client disconnects"""
+        while True:
+            kind, payload = recv_frame(self.sock)
+            if kind is None:
+                return
+            if kind == HELLO:
+                hello = json.loads(payload)
+                self.name = hello.get("name") or self.name
+                self.segmented = bool(hello.get("segmented"))
+                self.send({"event": "ready", "client": self.name})
+            elif kind == AUDIO:
+                audio = np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32768
+                self.position += len(audio)
+                if self.segmented:
+                    self.pending.append(audio)
+                    continue
+                for utterance in self.segmenter.push(audio):
+                    self.submit(utterance.audio, utterance.start_sample, utterance.end_sample)
+            elif kind == END:
+                self.flush()
+                # Answer once everything sent so far has been transcribed (or dropped)
+                self.queue.join()
+                self.send({"event": "done", "utterances": self.utterances, "dropped": self.queue.dropped,
+                           "merged": self.queue.merged})
+            else:
+                raise ValueError(f"Unknown frame type {kind!r}")
+
+    def flush(self):
+        if self.segmented:
+            audio = np.concatenate(self.pending) if self.pending else np.zeros(0, dtype=np.float32)
+            self.pending = []
+            if len(audio):
+                self.submit(audio[:SAMPLE_RATE * 30], self.position - len(audio), self.position)
+            return
+        utterance = self.segmenter.flush()
+        if utterance is not None:
+            self.submit(utterance.audio, utterance.start_sample, utterance.end_sample)
+
+    def submit(self, audio, start_sample, end_sample):
+        self.utterances += 1
+        self.queue.put(Job(self, audio, start_sample, end_sample, time.time()))
+        self.server.notify()
+
+
+class TranscriptionServer:
+    """Serves many capture clients from one model (an ASRBackend).
+
+    Each client's utterances wait in their own bounded queue (``max_queue``
+    items, ``overflow_policy`` when full), so one fast talker cannot crowd out
+    the others or grow memory without bound. The scheduler takes one utterance
+    per client in turn, starting after the client served last, and decodes up
+    to ``batch_size`` of them together. When fewer are ready it waits
+    ``batch_window`` seconds for more before decoding. With the ``block``
+    policy a client that gets ahead simply stops being read from.
+    """
+
+    def __init__(self, model, path=DEFAULT_SERVER_SOCKET, batch_size=8, batch_window=0.02, max_queue=4,
+                 overflow_policy="drop-oldest", beam_size=5, language="en", vad_margin_db=10.0,
+                 min_silence=0.5):
+        self.model = model
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.decode_options = dict(language=language, beam_size=beam_size, vad_filter=False)
+        self.vad_margin_db = vad_margin_db
+        self.min_silence = min_silence
+
+        self.batched = None
+        try:
+            from faster_whisper import BatchedInferencePipeline, WhisperModel
+            # Only faster-whisper decodes several utterances in one call
+            if isinstance(getattr(model, "model", None), WhisperModel) and self.batch_size > 1:
+                self.batched = BatchedInferencePipeline(model=model.model)
+        except ImportError:
+            print("BatchedInferencePipeline not available (faster-whisper < 1.1); decoding one at a time")
+
+        self.clients = []
+        self.client_ids = 0
+        self.next_client = 0  # Round-robin start for the next batch
+        self.submitted = 0
+        self.running = False
+        self.threads = []
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+
+        # Statistics
+        self.batches = 0
+        self.decoded = 0
+        self.decode_seconds = 0.0
+        self.decoded_audio_seconds = 0.0
+        self.batch_sizes = collections.Counter()
+
+    def start(self):
+        # Remove a stale socket left by a crashed server
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.listener.listen()
+        self.listener.settimeout(0.5)  # So the accept loop notices close()
+        self.running = True
+        for name, target in (("server-accept", self.accept_worker), ("server-scheduler", self.scheduler_worker)):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def notify(self):
+        with self._work:
+            self.submitted += 1
+            self._work.notify()
+
+    def accept_worker(self):
+        while self.running:
+            try:
+                sock, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.settimeout(None)
+            with self._lock:
+                self.client_ids += 1
+                client = ClientConnection(self, sock, self.client_ids)
+                self.clients.append(client)
+            threading.Thread(target=self.client_worker, args=(client,), name=client.name, daemon=True).start()
+
+    def client_worker(self, client):
+        try:
+            client.handle()
+        except (OSError, ValueError) as e:
+            print(f"{client.name}: {e}")
+            client.send({"event": "error", "message": str(e)})
+        finally:
+            with self._lock:
+                if client in self.clients:
+                    self.clients.remove(client)
+            client.queue.close()
+            client.sock.close()
+
+    def collect(self, limit):
+        """Take up to limit jobs, one per client per round, starting after the client served last"""
+        with self._lock:
+            clients = list(self.clients)
+            start = self.next_client
+        batch = []
+        last = None
+        while len(batch) < limit:
+            taken = False
+            for i in range(len(clients)):
+                if len(batch) >= limit:
+                    break
+                index = (start + i) % len(clients)
+                try:
+                    batch.append(clients[index].queue.get(timeout=0))
+                except queue.Empty:
+                    continue
+                taken = True
+                last = index
+            if not taken:
+                break
+        if last is not None:
+            with self._lock:
+                self.next_client = last + 1
+        return batch
+
+    def next_batch(self, timeout=0.1):
+        with self._work:
+            seen = self.submitted
+        batch = self.collect(self.batch_size)
+        if not batch:
+            with self._work:
+                self._work.wait_for(lambda: self.submitted != seen or not self.running, timeout)
+            batch = self.collect(self.batch_size)
+        if batch and len(batch) < self.batch_size and self.batch_window > 0:
+            # Give utterances from other speakers that are about to end a chance to join
+            time.sleep(self.batch_window)
+            batch += self.collect(self.batch_size - len(batch))
+        return batch
+
+    def scheduler_worker(self):
+        while self.running:
+            batch = self.next_batch()
+            if not batch:
+                continue
+            started = time.time()
+            try:
+                results = self.decode([job.audio for job in batch])
+            except Exception as e:
+                print(f"Error decoding a batch of {len(batch)}: {e}")
+                results = [None] * len(batch)
+            self.batches += 1
+            self.decoded += len(batch)
+            self.decode_seconds += time.time() - started
+            self.decoded_audio_seconds += sum(len(job.audio) for job in batch) / SAMPLE_RATE
+            self.batch_sizes[len(batch)] += 1
+            for job, result in zip(batch, results):
+                if result is not None:
+                    text, confidence = result
+                    job.client.send({"event": "transcript", "text": text, "confidence": confidence,
+                                     "start_sample": int(job.start_sample),
+                                     "end_sample": int(job.end_sample),
+                                     "queued": round(started - job.queued_at, 4), "batch": len(batch)})
+                job.client.queue.task_done()
+
+    def decode(self, audios):
+        """Transcribe several utterances; returns (text, confidence) per utterance"""
+        if self.batched is None or len(audios) == 1:
+            return [summarize_segments(self.model.transcribe(audio, **self.decode_options)) for audio in audios]
+
+        # One batched call over the concatenated utterances, each one its own clip
+        offsets = np.cumsum([0] + [len(audio) for audio in audios]) / SAMPLE_RATE
+        clips = [{"start": float(offsets[i]), "end": float(offsets[i + 1])} for i in range(len(audios))]
+        segments, info = self.batched.transcribe(np.concatenate(audios), clip_timestamps=clips,
+                                                 batch_size=len(audios), without_timestamps=True,
+                                                 **self.decode_options)
+        starts = [clip["start"] for clip in clips]
+        parts = [[] for _ in audios]
+        for segment in segments:
+            confidence = float(np.exp(segment.avg_logprob)) * (1.0 - segment.no_speech_prob)
+            parts[max(0, bisect.bisect_right(starts, segment.start + 0.001) - 1)].append(
+                Segment(segment.start, segment.end, segment.text, confidence))
+        return [summarize_segments(segments) for segments in parts]
+
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "batches": self.batches,
+            "utterances": self.decoded,
+            "mean_batch": self.decoded / self.batches if self.batches else None,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "rtf": self.decode_seconds / self.decoded_audio_seconds if self.decoded_audio_seconds else None,
+        }
+
+    def close(self):
+        self.running = False
+        with self._work:
+            self._work.notify_all()
+        try:
+            self.listener.close()
+        except (OSError, AttributeError):
+            pass
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.queue.close()
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self.threads:
+            thread.join()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class RemoteBackend(ASRBackend):
+    """Decodes on a shared TranscriptionServer instead of a local model
+
+    Each transcribe call sends one pre-segmented utterance. Decoding options
+    are chosen by the server; word timestamps are not available.
+    """
+
+    name = "remote"
+
+    def __init__(self, path=DEFAULT_SERVER_SOCKET, name=None, timeout=120.0, block_seconds=1.0):
+        self.path = path
+        self.client_name = name or f"engine-{os.getpid()}"
+        self.timeout = timeout
+        self.block_size = int(SAMPLE_RATE * block_seconds)
+        self.sock = None
+        self.reader = LineReader()
+        self.messages = collections.deque()
+        self._lock = threading.Lock()
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+        self.reader = LineReader()
+        self.messages.clear()
+        send_frame(self.sock, HELLO, json.dumps({"name": self.client_name, "segmented": True}).encode("utf-8"))
+        self.expect("ready")
+
+    def expect(self, event):
+        """Read messages up to the next one of the given event; returns the ones before it and it"""
+        received = []
+        while True:
+            while self.messages:
+                message = self.messages.popleft()
+                if message.get("event") == "error":
+                    raise RuntimeError(f"Transcription server: {message.get('message')}")
+                received.append(message)
+                if message.get("event") == event:
+                    return received
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("Transcription server closed the connection")
+            self.messages.extend(self.reader.feed(data))
+
+    def transcribe(self, audio, language="en", word_timestamps=False, **options):
+        audio = np.asarray(audio, dtype=np.float32)
+        duration = len(audio) / SAMPLE_RATE
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    for offset in range(0, len(audio), self.block_size):
+                        send_frame(self.sock, AUDIO, encode_audio(audio[offset:offset + self.block_size]))
+                    send_frame(self.sock, END)
+                    messages = self.expect("done")
+                    break
+                except (OSError, ConnectionError):
+                    # The server was restarted: reconnect once
+                    self.close()
+                    if attempt:
+                        raise
+        return [Segment(0.0, duration, " " + m["text"], m.get("confidence"))
+                for m in messages if m.get("event") == "transcript" and m["text"]]
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+def summarize_segments(segments):
+    """(text, duration-weighted mean confidence) of one utterance's segments"""
+    text = " ".join(segment.text for segment in segments).strip()
+    weighted = [(segment.confidence, max(segment.end - segment.start, 0.01)) for segment in segments
+                if segment.confidence is not None]
+    if not weighted:
+        return text, None
+    return text, round(sum(c * w for c, w in weighted) / sum(w for _, w in weighted), 4)
+
+
+def main(argv=None):
+    import signal
+
+    parser = argparse.ArgumentParser(prog="live_speech_to_text.py serve",
+                                     description="Serve several dictation clients from one shared model")
+    parser.add_argument("--socket", default=DEFAULT_SERVER_SOCKET,
+                        help=f"Unix socket to listen on (default: {DEFAULT_SERVER_SOCKET})")
+    parser.add_argument("--batch-size", type=int, default=8, help="Utterances decoded together at most (default: 8)")
+    parser.add_argument("--batch-window", type=float, default=0.02,
+                        help="Seconds to wait for more utterances before decoding a partial batch (default: 0.02)")
+    parser.add_argument("--max-queue", type=int, default=4,
+                        help="Utterances waiting per client before the overflow policy applies (default: 4)")
+    parser.add_argument("--overflow-policy", default="drop-oldest", choices=OVERFLOW_POLICIES,
+                        help="What to do with a full client queue (default: drop-oldest)")
+    parser.add_argument("--vad-margin", type=float, default=10.0)
+    parser.add_argument("--min-silence", type=float, default=0.5)
+    parser.add_argument("--language", default="en", help="Spoken language (default: en)")
+    parser.add_argument("--backend", default="faster-whisper", choices=list(BACKENDS),
+                        help="Speech recognizer (default: faster-whisper; only it batches utterances)")
+    parser.add_argument("--profile", default=None, help="Hardware profile: " + ", ".join(profiles.PROFILES))
+    parser.add_argument("--model", default=None, help="Override the profile's model size")
+    parser.add_argument("--device", default=None, choices=["cpu", "cuda", "auto"],
+                        help="Override the profile's device")
+    parser.add_argument("--compute-type", default=None, help="Override the profile's compute type")
+    parser.add_argument("--beam-size", type=int, default=None, help="Override the profile's beam size")
+    args = parser.parse_args(argv)
+
+    profile = profiles.resolve_profile(args.profile, model_size=args.model, device=args.device,
+                                       compute_type=args.compute_type, beam_size=args.beam_size)
+    print(f"Loading {args.backend} model: {profile['model_size']} on {profile['device']} "
+          f"({profile['compute_type']})")
+    model = create_backend(args.backend, profile)
+    server = TranscriptionServer(model, args.socket, batch_size=args.batch_size, batch_window=args.batch_window,
+                                 max_queue=args.max_queue, overflow_policy=args.overflow_policy,
+                                 beam_size=profile["beam_size"], language=args.language,
+                                 vad_margin_db=args.vad_margin, min_silence=args.min_silence)
+    server.start()
+    print(f"Serving on {args.socket}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        while not stop.wait(60):
+            print(f"Stats: {server.stats()}")
+    except KeyboardInterrupt:
+        pass
+    server.close()
+    print(f"Stats: {server.stats()}")
+    return 0
@@ -6,14 +6,38 @@ from gi.repository import AppIndicator3, Gtk, GLib
 import os
 import subprocess
 import signal
-import time
+from control import ControlClient, DEFAULT_SOCKET
+
+STATUS_LABELS = {
+    "loading": "Status: Loading model...",
+    "running": "Status: Running",
+    "paused": "Status: Paused",
+    "idle": "Status: Stopped",
+    "stopped": "Status: Stopping...",
+    "error": "Status: Model failed to load",
+}
+
+MODEL_LABELS = {
+    "resident": "Model: loaded",
+    "loading": "Model: loading...",
+    "unloaded": "Model: unloaded (reloads on start)",
+    "failed": "Model: failed to load (retried on speech)",
+}
+
+# Seconds without speech before the engine frees the model's memory
+IDLE_UNLOAD_SECONDS = 900
+
+# How long "Profile" samples the engine's threads
+PROFILE_SECONDS = 10
 
 class SpeechIndicator:
     def __init__(self):
         self.speech_process = None
         self.is_running = False
-        self.control_file = "/tmp/speech_control.txt"
-        self.status_file = "/tmp/speech_status.txt"
+        self.quitting = False
+        self.control_socket = DEFAULT_SOCKET
+        self.client = None
+        self.watch_id = None
 
         # Create indicator
         self.indicator = AppIndicator3.Indicator.new(
@@ -31,6 +55,16 @@ class SpeechIndicator:
         self.status_item.set_sensitive(False)
         self.menu.append(self.status_item)
 
+        # Latency/backlog summary pushed by the engine
+        self.metrics_item = Gtk.MenuItem(label="Latency: -")
+        self.metrics_item.set_sensitive(False)
+        self.menu.append(self.metrics_item)
+
+        # Model residency in the engine daemon
+        self.model_item = Gtk.MenuItem(label="Model: not running")
+        self.model_item.set_sensitive(False)
+        self.menu.append(self.model_item)
+
         # Separator
         separator = Gtk.SeparatorMenuItem()
         self.menu.append(separator)
@@ -46,6 +80,24 @@ class SpeechIndicator:
         self.stop_item.set_sensitive(False)
         self.menu.append(self.stop_item)
 
+        # Pause/resume button
+        self.pause_item = Gtk.MenuItem(label="Pause")
+        self.pause_item.connect("activate", self.on_pause)
+        self.pause_item.set_sensitive(False)
+        self.menu.append(self.pause_item)
+        self.paused = False
+
+        # Diagnostics: dump the engine's recent events, or profile it first
+        self.trace_item = Gtk.MenuItem(label="Save Trace")
+        self.trace_item.connect("activate", lambda widget: self.send_command("trace"))
+        self.trace_item.set_sensitive(False)
+        self.menu.append(self.trace_item)
+        self.profile_item = Gtk.MenuItem(label=f"Profile for {PROFILE_SECONDS}s")
+        self.profile_item.connect("activate", self.on_profile)
+        self.profile_item.set_sensitive(False)
+        self.menu.append(self.profile_item)
+        self.profiling = False
+
         # Separator
         separator2 = Gtk.SeparatorMenuItem()
         self.menu.append(separator2)
@@ -58,29 +110,120 @@ class SpeechIndicator:
         self.menu.show_all()
         self.indicator.set_menu(self.menu)
 
-        # Initialize control file
-        self.write_control("stopped")
-
         # Auto-start speech recognition
         GLib.timeout_add(500, self.auto_start)
 
-    def write_control(self, command):
-        """Write control command to file"""
-        try:
-            with open(self.control_file, 'w') as f:
-                f.write(command)
-        except Exception as e:
-            print(f"Error writing control file: {e}")
-
-    def read_status(self):
-        """Read status from file"""
+    def send_command(self, command, **fields):
+        """Push a command to the engine over the control socket"""
+        if self.client and self.client.send(command, **fields):
+            return True
+        print(f"Could not send '{command}': not connected to the speech engine")
+        return False
+
+    def connect_control(self):
+        """Try to connect to the engine's control socket (retried until it is up)"""
+        if not self.is_running or self.client:
+            return False
+        if self.speech_process and self.speech_process.poll() is not None:
+            return False  # Engine died before it came up
         try:
-            if os.path.exists(self.status_file):
-                with open(self.status_file, 'r') as f:
-                    return f.read().strip()
-        except Exception as e:
-            print(f"Error reading status file: {e}")
-        return "unknown"
+            self.client = ControlClient(self.control_socket)
+        except OSError:
+            return True  # Not listening yet; try again
+        # Watch the socket from the GLib main loop instead of polling
+        self.watch_id = GLib.io_add_watch(self.client.fileno(), GLib.PRIORITY_DEFAULT,
+                                          GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                                          self.on_control_event)
+        return False
+
+    def on_control_event(self, fd, condition):
+        """Handle messages pushed by the engine"""
+        messages, connected = self.client.receive()
+        for message in messages:
+            if message.get("event") == "status":
+                self.update_status(message.get("status"), message.get("quality"), message.get("error"))
+                self.update_model(message.get("model"), message.get("load_time"))
+            elif message.get("event") == "metrics":
+                self.update_metrics(message)
+            elif message.get("event") == "trace":
+                self.update_trace(message)
+        if not connected:
+            self.disconnect_control()
+            return False
+        return True
+
+    def disconnect_control(self):
+        """Forget the control connection"""
+        self.trace_item.set_sensitive(False)
+        self.profiling = False
+        self.profile_item.set_label(f"Profile for {PROFILE_SECONDS}s")
+        self.profile_item.set_sensitive(False)
+        if self.watch_id is not None:
+            GLib.source_remove(self.watch_id)
+            self.watch_id = None
+        if self.client:
+            self.client.close()
+            self.client = None
+
+    def update_status(self, status, quality=None, error=None):
+        """Reflect an engine status change in the menu"""
+        label = STATUS_LABELS.get(status, f"Status: {status}")
+        if status == "running" and quality and quality != "full":
+            # Decoding was scaled down to keep up
+            label += f" ({quality} quality)"
+        elif status == "error" and error:
+            print(f"Speech engine: model failed to load: {error}")
+            label += f": {error[:60]}"
+        self.status_item.set_label(label)
+        # The engine stays up while capture is stopped ("idle"); Start/Stop toggle capture
+        capturing = status in ("loading", "running", "paused", "error")
+        self.start_item.set_sensitive(status == "idle")
+        self.stop_item.set_sensitive(capturing)
+        self.paused = status == "paused"
+        self.pause_item.set_label("Resume" if self.paused else "Pause")
+        self.pause_item.set_sensitive(status in ("running", "paused"))
+        self.trace_item.set_sensitive(True)
+        self.profile_item.set_sensitive(not self.profiling)
+        if status == "running":
+            self.indicator.set_icon("microphone-sensitivity-high")
+        elif status in ("paused", "loading", "error"):
+            self.indicator.set_icon("microphone-sensitivity-low")
+        elif status == "idle":
+            self.indicator.set_icon("microphone-sensitivity-medium")
+
+    def update_model(self, model, load_time):
+        """Show whether the model is resident and how long it took to load"""
+        if model is None:
+            return
+        label = MODEL_LABELS.get(model, f"Model: {model}")
+        if model == "resident" and load_time is not None:
+            label += f" in {load_time:.1f}s"
+        self.model_item.set_label(label)
+
+    def update_metrics(self, metrics):
+        """Show the engine's latest latency, backlog and real-time factor"""
+        latency, rtf = metrics.get("latency"), metrics.get("rtf")
+        parts = [f"Latency: {latency:.2f}s" if latency is not None else "Latency: -",
+                 f"Backlog: {metrics.get('backlog', 0)}"]
+        if rtf is not None:
+            parts.append(f"RTF: {rtf:.2f}")
+        self.metrics_item.set_label("  ".join(parts))
+
+    def on_profile(self, widget):
+        if self.send_command("profile", seconds=PROFILE_SECONDS):
+            self.profiling = True
+            self.profile_item.set_label("Profiling...")
+            self.profile_item.set_sensitive(False)
+
+    def update_trace(self, message):
+        """A trace file was written; show where"""
+        name = os.path.basename(message.get("path", ""))
+        print(f"Engine trace written to {message.get('path')}")
+        self.trace_item.set_label(f"Save Trace (last: {name})")
+        if message.get("reason") == "profile":
+            self.profiling = False
+            self.profile_item.set_label(f"Profile for {PROFILE_SECONDS}s")
+            self.profile_item.set_sensitive(True)
 
     def auto_start(self):
         """Auto-start speech recognition on launch"""
@@ -88,80 +231,120 @@ class SpeechIndicator:
         return False  # Don't repeat the timeout
 
     def on_start(self, widget):
-        """Start the speech recognition service"""
-        if not self.is_running:
-            try:
-                # Start the speech service in background
-                speech_script = "/home/yousef/wis/live_speech_to_text.py"
-
-                # Open log file for subprocess output
-                log_file = open("/tmp/live_speech_to_text.log", "w")
-
-                self.speech_process = subprocess.Popen(
-                    ["python3", speech_script, "false", self.control_file],
-                    stdout=log_file,
-                    stderr=subprocess.STDOUT,
-                    start_new_session=True
-                )
-
-                self.is_running = True
-                self.write_control("running")
-
-                # Update UI
-                self.status_item.set_label("Status: Running")
+        """Start capture; the engine daemon is launched if it is not running yet"""
+        if self.is_running:
+            # The daemon keeps the model warm: only the microphone is opened again
+            if self.send_command("start"):
+                self.status_item.set_label("Status: Starting...")
                 self.start_item.set_sensitive(False)
-                self.stop_item.set_sensitive(True)
-                self.indicator.set_icon("microphone-sensitivity-high")
+            return
+        try:
+            # Start the speech service in background
+            speech_script = "/home/yousef/wis/live_speech_to_text.py"
 
-                print("Speech recognition started")
-            except Exception as e:
-                print(f"Error starting speech recognition: {e}")
-                self.is_running = False
+            # Open log file for subprocess output
+            log_file = open("/tmp/live_speech_to_text.log", "w")
 
-    def on_stop(self, widget):
-        """Stop the speech recognition service"""
-        if self.is_running and self.speech_process:
-            try:
-                # Send termination signal
-                self.write_control("stopped")
+            self.speech_process = subprocess.Popen(
+                ["python3", speech_script, "false", "--control-socket", self.control_socket,
+                 "--daemon", "--idle-unload", str(IDLE_UNLOAD_SECONDS)],
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+            GLib.child_watch_add(GLib.PRIORITY_DEFAULT, self.speech_process.pid, self.on_process_exit)
 
-                # Kill the process group
-                os.killpg(os.getpgid(self.speech_process.pid), signal.SIGTERM)
+            self.is_running = True
 
-                # Wait for process to terminate
-                time.sleep(0.5)
+            # Connect to the control socket as soon as the engine listens
+            GLib.timeout_add(200, self.connect_control)
 
-                if self.speech_process.poll() is None:
-                    # Force kill if still running
-                    os.killpg(os.getpgid(self.speech_process.pid), signal.SIGKILL)
+            # Update UI
+            self.status_item.set_label("Status: Starting...")
+            self.start_item.set_sensitive(False)
+            self.stop_item.set_sensitive(True)
+            self.indicator.set_icon("microphone-sensitivity-low")
 
-                self.speech_process = None
-                self.is_running = False
+            print("Speech recognition started")
+        except Exception as e:
+            print(f"Error starting speech recognition: {e}")
+            self.is_running = False
 
-                # Update UI
-                self.status_item.set_label("Status: Stopped")
-                self.start_item.set_sensitive(True)
-                self.stop_item.set_sensitive(False)
-                self.indicator.set_icon("microphone-sensitivity-medium")
+    def on_pause(self, widget):
+        """Pause or resume transcription without stopping the engine"""
+        self.send_command("resume" if self.paused else "pause")
 
-                print("Speech recognition stopped")
-            except Exception as e:
-                print(f"Error stopping speech recognition: {e}")
+    def on_stop(self, widget):
+        """Stop capture; the engine keeps the model loaded for the next Start"""
+        if self.is_running and self.speech_process:
+            self.stop_item.set_sensitive(False)
+            self.pause_item.set_sensitive(False)
+            if not self.send_command("stop"):
+                # Not connected: the engine can't be told to idle, so shut it down instead
+                self.shutdown_engine()
+
+    def shutdown_engine(self):
+        """Ask the engine process to exit; it shuts down gracefully"""
+        self.status_item.set_label("Status: Stopping...")
+        self.start_item.set_sensitive(False)
+        self.stop_item.set_sensitive(False)
+        self.pause_item.set_sensitive(False)
+        if not self.send_command("shutdown"):
+            # No control connection: fall back to SIGTERM (also handled gracefully)
+            self.terminate_process(signal.SIGTERM)
+        # Escalate only if the engine does not exit in time
+        GLib.timeout_add_seconds(10, self.on_stop_timeout, self.speech_process)
+
+    def terminate_process(self, sig):
+        """Signal the engine's process group"""
+        try:
+            os.killpg(os.getpgid(self.speech_process.pid), sig)
+        except (ProcessLookupError, AttributeError):
+            pass
+        except Exception as e:
+            print(f"Error stopping speech recognition: {e}")
+
+    def on_stop_timeout(self, process):
+        """The engine did not stop on request: SIGTERM, then SIGKILL"""
+        if process is not self.speech_process:
+            return False  # Already exited
+        print("Speech recognition did not stop in time; terminating")
+        self.terminate_process(signal.SIGTERM)
+        GLib.timeout_add_seconds(5, self.on_kill_timeout, process)
+        return False
+
+    def on_kill_timeout(self, process):
+        if process is self.speech_process:
+            self.terminate_process(signal.SIGKILL)
+        return False
+
+    def on_process_exit(self, pid, status):
+        """The engine process exited (on request or on its own)"""
+        self.disconnect_control()
+        self.speech_process = None
+        self.is_running = False
+
+        # Update UI
+        self.status_item.set_label("Status: Stopped")
+        self.start_item.set_sensitive(True)
+        self.stop_item.set_sensitive(False)
+        self.pause_item.set_sensitive(False)
+        self.pause_item.set_label("Pause")
+        self.metrics_item.set_label("Latency: -")
+        self.model_item.set_label("Model: not running")
+        self.indicator.set_icon("microphone-sensitivity-medium")
+
+        print("Speech recognition stopped")
+        if self.quitting:
+            Gtk.main_quit()
 
     def on_quit(self, widget):
         """Quit the application"""
-        # Stop speech recognition if running
+        # Shut the engine down if running; quit once it has exited
         if self.is_running:
-            self.on_stop(None)
-
-        # Clean up control files
-        try:
-            if os.path.exists(self.control_file):
-                os.remove(self.control_file)
-            if os.path.exists(self.status_file):
-                os.remove(self.status_file)
-        except:
-            pass
+            self.quitting = True
+            self.shutdown_engine()
+            return
 
         Gtk.main_quit()
 
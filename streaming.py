@@ -0,0 +1,112 @@
+import re
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w']+")
+
+
+def normalize_word(text):
+    """Normalize a word for hypothesis comparison (case and punctuation insensitive)"""
+    return _NON_WORD.sub("", text.lower())
+
+
+class StreamingTranscriber:
+    """Incremental transcription over a growing window with local-agreement commits.
+
+    Audio is appended with ``insert_audio`` and the whole uncommitted window is
+    re-decoded by ``process_iter``. Only the word prefix on which two
+    consecutive hypotheses agree is committed; the audio up to the end of the
+    last committed word is then trimmed, so the window never contains text
+    that has already been typed and words at the edges are never cut in half.
+
+    ``transcribe_words(audio, initial_prompt)`` must return a list of
+    ``(start, end, text)`` tuples with times in seconds relative to ``audio``.
+    """
+
+    def __init__(self, transcribe_words, sample_rate=16000, max_window=15.0, prompt_chars=200):
+        self.transcribe_words = transcribe_words
+        self.sample_rate = sample_rate
+        self.prompt_chars = prompt_chars
+
+        # Preallocated window; trimmed in place after every commit
+        self.max_window_samples = int(max_window * sample_rate)
+        self.audio = np.zeros(self.max_window_samples, dtype=np.float32)
+        self.length = 0
+        self.decoded_length = 0  # Window length at the last decode
+
+        self.previous = []  # Uncommitted tail of the last hypothesis
+        self.committed_text = ""  # Recent committed text, used as decoder prompt
+
+    def insert_audio(self, samples):
+        """Append new audio to the window"""
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        free = self.max_window_samples - self.length
+        if len(samples) > free:
+            # Window is full and nothing could be committed: drop the oldest audio
+            drop = min(len(samples) - free, self.length)
+            self._trim_samples(drop)
+            samples = samples[-self.max_window_samples:]
+        self.audio[self.length:self.length + len(samples)] = samples
+        self.length += len(samples)
+
+    def process_iter(self):
+        """Re-decode the window and return newly committed text ('' if nothing is stable yet)"""
+        if self.length == 0:
+            return ""
+
+        words = self._decode()
+        n = self._agreed_prefix(self.previous, words)
+
+        # A window close to full must make progress even without agreement
+        if n == 0 and self.length >= 0.8 * self.max_window_samples:
+            n = max(len(words) - 1, 0)
+
+        committed = words[:n]
+        self.previous = words[n:]
+        if committed:
+            self._trim_samples(int(committed[-1][1] * self.sample_rate))
+        return self._commit(committed)
+
+    def finish(self):
+        """Commit everything still pending (end of utterance) and reset the window"""
+        if self.length > self.decoded_length:
+            words = self._decode()
+        else:
+            words = self.previous
+        text = self._commit(words)
+        self.reset()
+        return text
+
+    def reset(self):
+        """Drop the window and any uncommitted hypothesis"""
+        self.length = 0
+        self.decoded_length = 0
+        self.previous = []
+
+    def _decode(self):
+        self.decoded_length = self.length
+        prompt = self.committed_text[-self.prompt_chars:] or None
+        return list(self.transcribe_words(self.audio[:self.length], prompt))
+
+    @staticmethod
+    def _agreed_prefix(previous, current):
+        n = 0
+        for (_, _, old), (_, _, new) in zip(previous, current):
+            if normalize_word(old) != normalize_word(new):
+                break
+            n += 1
+        return n
+
+    def _trim_samples(self, n):
+        n = max(0, min(n, self.length))
+        if n == 0:
+            return
+        remaining = self.length - n
+        self.audio[:remaining] = self.audio[n:self.length]
+        self.length = remaining
+        self.decoded_length = max(0, self.decoded_length - n)
+
+    def _commit(self, words):
+        text = "".join(word for _, _, word in words).strip()
+        if text:
+            self.committed_text = (self.committed_text + " " + text)[-self.prompt_chars:]
+        return text
@@ -0,0 +1,194 @@
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+# Traces are written in the Chrome trace event format (JSON object form), which
+# chrome://tracing, https://ui.perfetto.dev and speedscope open directly.
+# Timestamps are microseconds on the perf_counter clock; "otherData" maps them
+# to wall-clock time.
+
+DEFAULT_DIRECTORY = os.path.expanduser("~/.local/share/wis/traces")
+
+
+def now_us():
+    return time.perf_counter_ns() // 1000
+
+
+class _Span:
+    def __init__(self, ring, name, args):
+        self.ring = ring
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = now_us()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.ring is not None:
+            self.ring.append((self.start, now_us() - self.start, self.name, self.args))
+
+
+class FlightRecorder:
+    """Always-on ring of the most recent timestamped events of every thread
+
+    Each thread appends to its own bounded deque, so recording takes no lock
+    and costs about a microsecond; old events fall off the end. ``span`` times
+    a block (a complete event), ``instant`` marks a point in time. ``events``
+    snapshots every ring as trace events, e.g. after a latency spike.
+    """
+
+    def __init__(self, capacity=4096, max_threads=64):
+        self.capacity = capacity
+        self.max_threads = max_threads
+        self.enabled = True
+        self.rings = {}  # thread ident -> (thread name, native id, ring)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _ring(self):
+        try:
+            return self._local.ring
+        except AttributeError:
+            pass
+        thread = threading.current_thread()
+        ring = collections.deque(maxlen=self.capacity)
+        with self._lock:
+            if len(self.rings) >= self.max_threads:
+                # Forget threads that have exited (e.g. server clients) before growing further
+                alive = {t.ident for t in threading.enumerate()}
+                self.rings = {ident: entry for ident, entry in self.rings.items() if ident in alive}
+            self.rings[thread.ident] = (thread.name, getattr(thread, "native_id", None), ring)
+        self._local.ring = ring
+        return ring
+
+    def span(self, name, **args):
+        """Context manager recording how long the block took"""
+        return _Span(self._ring() if self.enabled else None, name, args or None)
+
+    def instant(self, name, **args):
+        if self.enabled:
+            self._ring().append((now_us(), None, name, args or None))
+
+    def events(self, pid=None):
+        """Trace events for everything still in the rings, oldest first per thread"""
+        pid = pid or os.getpid()
+        with self._lock:
+            rings = list(self.rings.items())
+        events = []
+        for ident, (name, native_id, ring) in rings:
+            tid = native_id or ident
+            events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": name}})
+            for start, duration, event_name, args in list(ring):
+                event = {"name": event_name, "ts": start, "pid": pid, "tid": tid, "cat": "pipeline"}
+                if duration is None:
+                    event.update(ph="i", s="t")
+                else:
+                    event.update(ph="X", dur=duration)
+                if args:
+                    event["args"] = args
+                events.append(event)
+        return events
+
+
+class SamplingProfiler:
+    """Samples the Python stack of every thread at a fixed interval, on demand
+
+    The samples become nested begin/end events per thread, i.e. a flame chart
+    alongside the flight recorder's events. How late each sample is taken is
+    recorded as well: the sampler needs the GIL to run, so a growing lag
+    shows threads contending for it.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+
+    def run(self, seconds, stop=None):
+        """Sample for `seconds` (or until the stop Event is set); returns the trace events"""
+        me = threading.get_ident()
+        samples = []
+        lags = []
+        next_at = time.perf_counter()
+        end = next_at + seconds
+        while time.perf_counter() < end and not (stop and stop.is_set()):
+            next_at += self.interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            taken = now_us()
+            lags.append((taken, max(0.0, time.perf_counter() - next_at)))
+            stacks = {}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stacks[ident] = tuple(reversed(stack))
+            samples.append((taken, stacks))
+            if len(samples) % 100 == 0:
+                next_at = max(next_at, time.perf_counter())  # Do not try to catch up after a long stall
+        return self.to_events(samples, lags)
+
+    @staticmethod
+    def to_events(samples, lags, pid=None):
+        pid = pid or os.getpid()
+        threads = {t.ident: t for t in threading.enumerate()}
+        open_stacks = {}  # ident -> frames currently open
+        events = []
+
+        def tid(ident):
+            return getattr(threads.get(ident), "native_id", None) or ident
+
+        def close(ident, frames, ts):
+            for code in reversed(frames):
+                events.append({"ph": "E", "name": code[0], "ts": ts, "pid": pid, "tid": tid(ident), "cat": "profile"})
+
+        for ts, stacks in samples:
+            for ident in set(open_stacks) | set(stacks):
+                previous = open_stacks.get(ident, ())
+                current = stacks.get(ident, ())
+                common = 0
+                while common < min(len(previous), len(current)) and previous[common] == current[common]:
+                    common += 1
+                close(ident, previous[common:], ts)
+                for name, filename, line in current[common:]:
+                    events.append({"ph": "B", "name": name, "ts": ts, "pid": pid, "tid": tid(ident), "cat": "profile",
+                                   "args": {"file": f"{os.path.basename(filename)}:{line}"}})
+                open_stacks[ident] = current
+        if samples:
+            end = samples[-1][0]
+            for ident, frames in open_stacks.items():
+                close(ident, frames, end)
+        for ts, lag in lags:
+            events.append({"ph": "C", "name": "sampler lag (ms)", "ts": ts, "pid": pid,
+                           "args": {"lag": round(lag * 1000, 3)}})
+        return events
+
+
+def write_trace(path, events, **metadata):
+    """Write trace events to a JSON file; returns the path"""
+    metadata.setdefault("wall_clock", time.time())
+    metadata.setdefault("clock_us", now_us())  # Same instant as wall_clock, on the events' clock
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": metadata}, f)
+    return path
+
+
+def trace_path(directory, kind):
+    """A new timestamped file name in directory"""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(directory, f"{kind}-{stamp}-{int(time.time() * 1000) % 1000:03d}.json")
+
+
+# The process-wide recorder the pipeline modules write to
+RECORDER = FlightRecorder()
+span = RECORDER.span
+instant = RECORDER.instant
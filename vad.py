@@ -0,0 +1,202 @@
+import collections
+import numpy as np
+
+# A finished utterance; end_sample is the absolute stream position where speech ended
+Utterance = collections.namedtuple("Utterance", "audio end_sample start_sample", defaults=(None,))
+
+
+class VoiceActivityDetector:
+    """Frame-level energy VAD with an adaptive noise floor.
+
+    Frame energies are computed for a whole block at once; only the cheap
+    per-frame floor update runs in Python. A frame is speech when its level
+    is ``margin_db`` above the tracked noise floor (and above ``min_level_db``).
+    """
+
+    def __init__(self, sample_rate=16000, frame_duration=0.03, margin_db=10.0,
+                 min_level_db=-55.0, initial_floor_db=-50.0):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_duration)
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+
+        self.noise_floor_db = initial_floor_db
+        self.floor_attack = 0.3   # Fast tracking when the level drops below the floor
+        self.floor_release = 0.02  # Slow tracking towards non-speech levels above it
+        self.floor_drift_db = 0.01  # Per-frame upward drift so a stuck floor recovers in loud rooms
+
+    def frame_levels(self, frames):
+        """Level in dBFS of every row of a (n_frames, frame_size) array"""
+        energy = np.einsum("ij,ij->i", frames, frames) / frames.shape[1]
+        return 10.0 * np.log10(energy + 1e-10)
+
+    def classify(self, frames):
+        """Return a boolean speech mask for a (n_frames, frame_size) array"""
+        levels = self.frame_levels(frames)
+        mask = np.zeros(len(levels), dtype=bool)
+        floor = self.noise_floor_db
+        for i, level in enumerate(levels):
+            is_speech = level > max(floor + self.margin_db, self.min_level_db)
+            if level < floor:
+                floor += self.floor_attack * (level - floor)
+            elif not is_speech:
+                floor += self.floor_release * (level - floor)
+            else:
+                floor += self.floor_drift_db
+            mask[i] = is_speech
+        self.noise_floor_db = floor
+        return mask
+
+
+class UtteranceSegmenter:
+    """Cut a continuous stream into utterances at natural pauses.
+
+    Audio is pushed in arbitrary blocks; non-speech outside utterances is
+    dropped (except ``pre_padding`` before an onset and ``post_padding`` after
+    the end). An utterance ends as soon as ``min_silence`` seconds of
+    non-speech follow it, or when it reaches ``max_utterance`` seconds.
+    Utterances with less than ``min_speech`` seconds of speech are discarded.
+
+    ``position`` tracks the absolute stream sample index of the next pushed
+    sample; call ``seek`` after a gap in the stream (e.g. a pause).
+    """
+
+    def __init__(self, vad, pre_padding=0.2, post_padding=0.15, min_silence=0.5,
+                 min_speech=0.25, max_utterance=15.0):
+        self.vad = vad
+        self.frame_size = vad.frame_size
+        frame_duration = self.frame_size / vad.sample_rate
+        self.pre_frames = int(round(pre_padding / frame_duration))
+        self.post_frames = int(round(post_padding / frame_duration))
+        self.hangover_frames = max(1, int(round(min_silence / frame_duration)))
+        self.min_speech_frames = int(round(min_speech / frame_duration))
+
+        # Preallocated storage: the utterance itself, the pre-roll and a partial frame
+        self.max_samples = int(max_utterance * vad.sample_rate)
+        self.utterance = np.zeros(self.max_samples, dtype=np.float32)
+        self.preroll = np.zeros((max(self.pre_frames, 1), self.frame_size), dtype=np.float32)
+        self.remainder = np.zeros(self.frame_size, dtype=np.float32)
+        self.remainder_length = 0
+
+        self.dropped_frames = 0  # Non-speech frames that never reached the model
+        self.discarded_utterances = 0  # Utterances too short to be speech
+        self.position = 0  # Absolute index of the next pushed sample
+        self.processed = 0  # Absolute index just past the last classified frame
+        self.reset()
+
+    def seek(self, position):
+        """Continue at a new absolute stream position after a gap (drops a partial frame)"""
+        self.remainder_length = 0
+        self.position = self.processed = position
+
+    def reset(self):
+        """Forget any in-progress utterance"""
+        self.active = False
+        self.length = 0
+        self.speech_frames = 0
+        self.silence_frames = 0
+        self.preroll_count = 0
+        self.remainder_length = 0
+
+    def current(self):
+        """View of the in-progress utterance (empty when idle)"""
+        return self.utterance[:self.length]
+
+    def push(self, samples):
+        """Feed audio; returns a list of finished Utterances"""
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        finished = []
+        self.position += len(samples)
+
+        # Complete the partial frame left over from the previous block
+        if self.remainder_length:
+            take = min(self.frame_size - self.remainder_length, len(samples))
+            self.remainder[self.remainder_length:self.remainder_length + take] = samples[:take]
+            self.remainder_length += take
+            samples = samples[take:]
+            if self.remainder_length < self.frame_size:
+                return finished
+            self._process_frames(self.remainder[np.newaxis, :], finished)
+            self.remainder_length = 0
+
+        n_frames = len(samples) // self.frame_size
+        if n_frames:
+            frames = samples[:n_frames * self.frame_size].reshape(n_frames, self.frame_size)
+            self._process_frames(frames, finished)
+
+        leftover = samples[n_frames * self.frame_size:]
+        self.remainder[:len(leftover)] = leftover
+        self.remainder_length = len(leftover)
+        return finished
+
+    def flush(self):
+        """End the in-progress utterance now; returns it as an Utterance (or None)"""
+        finished = []
+        if self.active:
+            self._end_utterance(finished)
+        return finished[0] if finished else None
+
+    def _process_frames(self, frames, finished):
+        mask = self.vad.classify(frames)
+        for frame, is_speech in zip(frames, mask):
+            self.processed += self.frame_size
+            if not self.active:
+                if is_speech:
+                    self._start_utterance()
+                else:
+                    self._remember_preroll(frame)
+                    self.dropped_frames += 1
+                    continue
+
+            self._append(frame)
+            if is_speech:
+                self.speech_frames += 1
+                self.silence_frames = 0
+            else:
+                self.silence_frames += 1
+
+            if self.silence_frames >= self.hangover_frames:
+                self._end_utterance(finished)
+            elif self.length + self.frame_size > self.max_samples:
+                # Too long: cut here and keep going as a new utterance
+                self._end_utterance(finished)
+                if is_speech:
+                    self._start_utterance()
+
+    def _remember_preroll(self, frame):
+        if not self.pre_frames:
+            return
+        if self.preroll_count == self.pre_frames:
+            self.preroll[:-1] = self.preroll[1:]
+            self.preroll_count -= 1
+        self.preroll[self.preroll_count] = frame
+        self.preroll_count += 1
+
+    def _start_utterance(self):
+        self.active = True
+        self.length = 0
+        self.speech_frames = 0
+        self.silence_frames = 0
+        for i in range(self.preroll_count):
+            self._append(self.preroll[i])
+        self.preroll_count = 0
+
+    def _append(self, frame):
+        self.utterance[self.length:self.length + self.frame_size] = frame
+        self.length += self.frame_size
+
+    def _end_utterance(self, finished):
+        # Keep only post_padding worth of the trailing silence
+        trailing = max(0, self.silence_frames - self.post_frames)
+        self.dropped_frames += trailing
+        self.length -= trailing * self.frame_size
+        if self.speech_frames >= self.min_speech_frames:
+            end_sample = self.processed - self.silence_frames * self.frame_size
+            start_sample = self.processed - trailing * self.frame_size - self.length
+            finished.append(Utterance(self.utterance[:self.length].copy(), end_sample, start_sample))
+        else:
+            self.discarded_utterances += 1
+        self.active = False
+        self.length = 0
+        self.speech_frames = 0
+        self.silence_frames = 0